@@ -6,6 +6,7 @@ from panda3d.core import *
 from panda3d.core import Loader as PandaLoader
 from direct.showbase.DirectObject import DirectObject
 from direct.directnotify import DirectNotifyGlobal
+import sys
 
 
 class Actor(DirectObject, NodePath):
@@ -23,8 +24,11 @@ class Actor(DirectObject, NodePath):
                                        LoaderOptions.LFReportErrors |
                                        LoaderOptions.LFConvertAnim)
 
+    asyncLoadIndex = 0
+
     validateSubparts = ConfigVariableBool('validate-subparts', True)
     mergeLODBundles = ConfigVariableBool('merge-lod-bundles', True)
+    shareAnimDefs = ConfigVariableBool('actor-share-anim-defs', False)
     allowAsyncBind = ConfigVariableBool('allow-async-bind', True)
 
     class PartDef:
@@ -59,11 +63,17 @@ class Actor(DirectObject, NodePath):
         have not yet been bound (for these, self.animControl is None).
 
         There is a different AnimDef for each different part or
-        sub-part, times each different animation in the AnimDict. """
+        sub-part, times each different animation in the AnimDict.
+
+        An AnimDef whose shared flag is True belongs to a SharedDict,
+        and may be in use by several Actors; it is never bound, or
+        otherwise modified.  An Actor makes its own copy first. """
+
+        shared = False
 
         def __init__(self, filename = None, animBundle = None):
             self.filename = filename
-            self.animBundle = None
+            self.animBundle = animBundle
             self.animControl = None
 
         def makeCopy(self):
@@ -92,10 +102,51 @@ class Actor(DirectObject, NodePath):
         def __repr__(self):
             return 'Actor.SubpartDef(%s, %s)' % (repr(self.truePartName), repr(self.subset))
 
+    class SharedDict(dict):
+
+        """A dictionary that several Actors copied from the same
+        template share, when shareAnimDefs is in effect, rather than
+        each keeping its own copy.  This is used for the subpart
+        dictionary, and for the dictionaries of AnimDefs.  A SharedDict
+        is never modified: an Actor that needs to change one replaces
+        it with its own plain dictionary first (copy-on-write).  To
+        keep callers of getAnimControlDict() from changing it for every
+        Actor at once, any attempt to modify it raises TypeError. """
+
+        def __readOnly(self, *args, **kw):
+            raise TypeError('Actor.SharedDict is shared between Actors and may not be modified')
+
+        __setitem__ = __delitem__ = __readOnly
+        __ior__ = update = setdefault = __readOnly
+        pop = popitem = clear = __readOnly
+
+        def __reduce__(self):
+            # The default reduction refills the dict item by item.
+            return (self.__class__, (dict(self),))
+
+    class AsyncLoadDef:
+
+        """Instances of this class track a group of model and animation
+        files that are being loaded in the background on behalf of the
+        Actor, and the function to call when all of them have been
+        loaded.  The function receives two dictionaries, mapping each
+        model and each animation filename to the NodePath that was
+        loaded, or None if it could not be loaded. """
+
+        def __init__(self, callback):
+            self.callback = callback
+            self.requests = {}
+            self.models = {}
+            self.anims = {}
+
+        def __repr__(self):
+            return 'Actor.AsyncLoadDef(%s pending)' % (len(self.requests))
+
     def __init__(self, models=None, anims=None, other=None, copy=True,
                  lodNode = None, flattenable = True, setFinal = False,
                  mergeLODBundles = None, allowAsyncBind = None,
-                 okMissing = None):
+                 okMissing = None, callback = None, extraArgs = [],
+                 priority = None, shareAnimDefs = None):
         """__init__(self, string | string:string{}, string:string{} |
         string:(string:string{}){}, Actor=None)
         Actor constructor: can be used to create single or multipart
@@ -151,6 +202,25 @@ class Actor(DirectObject, NodePath):
             #fix bounding volumes - this must be done after drawing
             #the actor for a few frames, otherwise it has no effect
             a.fixBounds()
+
+        If callback is not None, the models and animations are loaded
+        asynchronously, so that creating many Actors does not stall the
+        main thread.  The constructor returns immediately with an empty
+        Actor, which may be parented and positioned as usual.  The
+        model and animation files are loaded in the background, with
+        the indicated priority.  Once they have all been loaded, the
+        parts are set up, all the animations are bound, and then the
+        callback is called with the Actor as its first parameter,
+        followed by extraArgs.  Use isLoading() to check whether it
+        is still loading, and cleanup() to cancel it.
+
+        If shareAnimDefs is True, an Actor copied from another (a
+        template) shares the template's subpart and animation
+        bookkeeping, until either of them changes it, instead of
+        copying all of it.  An animation that is bound gets its own
+        AnimDef, but the ones that are never played cost nothing per
+        Actor.  This is worthwhile for crowds of identical Actors.  It
+        defaults to the actor-share-anim-defs config variable.
         """
         try:
             self.Actor_initialized
@@ -191,6 +261,11 @@ class Actor(DirectObject, NodePath):
         else:
             self.allowAsyncBind = allowAsyncBind
 
+        if shareAnimDefs is None:
+            self.shareAnimDefs = Actor.shareAnimDefs.getValue()
+        else:
+            self.shareAnimDefs = shareAnimDefs
+
         # create data structures
         self.__commonBundleHandles = {}
         self.__partBundleDict = {}
@@ -200,6 +275,16 @@ class Actor(DirectObject, NodePath):
 
         self.__subpartsComplete = False
 
+        # The SharedDicts that have been made of this Actor's AnimDef
+        # dictionaries, keyed by (lodName, partName).  They are kept
+        # until the dictionary is next modified.
+        self.__sharedAnimDicts = {}
+
+        # The background load requests in progress, mapped to their
+        # AsyncLoadDefs, and the event that signals each one is done.
+        self.__asyncLoads = {}
+        self.__asyncHook = None
+
         self.__LODNode = None
         self.__LODAnimation = None
         self.__LODCenter = Point3(0, 0, 0)
@@ -229,88 +314,12 @@ class Actor(DirectObject, NodePath):
 
             self.__hasLOD = 0
 
-            # load models
-            #
-            # four cases:
-            #
-            #   models, anims{} = single part actor
-            #   models{}, anims{} =  single part actor w/ LOD
-            #   models{}, anims{}{} = multi-part actor
-            #   models{}{}, anims{}{} = multi-part actor w/ LOD
-            #
-            # make sure we have models
-            if models:
-                # do we have a dictionary of models?
-                if type(models) == dict:
-                    # if this is a dictionary of dictionaries
-                    if type(models[next(iter(models))]) == dict:
-                        # then it must be a multipart actor w/LOD
-                        self.setLODNode(node = lodNode)
-                        # preserve numerical order for lod's
-                        # this will make it easier to set ranges
-                        sortedKeys = list(models.keys())
-                        sortedKeys.sort()
-                        for lodName in sortedKeys:
-                            # make a node under the LOD switch
-                            # for each lod (just because!)
-                            self.addLOD(str(lodName))
-                            # iterate over both dicts
-                            for modelName in models[lodName]:
-                                self.loadModel(models[lodName][modelName],
-                                               modelName, lodName, copy = copy,
-                                               okMissing = okMissing)
-                    # then if there is a dictionary of dictionaries of anims
-                    elif type(anims[next(iter(anims))]) == dict:
-                        # then this is a multipart actor w/o LOD
-                        for partName in models:
-                            # pass in each part
-                            self.loadModel(models[partName], partName,
-                                           copy = copy, okMissing = okMissing)
-                    else:
-                        # it is a single part actor w/LOD
-                        self.setLODNode(node = lodNode)
-                        # preserve order of LOD's
-                        sortedKeys = list(models.keys())
-                        sortedKeys.sort()
-                        for lodName in sortedKeys:
-                            self.addLOD(str(lodName))
-                            # pass in dictionary of parts
-                            self.loadModel(models[lodName], lodName=lodName,
-                                           copy = copy, okMissing = okMissing)
-                else:
-                    # else it is a single part actor
-                    self.loadModel(models, copy = copy, okMissing = okMissing)
-
-            # load anims
-            # make sure the actor has animations
-            if anims:
-                if len(anims) >= 1:
-                    # if so, does it have a dictionary of dictionaries?
-                    if type(anims[next(iter(anims))]) == dict:
-                        # are the models a dict of dicts too?
-                        if type(models) == dict:
-                            if type(models[next(iter(models))]) == dict:
-                                # then we have a multi-part w/ LOD
-                                sortedKeys = list(models.keys())
-                                sortedKeys.sort()
-                                for lodName in sortedKeys:
-                                    # iterate over both dicts
-                                    for partName in anims:
-                                        self.loadAnims(
-                                            anims[partName], partName, lodName)
-                            else:
-                                # then it must be multi-part w/o LOD
-                                for partName in anims:
-                                    self.loadAnims(anims[partName], partName)
-                    elif type(models) == dict:
-                        # then we have single-part w/ LOD
-                        sortedKeys = list(models.keys())
-                        sortedKeys.sort()
-                        for lodName in sortedKeys:
-                            self.loadAnims(anims, lodName=lodName)
-                    else:
-                        # else it is single-part w/o LOD
-                        self.loadAnims(anims)
+            if callback is not None and models:
+                self.__loadAsync(models, anims, copy, lodNode, okMissing,
+                                 callback, extraArgs, priority)
+            else:
+                self.__loadModelsAndAnims(models, anims, copy, lodNode,
+                                          okMissing)
 
         else:
             self.copyActor(other, True) # overwrite everything
@@ -332,6 +341,90 @@ class Actor(DirectObject, NodePath):
             # object or none of it.
             self.__geomNode.node().setFinal(1)
 
+    def __loadModelsAndAnims(self, models, anims, copy, lodNode, okMissing):
+        # load models
+        #
+        # four cases:
+        #
+        #   models, anims{} = single part actor
+        #   models{}, anims{} =  single part actor w/ LOD
+        #   models{}, anims{}{} = multi-part actor
+        #   models{}{}, anims{}{} = multi-part actor w/ LOD
+        #
+        # make sure we have models
+        if models:
+            # do we have a dictionary of models?
+            if type(models) == dict:
+                # if this is a dictionary of dictionaries
+                if type(models[next(iter(models))]) == dict:
+                    # then it must be a multipart actor w/LOD
+                    self.setLODNode(node = lodNode)
+                    # preserve numerical order for lod's
+                    # this will make it easier to set ranges
+                    sortedKeys = list(models.keys())
+                    sortedKeys.sort()
+                    for lodName in sortedKeys:
+                        # make a node under the LOD switch
+                        # for each lod (just because!)
+                        self.addLOD(str(lodName))
+                        # iterate over both dicts
+                        for modelName in models[lodName]:
+                            self.loadModel(models[lodName][modelName],
+                                           modelName, lodName, copy = copy,
+                                           okMissing = okMissing)
+                # then if there is a dictionary of dictionaries of anims
+                elif type(anims[next(iter(anims))]) == dict:
+                    # then this is a multipart actor w/o LOD
+                    for partName in models:
+                        # pass in each part
+                        self.loadModel(models[partName], partName,
+                                       copy = copy, okMissing = okMissing)
+                else:
+                    # it is a single part actor w/LOD
+                    self.setLODNode(node = lodNode)
+                    # preserve order of LOD's
+                    sortedKeys = list(models.keys())
+                    sortedKeys.sort()
+                    for lodName in sortedKeys:
+                        self.addLOD(str(lodName))
+                        # pass in dictionary of parts
+                        self.loadModel(models[lodName], lodName=lodName,
+                                       copy = copy, okMissing = okMissing)
+            else:
+                # else it is a single part actor
+                self.loadModel(models, copy = copy, okMissing = okMissing)
+
+        # load anims
+        # make sure the actor has animations
+        if anims:
+            if len(anims) >= 1:
+                # if so, does it have a dictionary of dictionaries?
+                if type(anims[next(iter(anims))]) == dict:
+                    # are the models a dict of dicts too?
+                    if type(models) == dict:
+                        if type(models[next(iter(models))]) == dict:
+                            # then we have a multi-part w/ LOD
+                            sortedKeys = list(models.keys())
+                            sortedKeys.sort()
+                            for lodName in sortedKeys:
+                                # iterate over both dicts
+                                for partName in anims:
+                                    self.loadAnims(
+                                        anims[partName], partName, lodName)
+                        else:
+                            # then it must be multi-part w/o LOD
+                            for partName in anims:
+                                self.loadAnims(anims[partName], partName)
+                elif type(models) == dict:
+                    # then we have single-part w/ LOD
+                    sortedKeys = list(models.keys())
+                    sortedKeys.sort()
+                    for lodName in sortedKeys:
+                        self.loadAnims(anims, lodName=lodName)
+                else:
+                    # else it is single-part w/o LOD
+                    self.loadAnims(anims)
+
     def delete(self):
         try:
             self.Actor_deleted
@@ -495,6 +588,7 @@ class Actor(DirectObject, NodePath):
         """
         Actor cleanup function
         """
+        self.__cancelAsyncLoads()
         self.stop(None)
         self.clearPythonData()
         self.flush()
@@ -515,6 +609,7 @@ class Actor(DirectObject, NodePath):
         self.__subpartDict = {}
         self.__sortedLODNames = []
         self.__animControlDict = {}
+        self.__sharedAnimDicts = {}
 
     def flush(self):
         """
@@ -539,6 +634,7 @@ class Actor(DirectObject, NodePath):
 
     def removeAnimControlDict(self):
         self.__animControlDict = {}
+        self.__sharedAnimDicts = {}
 
     def getPartBundleDict(self):
         return self.__partBundleDict
@@ -1838,6 +1934,7 @@ class Actor(DirectObject, NodePath):
                                     anim = partDict[truePartName].get(animName)
                                     if anim:
                                         anim = anim.makeCopy()
+                                        animDict = self.__getOwnAnimDict(lodName, thisPart)
                                         animDict[animName] = anim
 
                         if anim == None:
@@ -1880,17 +1977,7 @@ class Actor(DirectObject, NodePath):
                 model = modelPath
         else:
             # otherwise, we got the name of the model to load.
-            loaderOptions = self.modelLoaderOptions
-            if not copy:
-                # If copy = 0, then we should always hit the disk.
-                loaderOptions = LoaderOptions(loaderOptions)
-                loaderOptions.setFlags(loaderOptions.getFlags() & ~LoaderOptions.LFNoRamCache)
-
-            if okMissing is not None:
-                if okMissing:
-                    loaderOptions.setFlags(loaderOptions.getFlags() & ~LoaderOptions.LFReportErrors)
-                else:
-                    loaderOptions.setFlags(loaderOptions.getFlags() | LoaderOptions.LFReportErrors)
+            loaderOptions = self.__getModelLoaderOptions(copy, okMissing)
 
             # Pass loaderOptions to specify that we want to
             # get the skeleton model.  This only matters to model
@@ -1945,6 +2032,7 @@ class Actor(DirectObject, NodePath):
                     lodName = 'common'
                 self.__animControlDict.setdefault(lodName, {})
                 self.__animControlDict[lodName].setdefault(partName, {})
+                animDict = self.__getOwnAnimDict(lodName, partName)
 
                 for i in range(numAnims):
                     animControl = acc.getAnim(i)
@@ -1952,7 +2040,21 @@ class Actor(DirectObject, NodePath):
 
                     animDef = Actor.AnimDef()
                     animDef.animControl = animControl
-                    self.__animControlDict[lodName][partName][animName] = animDef
+                    animDict[animName] = animDef
+
+    def __getModelLoaderOptions(self, copy, okMissing):
+        loaderOptions = self.modelLoaderOptions
+        if not copy:
+            # If copy = 0, then we should always hit the disk.
+            loaderOptions = LoaderOptions(loaderOptions)
+            loaderOptions.setFlags(loaderOptions.getFlags() & ~LoaderOptions.LFNoRamCache)
+
+        if okMissing is not None:
+            if okMissing:
+                loaderOptions.setFlags(loaderOptions.getFlags() & ~LoaderOptions.LFReportErrors)
+            else:
+                loaderOptions.setFlags(loaderOptions.getFlags() | LoaderOptions.LFReportErrors)
+        return loaderOptions
 
     def __prepareBundle(self, bundleNP, partModel,
                         partName="modelRoot", lodName="lodRoot"):
@@ -2031,6 +2133,8 @@ class Actor(DirectObject, NodePath):
         for name in excludeJoints:
             subset.addExcludeJoint(GlobPattern(name))
 
+        if isinstance(self.__subpartDict, Actor.SharedDict):
+            self.__subpartDict = dict(self.__subpartDict)
         self.__subpartDict[partName] = Actor.SubpartDef(parent, subset)
 
         if __dev__ and not overlapping and self.validateSubparts.getValue():
@@ -2141,7 +2245,8 @@ class Actor(DirectObject, NodePath):
             # make sure this lod is in anim control dict
             for lName in lodNames:
                 if firstLoad:
-                    self.__animControlDict[lName][partName][animName] = Actor.AnimDef()
+                    self.__getOwnAnimDict(lName, partName)[animName] = Actor.AnimDef()
+                anim = self.__getOwnAnimDef(lName, partName, animName)
 
                 if isinstance(filename, NodePath):
                     # We were given a pre-load anim bundle, not a filename.
@@ -2151,14 +2256,14 @@ class Actor(DirectObject, NodePath):
                     else:
                         animBundleNP = filename.find('**/+AnimBundleNode')
                     assert not animBundleNP.isEmpty()
-                    self.__animControlDict[lName][partName][animName].animBundle = animBundleNP.node().getBundle()
+                    anim.animBundle = animBundleNP.node().getBundle()
 
                 else:
                     # We were given a filename that must be loaded.
                     # Store the filename only; we will load and bind
                     # it (and produce an AnimControl) when it is
                     # played.
-                    self.__animControlDict[lName][partName][animName].filename = filename
+                    anim.filename = filename
 
     def initAnimsOnAllLODs(self,partNames):
         if self.mergeLODBundles:
@@ -2198,7 +2303,7 @@ class Actor(DirectObject, NodePath):
                 # store the file path only; we will bind it (and produce
                 # an AnimControl) when it is played
 
-                self.__animControlDict[lod][partName][animName]= Actor.AnimDef(filename)
+                self.__getOwnAnimDict(lod, partName)[animName] = Actor.AnimDef(filename)
 
     def postFlatten(self):
         """Call this after performing an aggressive flatten operation,
@@ -2297,10 +2402,172 @@ class Actor(DirectObject, NodePath):
                              lodName = lodName,
                              allowAsyncBind = allowAsyncBind)
 
-    def bindAllAnims(self, allowAsyncBind = False):
+    def bindAllAnims(self, allowAsyncBind = False, callback = None,
+                     extraArgs = [], priority = None):
         """Loads and binds all animations that have been defined for
-        the Actor. """
-        self.getAnimControls(animName = True, allowAsyncBind = allowAsyncBind)
+        the Actor.
+
+        If allowAsyncBind is True, and self.allowAsyncBind is True,
+        the animation files that have not been loaded yet are loaded in
+        the background, with the indicated priority, and bound once
+        they have all been loaded; this method returns right away.  An
+        animation that is played in the meantime is loaded and bound
+        as usual.  Otherwise, all the animations are bound before this
+        method returns.  Either way, the callback, if any, is called
+        with extraArgs when all the animations have been bound. """
+
+        if not (allowAsyncBind and self.allowAsyncBind):
+            self.getAnimControls(animName = True, allowAsyncBind = allowAsyncBind)
+            if callback is not None:
+                callback(*extraArgs)
+            return
+
+        animPaths = set()
+        for partDict in self.__animControlDict.values():
+            for animDict in partDict.values():
+                for anim in animDict.values():
+                    if not anim.animControl and not anim.animBundle and anim.filename:
+                        animPaths.add(str(anim.filename))
+
+        def gotAnims(loadedModels, loadedAnims):
+            self.__storeAnimBundles(loadedAnims)
+            self.getAnimControls(animName = True, allowAsyncBind = True)
+            if callback is not None:
+                callback(*extraArgs)
+
+        self.__requestAsync((), animPaths, gotAnims, priority = priority)
+
+    def isLoading(self):
+        """Returns true if the Actor is still loading model or
+        animation files in the background, false otherwise. """
+        return bool(self.__asyncLoads)
+
+    def __loadAsync(self, models, anims, copy, lodNode, okMissing,
+                    callback, extraArgs, priority):
+        # Loads all of the model and animation files in the background,
+        # and then sets up the Actor from them just as the constructor
+        # would have, and binds the animations.
+        modelPaths = set()
+        self.__collectPaths(models, modelPaths)
+        animPaths = set()
+        self.__collectPaths(anims, animPaths)
+
+        def gotFiles(loadedModels, loadedAnims):
+            # A model that could not be loaded is passed on by name,
+            # so that loadModel() tries again and reports the error.
+            resolvedModels = self.__resolvePaths(models, loadedModels, copy)
+            self.__loadModelsAndAnims(resolvedModels, anims, False, lodNode, okMissing)
+            self.__storeAnimBundles(loadedAnims)
+            self.getAnimControls(animName = True, allowAsyncBind = False)
+            callback(self, *extraArgs)
+
+        self.__requestAsync(modelPaths, animPaths, gotFiles,
+                            copy = copy, okMissing = okMissing,
+                            priority = priority)
+
+    def __collectPaths(self, spec, paths):
+        # Adds the filenames found in a (possibly nested) models or
+        # anims dictionary to the set.
+        if type(spec) == dict:
+            for value in spec.values():
+                self.__collectPaths(value, paths)
+        elif spec and not isinstance(spec, NodePath):
+            paths.add(str(spec))
+
+    def __resolvePaths(self, spec, loaded, copy):
+        # Returns a copy of the models dictionary, with each filename
+        # replaced by the model that was loaded for it.
+        if type(spec) == dict:
+            result = {}
+            for key, value in spec.items():
+                result[key] = self.__resolvePaths(value, loaded, copy)
+            return result
+        elif isinstance(spec, NodePath):
+            if copy:
+                return spec.copyTo(NodePath())
+            return spec
+
+        model = loaded.get(str(spec))
+        if model is None:
+            return spec
+        return model
+
+    def __storeAnimBundles(self, loadedAnims):
+        # Stores the animations that were loaded in the background on
+        # the AnimDefs that name their files, so that they can be bound
+        # without going back to disk.
+        for lodName, partDict in self.__animControlDict.items():
+            for partName, animDict in list(partDict.items()):
+                for animName, anim in list(animDict.items()):
+                    if anim.animControl or anim.animBundle or not anim.filename:
+                        continue
+                    animNP = loadedAnims.get(str(anim.filename))
+                    if animNP is None:
+                        continue
+                    if not animNP.node().isOfType(AnimBundleNode.getClassType()):
+                        animNP = animNP.find('**/+AnimBundleNode')
+                    if not animNP.isEmpty():
+                        anim = self.__getOwnAnimDef(lodName, partName, animName)
+                        anim.animBundle = animNP.node().getBundle()
+
+    def __requestAsync(self, modelPaths, animPaths, callback,
+                       copy = True, okMissing = None, priority = None):
+        # Starts loading the indicated model and animation files in the
+        # background.  When they have all been loaded, callback is
+        # called with the AsyncLoadDef's models and anims dictionaries.
+        loadDef = Actor.AsyncLoadDef(callback)
+        if not modelPaths and not animPaths:
+            callback(loadDef.models, loadDef.anims)
+            return
+
+        if self.__asyncHook is None:
+            self.__asyncHook = 'actorAsyncLoad-%s' % (Actor.asyncLoadIndex)
+            Actor.asyncLoadIndex += 1
+        if not self.__asyncLoads:
+            self.accept(self.__asyncHook, self.__gotAsyncRequest)
+
+        modelOptions = self.__getModelLoaderOptions(copy, okMissing)
+        for paths, loaderOptions, isModel in \
+                ((modelPaths, modelOptions, True),
+                 (animPaths, self.animLoaderOptions, False)):
+            for path in paths:
+                request = self.loader.makeAsyncRequest(Filename(path), loaderOptions)
+                if priority is not None:
+                    request.setPriority(priority)
+                request.setDoneEvent(self.__asyncHook)
+                loadDef.requests[request] = (isModel, path)
+                self.__asyncLoads[request] = loadDef
+                self.loader.loadAsync(request)
+
+    def __gotAsyncRequest(self, request):
+        # A model or animation file has just been loaded in the
+        # background.
+        loadDef = self.__asyncLoads.pop(request, None)
+        if loadDef is None:
+            return
+        if not self.__asyncLoads:
+            self.ignore(self.__asyncHook)
+
+        isModel, path = loadDef.requests.pop(request)
+        node = request.getModel()
+        if node is not None:
+            node = NodePath(node)
+        if isModel:
+            loadDef.models[path] = node
+        else:
+            loadDef.anims[path] = node
+
+        if not loadDef.requests:
+            loadDef.callback(loadDef.models, loadDef.anims)
+
+    def __cancelAsyncLoads(self):
+        # Abandons any files that are still being loaded in the
+        # background; their callbacks will not be called.
+        for request in self.__asyncLoads:
+            self.loader.remove(request)
+        self.__asyncLoads = {}
+        if self.__asyncHook is not None:
+            self.ignore(self.__asyncHook)
 
     def waitPending(self, partName = None):
         """Blocks until all asynchronously pending animations (that
@@ -2340,7 +2607,7 @@ class Actor(DirectObject, NodePath):
             # It must be a subpart that hasn't been bound yet.
             anim = partDict[subpartDef.truePartName].get(animName)
             anim = anim.makeCopy()
-            animDict[animName] = anim
+            self.__getOwnAnimDict(lodName, partName)[animName] = anim
 
         if anim == None:
             Actor.notify.error("actor has no animation %s", animName)
@@ -2349,6 +2616,10 @@ class Actor(DirectObject, NodePath):
         if anim.animControl:
             return anim.animControl
 
+        if anim.shared:
+            # We're about to bind it; we need our own copy.
+            anim = self.__getOwnAnimDef(lodName, partName, animName)
+
         if self.mergeLODBundles:
             bundle = self.__commonBundleHandles[subpartDef.truePartName].getBundle()
         else:
@@ -2409,7 +2680,18 @@ class Actor(DirectObject, NodePath):
         """Copies the subpartDict from another as this instance's own.
         This makes a deep copy of the map and all of the names and
         PartSubset objects within it.  We can't use copy.deepcopy()
-        because of the included C++ PartSubset objects."""
+        because of the included C++ PartSubset objects.
+
+        If shareAnimDefs is set, the map is shared with the other
+        instance instead, until either of us modifies it."""
+
+        if self.shareAnimDefs:
+            # The SubpartDefs themselves are never modified, so the
+            # whole map may be shared.
+            if not isinstance(other.__subpartDict, Actor.SharedDict):
+                other.__subpartDict = Actor.SharedDict(other.__subpartDict)
+            self.__subpartDict = other.__subpartDict
+            return
 
         self.__subpartDict = {}
         for partName, subpartDef in other.__subpartDict.items():
@@ -2427,6 +2709,16 @@ class Actor(DirectObject, NodePath):
 
         assert(other.mergeLODBundles == self.mergeLODBundles)
 
+        if self.shareAnimDefs:
+            # Share the other instance's unbound AnimDefs; we will
+            # copy each one when we first bind it.
+            for lodName in other.__animControlDict:
+                self.__animControlDict[lodName] = {}
+                for partName in other.__animControlDict[lodName]:
+                    self.__animControlDict[lodName][partName] = \
+                        other.__getSharedAnimDict(lodName, partName)
+            return
+
         for lodName in other.__animControlDict:
             self.__animControlDict[lodName] = {}
             for partName in other.__animControlDict[lodName]:
@@ -2436,6 +2728,88 @@ class Actor(DirectObject, NodePath):
                     anim = anim.makeCopy()
                     self.__animControlDict[lodName][partName][animName] = anim
 
+    def __getSharedAnimDict(self, lodName, partName):
+        """Returns a SharedDict with the same animations as this
+        instance's dictionary for the indicated lod and part, but none
+        of its bindings, for another Actor to share.  The same
+        SharedDict is returned each time, until the dictionary is
+        modified. """
+        animDict = self.__animControlDict[lodName][partName]
+        if isinstance(animDict, Actor.SharedDict):
+            return animDict
+
+        sharedDict = self.__sharedAnimDicts.get((lodName, partName))
+        if sharedDict is None:
+            anims = {}
+            for animName, anim in animDict.items():
+                anim = anim.makeCopy()
+                anim.shared = True
+                anims[animName] = anim
+            sharedDict = Actor.SharedDict(anims)
+            self.__sharedAnimDicts[(lodName, partName)] = sharedDict
+        return sharedDict
+
+    def __getOwnAnimDict(self, lodName, partName):
+        """Returns this instance's dictionary of AnimDefs for the
+        indicated lod and part, ready to be modified.  If it is a
+        SharedDict, it is first replaced with a plain copy; the
+        AnimDefs within it are still shared. """
+        partDict = self.__animControlDict[lodName]
+        animDict = partDict[partName]
+        if isinstance(animDict, Actor.SharedDict):
+            animDict = dict(animDict)
+            partDict[partName] = animDict
+        self.__sharedAnimDicts.pop((lodName, partName), None)
+        return animDict
+
+    def __getOwnAnimDef(self, lodName, partName, animName):
+        """Returns this instance's AnimDef for the indicated animation,
+        ready to be modified, copying it first if it is shared. """
+        animDict = self.__getOwnAnimDict(lodName, partName)
+        anim = animDict[animName]
+        if anim.shared:
+            anim = anim.makeCopy()
+            animDict[animName] = anim
+        return anim
+
+    def getPythonDataSize(self):
+        """Returns the approximate number of bytes taken by this
+        Actor's own Python bookkeeping: its dictionaries of parts,
+        subparts and animations, and the definitions within them.
+        Anything that is shared with other Actors is not counted.
+        This is meant for comparing the per-Actor overhead with and
+        without shareAnimDefs; it does not include the scene graph,
+        or the C++ objects the definitions refer to. """
+
+        def sizeOf(obj):
+            size = sys.getsizeof(obj)
+            if hasattr(obj, '__dict__'):
+                size += sys.getsizeof(obj.__dict__)
+            return size
+
+        size = sizeOf(self.__commonBundleHandles) + sizeOf(self.__partBundleDict)
+        for bundleDict in self.__partBundleDict.values():
+            size += sizeOf(bundleDict)
+            for partDef in bundleDict.values():
+                size += sizeOf(partDef)
+
+        if not isinstance(self.__subpartDict, Actor.SharedDict):
+            size += sizeOf(self.__subpartDict)
+            for subpartDef in self.__subpartDict.values():
+                size += sizeOf(subpartDef)
+
+        size += sizeOf(self.__animControlDict)
+        for partDict in self.__animControlDict.values():
+            size += sizeOf(partDict)
+            for animDict in partDict.values():
+                if isinstance(animDict, Actor.SharedDict):
+                    continue
+                size += sizeOf(animDict)
+                for anim in animDict.values():
+                    if not anim.shared:
+                        size += sizeOf(anim)
+        return size
+
 
     def actorInterval(self, *args, **kw):
         from direct.interval import ActorInterval
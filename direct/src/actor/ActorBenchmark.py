@@ -0,0 +1,145 @@
+"""Contains a timing benchmark that spawns a crowd of Actors, either
+synchronously or with the asynchronous Actor constructor, and a report
+of the per-Actor memory overhead of a crowd copied from one template,
+with and without shareAnimDefs.  Run this module directly to print the
+results, eg.:
+
+    python -m direct.actor.ActorBenchmark
+
+The default model and animation are the panda from Panda3D's sample
+models; pass others on the command line as
+"model anim [anim ...]". """
+
+__all__ = ['benchmarkActors', 'measureActorOverhead']
+
+from panda3d.core import NodePath, ModelPool, Filename
+from direct.actor.Actor import Actor
+from direct.task.TaskManagerGlobal import taskMgr
+from direct.showbase.EventManagerGlobal import eventMgr
+import time
+
+
+def benchmarkActors(model = 'models/panda-model',
+                    anims = {'walk': 'models/panda-walk4'},
+                    numActors = 200, useAsync = False, timeout = 60.0):
+    """Spawns numActors Actors with the indicated model and anims, and
+    binds all of their animations.  Returns the pair (mainThreadTime,
+    totalTime): the seconds spent in the main thread creating the
+    Actors and, if useAsync is True, in the frames spent waiting for
+    them; and the seconds until the last of them was ready. """
+
+    # Start from an empty cache, as a freshly started client would.
+    ModelPool.releaseAllModels()
+    eventMgr.restart()
+    root = NodePath('benchmarkRoot')
+    actors = []
+    ready = []
+
+    def gotActor(actor):
+        ready.append(actor)
+
+    t0 = time.time()
+    mainThreadTime = 0.0
+    for i in range(numActors):
+        t1 = time.time()
+        if useAsync:
+            actor = Actor(model, anims, callback = gotActor)
+        else:
+            actor = Actor(model, anims)
+            actor.bindAllAnims()
+            ready.append(actor)
+        actor.reparentTo(root)
+        actors.append(actor)
+        mainThreadTime += time.time() - t1
+
+        if useAsync:
+            # Keep the frames turning while the Actors are spawned.
+            t1 = time.time()
+            taskMgr.step()
+            mainThreadTime += time.time() - t1
+
+    while len(ready) < numActors and time.time() - t0 < timeout:
+        t1 = time.time()
+        taskMgr.step()
+        mainThreadTime += time.time() - t1
+        time.sleep(0.001)
+    totalTime = time.time() - t0
+
+    if len(ready) < numActors:
+        Actor.notify.warning('only %s of %s Actors were ready after %s seconds' % (
+            len(ready), numActors, timeout))
+
+    for actor in actors:
+        actor.cleanup()
+    root.removeNode()
+    return mainThreadTime, totalTime
+
+def measureActorOverhead(model = 'models/panda-model',
+                         anims = {'walk': 'models/panda-walk4'},
+                         numActors = 500, shareAnimDefs = False,
+                         numPlaying = 1):
+    """Copies numActors Actors from a single template Actor with the
+    indicated model and anims, and plays the first numPlaying of the
+    anims on each.  Returns the pair (pythonBytes, allocatedBytes):
+    the average bytes of each copy's own Python bookkeeping, as
+    reported by Actor.getPythonDataSize(), and the average growth of
+    the process's allocated memory per copy, if tracemalloc is
+    available, or None. """
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    template = Actor(model, anims)
+    animNames = template.getAnimNames()[:numPlaying]
+    root = NodePath('benchmarkRoot')
+    actors = []
+
+    if tracemalloc:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+    for i in range(numActors):
+        actor = Actor(other = template, shareAnimDefs = shareAnimDefs)
+        for animName in animNames:
+            actor.loop(animName)
+        actor.reparentTo(root)
+        actors.append(actor)
+
+    allocatedBytes = None
+    if tracemalloc:
+        allocatedBytes = (tracemalloc.get_traced_memory()[0] - before) / float(numActors)
+        tracemalloc.stop()
+
+    pythonBytes = sum([actor.getPythonDataSize() for actor in actors]) / float(numActors)
+
+    for actor in actors:
+        actor.cleanup()
+    template.cleanup()
+    root.removeNode()
+    return pythonBytes, allocatedBytes
+
+if __name__ == '__main__':
+    import sys
+    kw = {}
+    if len(sys.argv) > 2:
+        kw['model'] = sys.argv[1]
+        kw['anims'] = dict([(Filename(anim).getBasenameWoExtension(), anim)
+                            for anim in sys.argv[2:]])
+    numActors = 200
+    for useAsync in (False, True):
+        mainThreadTime, totalTime = benchmarkActors(numActors = numActors,
+                                                    useAsync = useAsync, **kw)
+        print('%s Actors (async %s): %.1f ms in the main thread, %.1f ms until ready' % (
+            numActors, useAsync, mainThreadTime * 1000.0, totalTime * 1000.0))
+
+    numActors = 500
+    for shareAnimDefs in (False, True):
+        pythonBytes, allocatedBytes = measureActorOverhead(
+            numActors = numActors, shareAnimDefs = shareAnimDefs, **kw)
+        if allocatedBytes is None:
+            allocated = 'unknown'
+        else:
+            allocated = '%.0f' % (allocatedBytes)
+        print('%s copied Actors (shareAnimDefs %s): %.0f bytes of Python data, %s bytes allocated per Actor' % (
+            numActors, shareAnimDefs, pythonBytes, allocated))
@@ -4,7 +4,7 @@ from direct.directnotify import DirectNotifyGlobal
 from ClientRepositoryBase import ClientRepositoryBase
 from MsgTypes import *
 from direct.distributed.PyDatagram import PyDatagram
-from pandac.PandaModules import STUint16, STUint32
+from pandac.PandaModules import STUint16, STUint32, Datagram, DatagramIterator
 
 class AstronClientRepository(ClientRepositoryBase):
     """
@@ -75,7 +75,17 @@ class AstronClientRepository(ClientRepositoryBase):
         zone_id = di.getArg(STUint32)
         dclass_id = di.getArg(STUint16)
         dclass = self.dclassesByNumber[dclass_id]
-        self.generateWithRequiredFields(dclass, do_id, di, parent_id, zone_id)
+        # Any buffered updates arrived before the generate.
+        self.flushCoalescedUpdates(do_id)
+        if self.shouldDeferGenerate(dclass):
+            self.deferGenerate(parent_id, zone_id, dclass_id, do_id, di)
+        else:
+            self.generateWithRequiredFields(dclass, do_id, di, parent_id, zone_id)
+
+    def doGenerate(self, parentId, zoneId, classId, doId, di):
+        # Replays a deferred CLIENT_ENTER_OBJECT_REQUIRED.
+        dclass = self.dclassesByNumber[classId]
+        self.generateWithRequiredFields(dclass, doId, di, parentId, zoneId)
 
     def handleEnterObjectRequiredOwner(self, di):
         avatar_doId = di.getArg(STUint32)
@@ -83,6 +93,8 @@ class AstronClientRepository(ClientRepositoryBase):
         zoneId = di.getArg(STUint32)
         dclass_id = di.getArg(STUint16)
         dclass = self.dclassesByNumber[dclass_id]
+        # Any buffered updates arrived before the generate.
+        self.flushCoalescedUpdates(avatar_doId)
         self.generateWithRequiredFieldsOwner(dclass, avatar_doId, di)
 
     def generateWithRequiredFieldsOwner(self, dclass, doId, di):
@@ -143,11 +155,43 @@ class AstronClientRepository(ClientRepositoryBase):
 
     def handleObjectLeaving(self, di):
         do_id = di.get_uint32()
+        # Any buffered updates arrived before the delete.
+        self.flushCoalescedUpdates(do_id)
         dist_obj = self.doId2do.get(do_id)
-        dist_obj.delete()
+        if dist_obj is not None:
+            dist_obj.delete()
         self.deleteObject(do_id)
         messenger.send("CLIENT_OBJECT_LEAVING", [do_id])
 
+    def handleObjectLocation(self, di):
+        index = di.getCurrentIndex()
+        do_id = di.get_uint32()
+        # Any buffered updates arrived before the location change.
+        self.flushCoalescedUpdates(do_id)
+        # Back up to the doId.
+        di = DatagramIterator(di.getDatagram(), index)
+        if do_id in self.deferredDoIds:
+            # This object hasn't really been generated yet.  Sit on
+            # the location change, and replay it in order with the
+            # object's updates.
+            args, deferrable, dg0, updates = self.deferredDoIds[do_id]
+
+            # Keep a copy of the datagram, and move the di to the copy
+            dg = Datagram(di.getDatagram())
+            di = DatagramIterator(dg, index)
+
+            updates.append((CLIENT_OBJECT_LOCATION, (dg, di)))
+        else:
+            ClientRepositoryBase.handleObjectLocation(self, di)
+
+    def replayDeferredGenerate(self, msgType, extra):
+        if msgType == CLIENT_OBJECT_LOCATION:
+            # A location change held for a deferred generate.
+            dg, di = extra
+            self.handleObjectLocation(di)
+        else:
+            ClientRepositoryBase.replayDeferredGenerate(self, msgType, extra)
+
     def handleAddInterest(self, di):
         context = di.get_uint32()
         interest_id = di.get_uint16()
@@ -184,11 +228,14 @@ class AstronClientRepository(ClientRepositoryBase):
         This is not a distributed message and does not delete the
         object on the server or on any other client.
         """
+        # Any buffered updates arrived before the delete.
+        self.flushCoalescedUpdates(doId)
         if doId in self.doId2do:
             # If it is in the dictionary, remove it.
             obj = self.doId2do[doId]
             # Remove it from the dictionary
             del self.doId2do[doId]
+            self.removeDOFromClassIndex(obj)
             # Disable, announce, and delete the object itself...
             # unless delayDelete is on...
             obj.deleteOrDelay()
@@ -199,6 +246,11 @@ class AstronClientRepository(ClientRepositoryBase):
             self.cache.delete(doId)
             if self.isLocalId(doId):
                 self.freeDoId(doId)
+        elif doId in self.deferredDoIds:
+            # It hasn't been generated yet; it never will be now.
+            self.disableDoId(doId)
+            if self.isLocalId(doId):
+                self.freeDoId(doId)
         else:
             # Otherwise, ignore it
             self.notify.warning(
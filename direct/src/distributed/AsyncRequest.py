@@ -211,7 +211,9 @@ class AsyncRequest(DirectObject):
             # causing traded inventory objects to be generated twice, once
             # here and again later when it was noticed the doId was not in
             # the doId2do list yet.
-            self.air.doId2do.pop(doId, None)
+            obj = self.air.doId2do.pop(doId, None)
+            if obj is not None:
+                self.air.removeDOFromClassIndex(obj)
         self._checkCompletion(name, None, distObj)
 
     def _checkCompletion(self, name, context, distObj):
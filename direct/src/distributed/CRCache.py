@@ -2,18 +2,45 @@
 
 from direct.directnotify import DirectNotifyGlobal
 from . import DistributedObject
+from collections import OrderedDict
 
 class CRCache:
+    """
+    Holds disabled DistributedObjects so that they may be quickly
+    regenerated if they come back into interest.  The least recently
+    cached object is deleted first when the cache is full.
+
+    The cache is bounded by the number of objects, maxCacheItems, and
+    optionally by their total cost, maxCacheCost, where each object's
+    cost is its getCacheCost() at the time it is cached (for
+    instance, an estimate of its size in bytes).  Each class (by
+    dclass name) may also be given its own quota with setClassQuota().
+    """
     notify = DirectNotifyGlobal.directNotify.newCategory("CRCache")
 
-    def __init__(self, maxCacheItems=10):
+    def __init__(self, maxCacheItems=10, maxCacheCost=-1):
         self.maxCacheItems = maxCacheItems
         self.storedCacheItems = maxCacheItems
-        self.dict = {}
-        self.fifo = []
+        # A negative maxCacheCost means no limit.
+        self.maxCacheCost = maxCacheCost
+
+        # doId -> distObj, least recently cached first
+        self.dict = OrderedDict()
+        # doId -> (cost, className)
+        self.entries = {}
+        self.totalCost = 0
+
+        # className -> maximum number of objects, and className ->
+        # OrderedDict of the cached doIds of that class, oldest first
+        self.classQuotas = {}
+        self.classDicts = {}
+
+        self.numHits = 0
+        self.numMisses = 0
+        self.numEvictions = 0
 
     def isEmpty(self):
-        return len(self.fifo) == 0
+        return len(self.dict) == 0
 
     def flush(self):
         """
@@ -48,8 +75,10 @@ class CRCache:
                       (safeRepr(obj), itype(obj), obj.getDelayDeleteNames()))
             self.notify.error(s)
         # Null out all references to the objects so they will get gcd
-        self.dict = {}
-        self.fifo = []
+        self.dict = OrderedDict()
+        self.entries = {}
+        self.classDicts = {}
+        self.totalCost = 0
 
     def cache(self, distObj):
         # Only distributed objects are allowed in the cache
@@ -62,57 +91,161 @@ class CRCache:
         if doId in self.dict:
             CRCache.notify.warning("Double cache attempted for distObj "
                                    + str(doId))
-        else:
-            # Call disable on the distObj
-            distObj.disableAndAnnounce()
-
-            # Put the distObj in the fifo and the dict
-            self.fifo.append(distObj)
-            self.dict[doId] = distObj
-
-            success = True
-
-            if len(self.fifo) > self.maxCacheItems:
-                # if the cache is full, pop the oldest item
-                oldestDistObj = self.fifo.pop(0)
-                # and remove it from the dictionary
-                del(self.dict[oldestDistObj.getDoId()])
-                # and delete it
-                oldestDistObj.deleteOrDelay()
-                if oldestDistObj.getDelayDeleteCount() <= 0:
-                    # make sure we're not leaking
-                    oldestDistObj.detectLeaks()
-
-        # Make sure that the fifo and the dictionary are sane
-        assert len(self.dict) == len(self.fifo)
+            return success
+
+        className = self.__getClassName(distObj)
+        cost = distObj.getCacheCost()
+        if self.classQuotas.get(className) == 0 or \
+           (self.maxCacheCost >= 0 and cost > self.maxCacheCost):
+            # This object may not be cached at all; the caller will
+            # delete it.
+            return success
+
+        # Call disable on the distObj
+        distObj.disableAndAnnounce()
+
+        # Put the distObj at the new end of the dict
+        self.dict[doId] = distObj
+        self.entries[doId] = (cost, className)
+        self.classDicts.setdefault(className, OrderedDict())[doId] = None
+        self.totalCost += cost
+
+        success = True
+
+        # If the cache is now over any of its limits, evict the
+        # oldest items.
+        self.__trim(className)
+
+        # Make sure that the dicts are sane
+        assert len(self.dict) == len(self.entries)
         return success
 
     def retrieve(self, doId):
         assert self.checkCache()
         if doId in self.dict:
-            # Find the object
-            distObj = self.dict[doId]
-            # Remove it from the dictionary
-            del(self.dict[doId])
-            # Remove it from the fifo
-            self.fifo.remove(distObj)
-            # return the distObj
-            return distObj
+            self.numHits += 1
+            # Remove the object from the cache and return it
+            return self.__remove(doId)
         else:
             # If you can't find it, return None
             return None
 
+    def recordMiss(self, doId):
+        """
+        Counts a generate of an object that was not in the cache.
+        """
+        self.numMisses += 1
+
+    def setMaxCacheItems(self, maxCacheItems):
+        self.maxCacheItems = maxCacheItems
+        self.__trim()
+
+    def getMaxCacheItems(self):
+        return self.maxCacheItems
+
+    def setMaxCacheCost(self, maxCacheCost):
+        """
+        Sets the maximum total getCacheCost() of the cached objects,
+        or -1 for no limit.
+        """
+        self.maxCacheCost = maxCacheCost
+        self.__trim()
+
+    def getMaxCacheCost(self):
+        return self.maxCacheCost
+
+    def setClassQuota(self, className, maxItems):
+        """
+        Limits the number of cached objects of the named dclass, which
+        otherwise compete for the whole cache.  A quota of 0 keeps the
+        class out of the cache, and None removes the quota.
+        """
+        if maxItems is None:
+            self.classQuotas.pop(className, None)
+        else:
+            self.classQuotas[className] = maxItems
+            self.__trim(className)
+
+    def getClassQuota(self, className):
+        return self.classQuotas.get(className)
+
+    def getTotalCost(self):
+        return self.totalCost
+
+    def getStats(self):
+        """
+        Returns a dictionary of the cache's counters and current size.
+        """
+        return {
+            'hits': self.numHits,
+            'misses': self.numMisses,
+            'evictions': self.numEvictions,
+            'items': len(self.dict),
+            'cost': self.totalCost,
+            'classes': dict([(className, len(classDict))
+                             for className, classDict in self.classDicts.items()]),
+            }
+
+    def resetStats(self):
+        self.numHits = 0
+        self.numMisses = 0
+        self.numEvictions = 0
+
+    def __getClassName(self, distObj):
+        dclass = getattr(distObj, 'dclass', None)
+        if dclass is not None:
+            return dclass.getName()
+        return distObj.__class__.__name__
+
+    def __remove(self, doId):
+        # Removes the object from all of the tables, and returns it.
+        distObj = self.dict.pop(doId)
+        cost, className = self.entries.pop(doId)
+        self.totalCost -= cost
+        classDict = self.classDicts[className]
+        del classDict[doId]
+        if not classDict:
+            del self.classDicts[className]
+        return distObj
+
+    def __evict(self, doId):
+        distObj = self.__remove(doId)
+        self.numEvictions += 1
+        # and delete it
+        distObj.deleteOrDelay()
+        if distObj.getDelayDeleteCount() <= 0:
+            # make sure we're not leaking
+            distObj.detectLeaks()
+
+    def __trim(self, className=None):
+        # Evicts the oldest objects of the named class while it is over
+        # its quota, and then the oldest objects overall while the
+        # cache is over its limits.
+        if className is None:
+            classNames = list(self.classQuotas.keys())
+        else:
+            classNames = [className]
+        for className in classNames:
+            quota = self.classQuotas.get(className)
+            if quota is None:
+                continue
+            classDict = self.classDicts.get(className)
+            while classDict and len(classDict) > quota:
+                self.__evict(next(iter(classDict)))
+                classDict = self.classDicts.get(className)
+
+        while self.dict and (len(self.dict) > self.maxCacheItems or
+                             (self.maxCacheCost >= 0 and self.totalCost > self.maxCacheCost)):
+            self.__evict(next(iter(self.dict)))
+
     def contains(self, doId):
         return doId in self.dict
 
     def delete(self, doId):
         assert self.checkCache()
         assert doId in self.dict
-        # Look it up
-        distObj = self.dict[doId]
-        # Remove it from the dict and fifo
-        del(self.dict[doId])
-        self.fifo.remove(distObj)
+        # Remove it from the tables
+        distObj = self.__remove(doId)
         # and delete it
         distObj.deleteOrDelay()
         if distObj.getDelayDeleteCount() <= 0:
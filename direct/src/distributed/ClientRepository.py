@@ -65,9 +65,12 @@ class ClientRepository(ClientRepositoryBase):
         # about it, so we send out all of our information about objects in
         # that particular zone.
 
-        zone = di.getUint32()
+        # The request may list several zones.
+        zones = set()
+        while di.getRemainingSize() > 0:
+            zones.add(di.getUint32())
         for obj in self.doId2do.values():
-            if obj.zoneId == zone:
+            if obj.zoneId in zones:
                 if (self.isLocalId(obj.doId)):
                     self.resendGenerate(obj)
 
@@ -108,6 +111,9 @@ class ClientRepository(ClientRepositoryBase):
         # Look up the dclass
         dclass = self.dclassesByNumber[classId]
 
+        # Any buffered updates arrived before the generate.
+        self.flushCoalescedUpdates(doId)
+
         distObj = self.doId2do.get(doId)
         if distObj and distObj.dclass == dclass:
             # We've already got this object.  Probably this is just a
@@ -119,10 +125,20 @@ class ClientRepository(ClientRepositoryBase):
             dclass.receiveUpdateOther(distObj, di)
             return
 
+        if self.shouldDeferGenerate(dclass):
+            self.deferGenerate(0, zoneId, classId, doId, di, self.currentSenderId)
+        else:
+            self.doGenerate(0, zoneId, classId, doId, di, self.currentSenderId)
+
+    def doGenerate(self, parentId, zoneId, classId, doId, di, senderId = None):
+        # Generates the object now; this is also called to replay a
+        # deferred generate.
+        self.currentSenderId = senderId
+        dclass = self.dclassesByNumber[classId]
         assert(self.notify.debug("performing generate for %s %s" % (dclass.getName(), doId)))
         dclass.startGenerate()
         # Create a new distributed object, and put it in the dictionary
-        distObj = self.generateWithRequiredOtherFields(dclass, doId, di, 0, zoneId)
+        distObj = self.generateWithRequiredOtherFields(dclass, doId, di, parentId, zoneId)
         dclass.stopGenerate()
 
     def allocateDoId(self):
@@ -212,6 +228,7 @@ class ClientRepository(ClientRepositoryBase):
         distObj.dclass = dclass
         distObj.doId = doId
         self.doId2do[doId] = distObj
+        self.addDOToClassIndex(distObj)
         distObj.generateInit()
         distObj._retrieveCachedData()
         distObj.generate()
@@ -303,6 +320,12 @@ class ClientRepository(ClientRepositoryBase):
         processing an update message or a generate message. """
         return self.currentSenderId
 
+    def getCurrentSenderId(self):
+        return self.currentSenderId
+
+    def setCurrentSenderId(self, senderId):
+        self.currentSenderId = senderId
+
     def handleDatagram(self, di):
         if self.notify.getDebug():
             print("ClientRepository received datagram:")
@@ -372,11 +395,14 @@ class ClientRepository(ClientRepositoryBase):
         This is not a distributed message and does not delete the
         object on the server or on any other client.
         """
+        # Any buffered updates arrived before the delete.
+        self.flushCoalescedUpdates(doId)
         if doId in self.doId2do:
             # If it is in the dictionary, remove it.
             obj = self.doId2do[doId]
             # Remove it from the dictionary
             del self.doId2do[doId]
+            self.removeDOFromClassIndex(obj)
             # Disable, announce, and delete the object itself...
             # unless delayDelete is on...
             obj.deleteOrDelay()
@@ -387,6 +413,11 @@ class ClientRepository(ClientRepositoryBase):
             self.cache.delete(doId)
             if self.isLocalId(doId):
                 self.freeDoId(doId)
+        elif doId in self.deferredDoIds:
+            # It hasn't been generated yet; it never will be now.
+            self.disableDoId(doId)
+            if self.isLocalId(doId):
+                self.freeDoId(doId)
         else:
             # Otherwise, ignore it
             self.notify.warning(
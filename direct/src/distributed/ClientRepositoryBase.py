@@ -10,6 +10,8 @@ from direct.showbase import PythonUtil
 from . import ParentMgr
 from . import RelatedObjectMgr
 import time
+import heapq
+from collections import OrderedDict
 from .ClockDelta import *
 
 
@@ -37,18 +39,35 @@ class ClientRepositoryBase(ConnectionRepository):
         self.context=100000
         self.setClientDatagram(1)
 
+        # The deferred generates are a heap of (-priority, sequence,
+        # msgType, extra) entries; see deferGenerate().
         self.deferredGenerates = []
         self.deferredDoIds = {}
+        self.deferredSequence = 0
         self.lastGenerate = 0
+        self.generatePriorities = {}
+        self.generatePriorityFunc = None
+        self.resetGenerateStats()
+        self.generateBudget = base.config.GetDouble('generate-frame-budget', -1)
         self.setDeferInterval(base.config.GetDouble('deferred-generate-interval', 0.2))
         self.noDefer = False  # Set this True to temporarily disable deferring.
 
+        # The buffered updates to "latest-wins" fields are kept per
+        # doId, as an OrderedDict of {fieldId: (dg, di, senderId)},
+        # oldest first; see setCoalesceUpdates().
+        self.coalescedUpdates = {}
+        self.coalescedFields = {}
+        self.resetUpdateStats()
+        self.setCoalesceUpdates(base.config.GetBool('coalesce-field-updates', False))
+
         self.recorder = base.recorder
 
         self.readDCFile(dcFileNames)
-        self.cache=CRCache.CRCache()
+        cacheSize = self.config.GetInt('cr-cache-size', 10)
+        cacheCost = self.config.GetDouble('cr-cache-max-cost', -1)
+        self.cache=CRCache.CRCache(cacheSize, cacheCost)
         self.doDataCache = CRDataCache()
-        self.cacheOwner=CRCache.CRCache()
+        self.cacheOwner=CRCache.CRCache(cacheSize, cacheCost)
         self.serverDelta = 0
 
         self.bootedIndex = None
@@ -82,11 +101,114 @@ class ClientRepositoryBase(ConnectionRepository):
         no deferring will occur."""
 
         self.deferInterval = deferInterval
-        self.setHandleCUpdates(self.deferInterval == 0)
+        self.__updateHandleCUpdates()
 
         if self.deferredGenerates:
             taskMgr.remove('deferredGenerate')
-            taskMgr.doMethodLater(self.deferInterval, self.doDeferredGenerate, 'deferredGenerate')
+            taskMgr.add(self.doDeferredGenerate, 'deferredGenerate')
+
+    def setGenerateBudget(self, generateBudget):
+        """Specifies the maximum amount of time, in seconds, to spend
+        generating DistributedObjects in each frame.  When this is 0 or
+        more, all generates are deferred, and then performed once per
+        frame, highest priority first (see setGeneratePriority()),
+        until the budget is spent, so that opening interest in a large
+        zone does not stall the client.  At least one object is
+        generated each frame.  Set this to -1 (the default) to generate
+        each object as soon as it arrives, unless its class is
+        "deferrable"; see setDeferInterval(). """
+
+        self.generateBudget = generateBudget
+        self.__updateHandleCUpdates()
+
+    def getGenerateBudget(self):
+        return self.generateBudget
+
+    def __updateHandleCUpdates(self):
+        # The C++ update handler doesn't know about deferred objects,
+        # so it may only be used when nothing is deferred.
+        # Nor does it know about coalesced updates.
+        self.setHandleCUpdates(self.deferInterval == 0 and self.generateBudget < 0 and
+                               not getattr(self, 'coalesceUpdates', False))
+
+    def setGeneratePriority(self, className, priority):
+        """Specifies the priority with which deferred objects of the
+        named dclass are generated; higher priorities are generated
+        first.  The default priority is 0. """
+        self.generatePriorities[className] = priority
+
+    def setGeneratePriorityFunc(self, func):
+        """Specifies a function that computes the priority of each
+        deferred generate, instead of the per-class priorities.  It is
+        called as func(dclass, parentId, zoneId, doId), for instance
+        to generate the objects in nearer zones first, and should
+        return a number; higher priorities are generated first.  Pass
+        None to go back to the per-class priorities. """
+        self.generatePriorityFunc = func
+
+    def getGeneratePriority(self, dclass, parentId, zoneId, doId):
+        if self.generatePriorityFunc:
+            return self.generatePriorityFunc(dclass, parentId, zoneId, doId)
+        return self.generatePriorities.get(dclass.getName(), 0)
+
+    def shouldDeferGenerate(self, dclass):
+        """Returns true if a generate for the indicated dclass should
+        be deferred with deferGenerate(), rather than performed now. """
+        if self.noDefer:
+            return False
+        if self.generateBudget >= 0:
+            return True
+        if self.deferInterval > 0:
+            return getattr(dclass.getClassDef(), 'deferrable', False)
+        return False
+
+    def deferGenerate(self, parentId, zoneId, classId, doId, di, *extraArgs):
+        """Queues the generate of the indicated object, whose required
+        fields are still to be read from di, to be performed later by
+        doGenerate(parentId, zoneId, classId, doId, di, *extraArgs).
+        Updates received for the object in the meantime are held and
+        replayed after it is generated. """
+        dclass = self.dclassesByNumber[classId]
+        deferrable = self.deferInterval > 0 and \
+                     getattr(dclass.getClassDef(), 'deferrable', False)
+        priority = self.getGeneratePriority(dclass, parentId, zoneId, doId)
+
+        # Keep a copy of the datagram, and move the di to the copy
+        dg = Datagram(di.getDatagram())
+        di = DatagramIterator(dg, di.getCurrentIndex())
+
+        args = (parentId, zoneId, classId, doId, di) + extraArgs
+        self.deferredDoIds[doId] = (args, deferrable, dg, [])
+        heapq.heappush(self.deferredGenerates, (
+            -priority, self.deferredSequence, CLIENT_ENTER_OBJECT_REQUIRED_OTHER, doId))
+        self.deferredSequence += 1
+
+        stats = self.generateStats
+        stats['deferred'] += 1
+        stats['maxQueued'] = max(stats['maxQueued'], len(self.deferredDoIds))
+
+        if not taskMgr.hasTaskNamed('deferredGenerate'):
+            taskMgr.add(self.doDeferredGenerate, 'deferredGenerate')
+
+    def getGenerateStats(self):
+        """Returns a dictionary of statistics about the deferred
+        generates: the number deferred and generated, the number still
+        queued and the most that were ever queued, the number of frames
+        spent generating them, and the total and largest time spent
+        generating in one frame. """
+        stats = dict(self.generateStats)
+        stats['queued'] = len(self.deferredDoIds)
+        return stats
+
+    def resetGenerateStats(self):
+        self.generateStats = {
+            'deferred': 0,
+            'generated': 0,
+            'maxQueued': 0,
+            'frames': 0,
+            'totalTime': 0.0,
+            'maxFrameTime': 0.0,
+            }
 
     ## def queryObjectAll(self, doID, context=0):
         ## """
@@ -103,6 +225,106 @@ class ClientRepositoryBase(ConnectionRepository):
         ## # Make sure the message gets there.
         ## self.flush()
 
+    def setCoalesceUpdates(self, coalesceUpdates):
+        """Specifies whether updates to "latest-wins" fields are
+        coalesced.  When this is True, such updates are not applied as
+        they arrive, but buffered per object and field until the end
+        of the reader poll, and only the newest update to each field
+        is applied; the others are dropped.  This is appropriate for
+        fields like setSmPos, of which an object may receive several
+        in one frame, each superseding the last.  A field is
+        "latest-wins" if it has the "coalesce" keyword in the dc file,
+        or has been marked with setFieldCoalesced().
+
+        An object's buffered updates are applied before any other
+        update, generate or disable for the same object, so each
+        object still sees its messages in the order they arrived,
+        except that a superseded update is skipped.  Messages for
+        different objects may be applied out of order. """
+
+        self.coalesceUpdates = coalesceUpdates
+        self.__updateHandleCUpdates()
+        if not coalesceUpdates:
+            self.flushCoalescedUpdates()
+
+    def getCoalesceUpdates(self):
+        return self.coalesceUpdates
+
+    def setFieldCoalesced(self, className, fieldName, coalesced = True):
+        """Marks the named field of the named dclass as "latest-wins"
+        or not, overriding the "coalesce" keyword in the dc file.
+        Since updates are dispatched by field, this applies to the
+        field in every dclass that inherits it. """
+        dclass = self.dclassesByName[className]
+        field = dclass.getFieldByName(fieldName)
+        if field is None:
+            self.notify.error('No field named %s in %s' % (fieldName, className))
+        self.coalescedFields[field.getNumber()] = coalesced
+
+    def isFieldCoalesced(self, fieldId):
+        coalesced = self.coalescedFields.get(fieldId)
+        if coalesced is None:
+            field = self.getDcFile().getFieldByIndex(fieldId)
+            coalesced = field is not None and field.hasKeyword('coalesce')
+            self.coalescedFields[fieldId] = coalesced
+        return coalesced
+
+    def flushCoalescedUpdates(self, doId = None):
+        """Applies the buffered updates to "latest-wins" fields, of
+        the indicated object only, or of all objects.  This is called
+        at the end of each reader poll, and before any other message
+        for an object that has buffered updates.  Each update is
+        applied with the sender it arrived with. """
+        if not self.coalescedUpdates:
+            return
+        if doId is None:
+            coalescedUpdates = self.coalescedUpdates
+            self.coalescedUpdates = {}
+        else:
+            updates = self.coalescedUpdates.pop(doId, None)
+            if updates is None:
+                return
+            coalescedUpdates = {doId: updates}
+
+        currentSenderId = self.getCurrentSenderId()
+        try:
+            for doId, updates in coalescedUpdates.items():
+                for dg, di, senderId in updates.values():
+                    self.setCurrentSenderId(senderId)
+                    ovUpdated = self.__doUpdateOwner(doId, di)
+                    self.__doUpdate(doId, di, ovUpdated)
+                    self.updateStats['applied'] += 1
+        finally:
+            self.setCurrentSenderId(currentSenderId)
+
+    def getCurrentSenderId(self):
+        """Returns the sender of the message currently being handled,
+        to be kept with a buffered update, if the repository tracks
+        it.  This base class does not. """
+        return None
+
+    def setCurrentSenderId(self, senderId):
+        pass
+
+    def getUpdateStats(self):
+        """Returns a dictionary of statistics about the coalesced
+        field updates: the number buffered, the number dropped because
+        a newer update to the same field arrived in the same reader
+        poll, and the number applied. """
+        return dict(self.updateStats)
+
+    def resetUpdateStats(self):
+        self.updateStats = {
+            'buffered': 0,
+            'dropped': 0,
+            'applied': 0,
+            }
+
+    def readerPollUntilEmpty(self, task):
+        result = ConnectionRepository.readerPollUntilEmpty(self, task)
+        self.flushCoalescedUpdates()
+        return result
+
     def specialName(self, label):
         name = ("SpecialName %s %s" % (self.specialNameNumber, label))
         self.specialNameNumber += 1
@@ -114,6 +336,14 @@ class ClientRepositoryBase(ConnectionRepository):
         else:
             return self.doId2do, self.cache
 
+    def getCacheStats(self, ownerView=False):
+        """
+        Returns the hit, miss and eviction counters, and the current
+        size, of the cache of disabled objects.  See CRCache.getStats().
+        """
+        table, cache = self.getTables(ownerView)
+        return cache.getStats()
+
     def _getMsgName(self, msgId):
         # we might get a list of message names, use the first one
         return makeList(MsgId2Names.get(msgId, 'UNKNOWN MESSAGE: %s' % msgId))[0]
@@ -164,8 +394,7 @@ class ClientRepositoryBase(ConnectionRepository):
     def flushGenerates(self):
         """ Forces all pending generates to be performed immediately. """
         while self.deferredGenerates:
-            msgType, extra = self.deferredGenerates[0]
-            del self.deferredGenerates[0]
+            priority, sequence, msgType, extra = heapq.heappop(self.deferredGenerates)
             self.replayDeferredGenerate(msgType, extra)
 
         taskMgr.remove('deferredGenerate')
@@ -175,13 +404,14 @@ class ClientRepositoryBase(ConnectionRepository):
         "generate" messages when they are replayed().
         """
 
-        if msgType == CLIENT_CREATE_OBJECT_REQUIRED_OTHER:
+        if msgType == CLIENT_ENTER_OBJECT_REQUIRED_OTHER:
             # It's a generate message.
             doId = extra
             if doId in self.deferredDoIds:
                 args, deferrable, dg, updates = self.deferredDoIds[doId]
                 del self.deferredDoIds[doId]
                 self.doGenerate(*args)
+                self.generateStats['generated'] += 1
 
                 if deferrable:
                     self.lastGenerate = globalClock.getFrameTime()
@@ -202,21 +432,46 @@ class ClientRepositoryBase(ConnectionRepository):
             self.notify.warning("Ignoring deferred message %s" % (msgType))
 
     def doDeferredGenerate(self, task):
-        """ This is the task that generates an object on the deferred
-        queue. """
+        """ This is the task that generates the objects on the deferred
+        queue, highest priority first, until the generate budget for
+        this frame is spent. """
 
         now = globalClock.getFrameTime()
+        startTime = globalClock.getRealTime()
+        numGenerated = 0
         while self.deferredGenerates:
-            if now - self.lastGenerate < self.deferInterval:
-                # Come back later.
-                return Task.again
+            if self.generateBudget >= 0 and numGenerated > 0 and \
+               globalClock.getRealTime() - startTime >= self.generateBudget:
+                # Come back next frame.
+                break
+
+            priority, sequence, msgType, extra = self.deferredGenerates[0]
+            if msgType == CLIENT_ENTER_OBJECT_REQUIRED_OTHER:
+                entry = self.deferredDoIds.get(extra)
+                if entry is None:
+                    # It was disabled before it was generated.
+                    heapq.heappop(self.deferredGenerates)
+                    continue
+                if entry[1] and now - self.lastGenerate < self.deferInterval:
+                    # Come back later.
+                    break
 
             # Generate the next deferred object.
-            msgType, extra = self.deferredGenerates[0]
-            del self.deferredGenerates[0]
+            heapq.heappop(self.deferredGenerates)
             self.replayDeferredGenerate(msgType, extra)
+            numGenerated += 1
+
+        if numGenerated:
+            elapsed = globalClock.getRealTime() - startTime
+            stats = self.generateStats
+            stats['frames'] += 1
+            stats['totalTime'] += elapsed
+            stats['maxFrameTime'] = max(stats['maxFrameTime'], elapsed)
 
-        # All objects are generaetd.
+        if self.deferredGenerates:
+            return Task.cont
+
+        # All objects are generated.
         return Task.done
 
     def generateWithRequiredFields(self, dclass, doId, di, parentId, zoneId):
@@ -236,6 +491,7 @@ class ClientRepositoryBase(ConnectionRepository):
             assert distObj.dclass == dclass
             # put it in the dictionary:
             self.doId2do[doId] = distObj
+            self.addDOToClassIndex(distObj)
             # and update it.
             distObj.generate()
             # make sure we don't have a stale location
@@ -246,6 +502,7 @@ class ClientRepositoryBase(ConnectionRepository):
             # updateRequiredFields calls announceGenerate
         else:
             # ...it is not in the dictionary or the cache.
+            self.cache.recordMiss(doId)
             # Construct a new one
             classDef = dclass.getClassDef()
             if classDef == None:
@@ -256,6 +513,7 @@ class ClientRepositoryBase(ConnectionRepository):
             distObj.doId = doId
             # Put the new do in the dictionary
             self.doId2do[doId] = distObj
+            self.addDOToClassIndex(distObj)
             # Update the required fields
             distObj.generateInit()  # Only called when constructed
             distObj._retrieveCachedData()
@@ -284,6 +542,7 @@ class ClientRepositoryBase(ConnectionRepository):
             assert distObj.dclass == dclass
             # put it in the dictionary:
             self.doId2do[doId] = distObj
+            self.addDOToClassIndex(distObj)
             # and update it.
             distObj.generate()
             # make sure we don't have a stale location
@@ -294,6 +553,7 @@ class ClientRepositoryBase(ConnectionRepository):
             # updateRequiredOtherFields calls announceGenerate
         else:
             # ...it is not in the dictionary or the cache.
+            self.cache.recordMiss(doId)
             # Construct a new one
             classDef = dclass.getClassDef()
             if classDef == None:
@@ -304,6 +564,7 @@ class ClientRepositoryBase(ConnectionRepository):
             distObj.doId = doId
             # Put the new do in the dictionary
             self.doId2do[doId] = distObj
+            self.addDOToClassIndex(distObj)
             # Update the required fields
             distObj.generateInit()  # Only called when constructed
             distObj._retrieveCachedData()
@@ -357,12 +618,17 @@ class ClientRepositoryBase(ConnectionRepository):
 
     def disableDoId(self, doId, ownerView=False):
         table, cache = self.getTables(ownerView)
+        # Any buffered updates arrived before the disable.
+        self.flushCoalescedUpdates(doId)
+
         # Make sure the object exists
         if doId in table:
             # Look up the object
             distObj = table[doId]
             # remove the object from the dictionary
             del table[doId]
+            if not ownerView:
+                self.removeDOFromClassIndex(distObj)
 
             # Only cache the object if it is a "cacheable" type
             # object; this way we don't clutter up the caches with
@@ -379,11 +645,11 @@ class ClientRepositoryBase(ConnectionRepository):
 
         elif doId in self.deferredDoIds:
             # The object had been deferred.  Great; we don't even have
-            # to generate it now.
+            # to generate it now.  Its entry in deferredGenerates is
+            # skipped when it comes up.
             del self.deferredDoIds[doId]
-            i = self.deferredGenerates.index((CLIENT_CREATE_OBJECT_REQUIRED_OTHER, doId))
-            del self.deferredGenerates[i]
-            if len(self.deferredGenerates) == 0:
+            if not self.deferredDoIds:
+                self.deferredGenerates = []
                 taskMgr.remove('deferredGenerate')
 
         else:
@@ -416,10 +682,39 @@ class ClientRepositoryBase(ConnectionRepository):
         documentation purposes, and also as a "just in case" handler
         in case we ever do come across a situation in the future in
         which python might handle the UPDATE_FIELD message.
+
+        The exception is when updates are coalesced (see
+        setCoalesceUpdates()), which the C++ method does not do; then
+        all updates are handled here.
         """
         # Get the DO Id
         doId = di.getUint32()
 
+        if self.coalesceUpdates and doId not in self.deferredDoIds:
+            index = di.getCurrentIndex()
+            fieldId = di.getUint16()
+            if not self.isFieldCoalesced(fieldId):
+                # Back up to the field id, and apply it now, after
+                # the updates that arrived before it.
+                di = DatagramIterator(di.getDatagram(), index)
+                self.flushCoalescedUpdates(doId)
+            else:
+                # Keep a copy of the datagram, and move the di to the
+                # copy, back at the field id.
+                dg = Datagram(di.getDatagram())
+                di = DatagramIterator(dg, index)
+                updates = self.coalescedUpdates.get(doId)
+                if updates is None:
+                    updates = OrderedDict()
+                    self.coalescedUpdates[doId] = updates
+                if updates.pop(fieldId, None) is not None:
+                    # The newer update supersedes the buffered one.
+                    self.updateStats['dropped'] += 1
+                else:
+                    self.updateStats['buffered'] += 1
+                updates[fieldId] = (dg, di, self.getCurrentSenderId())
+                return
+
         ovUpdated = self.__doUpdateOwner(doId, di)
 
         if doId in self.deferredDoIds:
@@ -515,20 +810,15 @@ class ClientRepositoryBase(ConnectionRepository):
         """ returns dict of doId:object, containing all objects
         that inherit from 'class'. returned dict is safely mutable. """
         doDict = {}
-        for doId, do in self.doId2do.items():
-            if isinstance(do, objClass):
-                doDict[doId] = do
+        for classDict in self.getClassIndexDicts(objClass):
+            doDict.update(classDict)
         return doDict
 
     def getObjectsOfExactClass(self, objClass):
         """ returns dict of doId:object, containing all objects that
         are exactly of type 'class' (neglecting inheritance). returned
         dict is safely mutable. """
-        doDict = {}
-        for doId, do in self.doId2do.items():
-            if do.__class__ == objClass:
-                doDict[doId] = do
-        return doDict
+        return dict(self._doClassIndex.get(objClass, {}))
 
 
     def considerHeartbeat(self):
@@ -223,6 +223,7 @@ class ConnectionRepository(
         distObj.doId = doId
         # Put the new do in the dictionary
         self.doId2do[doId] = distObj
+        self.addDOToClassIndex(distObj)
         # Update the required fields
         distObj.generateInit()  # Only called when constructed
         distObj.generate()
@@ -0,0 +1,430 @@
+"""Contains a headless benchmark of the distributed stack, for tracking
+its performance from one build to the next.  It starts a
+ServerRepository (or a ShardedServerRepository) and one or more
+client driver processes on localhost.  Each driver connects its share
+of the simulated clients, each of which creates a
+DistributedSmoothNode from direct.dc, sends setSmPosHprL updates for
+it at a fixed rate, and optionally moves it to another zone from time
+to time.  It reports the messages received per second, the p50 and
+p99 latency of the updates, and the CPU used by each process.  Run
+this module directly to print the results, eg.:
+
+    python -m direct.distributed.DistributedBenchmark --clients 200 --zones 20
+
+The send time of each update travels in its setComponentL field, so
+the latency is measured from one driver's send to another driver's
+receipt, through the server.  As in ServerLoadTest, the clients speak
+the CMU protocol directly, without a ClientRepository, so that one
+process can drive many of them. """
+
+__all__ = ['runDistributedBenchmark']
+
+from pandac.PandaModules import *
+from direct.distributed.MsgTypesCMU import *
+from direct.distributed.PyDatagram import PyDatagram
+from direct.distributed.PyDatagramIterator import PyDatagramIterator
+from direct.distributed.ServerLoadTest import getDCFileNames, readDCFiles
+import subprocess
+import random
+import json
+import time
+import sys
+import os
+
+# Each child process prints its results as one line of JSON after
+# this prefix, among whatever else it prints.
+ResultPrefix = 'distributed-benchmark-result: '
+
+ClassName = 'DistributedSmoothNode'
+FieldName = 'setSmPosHprL'
+
+
+def _getCpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+def _getChildCpuTime():
+    times = os.times()
+    return times[2] + times[3]
+
+def _printResult(result):
+    sys.stdout.write(ResultPrefix + json.dumps(result) + '\n')
+    sys.stdout.flush()
+
+def _readResult(process):
+    output = process.communicate()[0]
+    for line in output.splitlines():
+        if line.startswith(ResultPrefix):
+            return json.loads(line[len(ResultPrefix):])
+    return None
+
+def _getPercentile(sortedValues, percent):
+    if not sortedValues:
+        return 0.0
+    index = int(round(percent / 100.0 * (len(sortedValues) - 1)))
+    return sortedValues[index]
+
+
+def _runServer(port, numShards, aggregateSends, cacheGenerates,
+               dcFileNames, timeout):
+    """Runs the server until all of the drivers' clients have come
+    and gone, or for timeout seconds, and prints its results. """
+
+    loadPrcFileData('DistributedBenchmark',
+                    'window-type none\n'
+                    'audio-library-name null\n'
+                    'server-cache-generates %s\n' % (int(cacheGenerates)))
+    from direct.showbase.ShowBase import ShowBase
+    base = ShowBase(windowType = 'none')
+
+    # Read the same dc files the drivers do, rather than the
+    # Config.prc ones.
+    dcFileNames = getDCFileNames(dcFileNames)
+    if numShards:
+        from direct.distributed.ShardedServerRepository import ShardedServerRepository
+        server = ShardedServerRepository(port, dcFileNames = dcFileNames,
+                                         numShards = numShards)
+    else:
+        from direct.distributed.ServerRepository import ServerRepository
+        server = ServerRepository(port, dcFileNames = dcFileNames)
+    server.setAggregateSends(aggregateSends)
+
+    startCpu = _getCpuTime()
+    startTime = time.time()
+    state = {'connected': False}
+
+    def watchTask(task):
+        if server.clientsByConnection:
+            state['connected'] = True
+        elif state['connected']:
+            taskMgr.stop()
+        if time.time() - startTime > timeout:
+            taskMgr.stop()
+        return task.cont
+    taskMgr.add(watchTask, 'benchmarkWatchTask')
+
+    base.run()
+
+    elapsed = time.time() - startTime
+    cpu = _getCpuTime() - startCpu
+    if numShards:
+        server.stopShards()
+
+    messagesSent = 0
+    bytesSent = 0
+    for messages, bytes in server.sendStats.values():
+        messagesSent += messages
+        bytesSent += bytes
+
+    _printResult({
+        'elapsed': elapsed,
+        'cpu': cpu,
+        'shardCpu': _getChildCpuTime(),
+        'messagesSent': messagesSent,
+        'bytesSent': bytesSent,
+        })
+
+
+class _BenchmarkClient:
+    def __init__(self, connection, zoneId):
+        self.connection = connection
+        self.zoneId = zoneId
+        self.doIdBase = None
+        self.doId = None
+        self.nextUpdate = 0.0
+        self.nextChurn = None
+
+
+def _runDriver(port, numClients, firstClient, numZones, updateRate,
+               churnRate, duration, dcFileNames, maxSamples = 20000):
+    """Connects numClients simulated clients to the server and drives
+    them for duration seconds, and prints the results. """
+
+    # The DCFile owns its classes, so keep it around while they are used.
+    dcFile = readDCFiles(dcFileNames)
+    dclass = dcFile.getClassByName(ClassName)
+    if dclass is None:
+        raise ValueError('No class named %s in the dc files' % (ClassName))
+    fieldNumber = dclass.getFieldByName(FieldName).getNumber()
+
+    qcm = QueuedConnectionManager()
+    qcr = QueuedConnectionReader(qcm, 0)
+    cw = ConnectionWriter(qcm, 0)
+
+    # The server may still be starting up.
+    clients = []
+    stopTime = time.time() + 30.0
+    while len(clients) < numClients:
+        connection = qcm.openTCPClientConnection('127.0.0.1', port, 1000)
+        if connection:
+            qcr.addConnection(connection)
+            zoneId = (firstClient + len(clients)) % numZones + 1
+            clients.append(_BenchmarkClient(connection, zoneId))
+        elif time.time() >= stopTime:
+            break
+        else:
+            time.sleep(0.1)
+    clientsByConnection = dict([(client.connection, client) for client in clients])
+
+    result = {
+        'clients': len(clients),
+        'updatesSent': 0,
+        'updatesReceived': 0,
+        'messagesReceived': 0,
+        'bytesReceived': 0,
+        'zoneChanges': 0,
+        }
+    latencies = []
+
+    def sendGenerate(client):
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_OBJECT_GENERATE_CMU)
+        dg.addUint32(client.zoneId)
+        dg.addUint16(dclass.getNumber())
+        dg.addUint32(client.doId)
+        cw.send(dg, client.connection)
+
+    def sendInterest(client):
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_SET_INTEREST_CMU)
+        dg.addUint32(client.zoneId)
+        cw.send(dg, client.connection)
+
+    def poll():
+        while qcr.dataAvailable():
+            datagram = NetDatagram()
+            if not qcr.getData(datagram):
+                break
+            result['messagesReceived'] += 1
+            result['bytesReceived'] += datagram.getLength()
+            client = clientsByConnection.get(datagram.getConnection())
+            if not client:
+                continue
+            dgi = PyDatagramIterator(datagram)
+            type = dgi.getUint16()
+            if type == OBJECT_UPDATE_FIELD_CMU:
+                dgi.getUint32()
+                dgi.getUint32()
+                if dgi.getUint16() == fieldNumber:
+                    latency = int(time.time() * 1000000) - dgi.getUint64()
+                    result['updatesReceived'] += 1
+                    # Keep a uniform sample of the latencies.
+                    if len(latencies) < maxSamples:
+                        latencies.append(latency)
+                    else:
+                        i = random.randrange(result['updatesReceived'])
+                        if i < maxSamples:
+                            latencies[i] = latency
+            elif type == REQUEST_GENERATES_CMU:
+                zoneIds = set()
+                while dgi.getRemainingSize() > 0:
+                    zoneIds.add(dgi.getUint32())
+                if client.doId is not None and client.zoneId in zoneIds:
+                    sendGenerate(client)
+            elif type == SET_DOID_RANGE_CMU and client.doIdBase is None:
+                client.doIdBase = dgi.getUint32()
+                client.doId = client.doIdBase
+                sendInterest(client)
+                sendGenerate(client)
+
+    # Wait for the doId ranges, which start everyone off.
+    stopTime = time.time() + 30.0
+    while time.time() < stopTime and \
+          [client for client in clients if client.doIdBase is None]:
+        poll()
+        time.sleep(0.001)
+    for key in ('updatesReceived', 'messagesReceived', 'bytesReceived'):
+        result[key] = 0
+    del latencies[:]
+
+    period = 1.0 / updateRate
+    startCpu = _getCpuTime()
+    startTime = time.time()
+    for client in clients:
+        # Spread the clients' updates over the period.
+        client.nextUpdate = startTime + random.uniform(0, period)
+        if churnRate > 0:
+            client.nextChurn = startTime + random.expovariate(churnRate)
+
+    stopTime = startTime + duration
+    while True:
+        now = time.time()
+        if now >= stopTime:
+            break
+        for client in clients:
+            if client.doId is None:
+                continue
+            if client.nextChurn is not None and now >= client.nextChurn:
+                # Move the object, and its owner's interest, to another
+                # zone.  A repeated generate moves an existing object.
+                client.zoneId = random.randrange(numZones) + 1
+                sendInterest(client)
+                sendGenerate(client)
+                client.nextChurn = now + random.expovariate(churnRate)
+                result['zoneChanges'] += 1
+            if now >= client.nextUpdate:
+                args = [int(now * 1000000),
+                        random.uniform(-100, 100), random.uniform(-100, 100), 0,
+                        random.uniform(0, 360), 0, 0, 0]
+                # Reformat the packed update with the CMU message type.
+                datagram = dclass.clientFormatUpdate(FieldName, client.doId, args)
+                dgi = PyDatagramIterator(datagram)
+                dgi.getUint16()
+                dg = PyDatagram()
+                dg.addUint16(CLIENT_OBJECT_UPDATE_FIELD)
+                dg.appendData(dgi.getRemainingBytes())
+                cw.send(dg, client.connection)
+                client.nextUpdate += period
+                result['updatesSent'] += 1
+        poll()
+        time.sleep(0.0005)
+
+    result['elapsed'] = time.time() - startTime
+    result['cpu'] = _getCpuTime() - startCpu
+    result['latencies'] = latencies
+
+    for client in clients:
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_DISCONNECT_CMU)
+        cw.send(dg, client.connection)
+        qcr.removeConnection(client.connection)
+        qcm.closeConnection(client.connection)
+
+    _printResult(result)
+
+
+def runDistributedBenchmark(numClients = 100, numZones = 10,
+                            updateRate = 10.0, churnRate = 0.0,
+                            duration = 10.0, port = 4450, numDrivers = 1,
+                            numShards = 0, aggregateSends = False,
+                            cacheGenerates = False, dcFileNames = None):
+    """Starts a server on the indicated port, and numDrivers driver
+    processes that share numClients clients among them, spread over
+    numZones zones.  Each client sends updateRate updates per second,
+    and moves to a random zone churnRate times per second, on
+    average, for duration seconds.  If numShards is nonzero, the
+    server is a ShardedServerRepository with that many shards.
+
+    Returns a dictionary of the results: the numbers of clients,
+    updates sent and received, and messages and bytes received; the
+    messages and updates received per second; the p50, p99 and
+    maximum latency of the updates, in milliseconds; and the CPU used
+    by the server, its shards and each driver, as a fraction of one
+    core. """
+
+    module = 'direct.distributed.DistributedBenchmark'
+    # The server and the drivers must read the same dc files.
+    dcArgs = [pathname.toOsSpecific() for pathname in getDCFileNames(dcFileNames)]
+
+    args = [sys.executable, '-m', module, '--role', 'server',
+            '--port', str(port), '--shards', str(numShards),
+            '--duration', str(duration)]
+    if aggregateSends:
+        args.append('--aggregate')
+    if cacheGenerates:
+        args.append('--cache-generates')
+    server = subprocess.Popen(args + dcArgs, stdout = subprocess.PIPE,
+                              universal_newlines = True)
+
+    drivers = []
+    for i in range(numDrivers):
+        firstClient = numClients * i // numDrivers
+        count = numClients * (i + 1) // numDrivers - firstClient
+        args = [sys.executable, '-m', module, '--role', 'driver',
+                '--port', str(port), '--clients', str(count),
+                '--first-client', str(firstClient), '--zones', str(numZones),
+                '--rate', str(updateRate), '--churn', str(churnRate),
+                '--duration', str(duration)]
+        drivers.append(subprocess.Popen(args + dcArgs, stdout = subprocess.PIPE,
+                                        universal_newlines = True))
+
+    driverResults = [_readResult(driver) for driver in drivers]
+    serverResult = _readResult(server)
+    if serverResult is None or None in driverResults:
+        raise RuntimeError('A benchmark process failed to report its results.')
+
+    results = {
+        'clients': 0,
+        'updatesSent': 0,
+        'updatesReceived': 0,
+        'messagesReceived': 0,
+        'bytesReceived': 0,
+        'zoneChanges': 0,
+        'messagesPerSecond': 0.0,
+        'updatesPerSecond': 0.0,
+        }
+    latencies = []
+    for result in driverResults:
+        for key in ('clients', 'updatesSent', 'updatesReceived',
+                    'messagesReceived', 'bytesReceived', 'zoneChanges'):
+            results[key] += result[key]
+        elapsed = max(result['elapsed'], 1e-9)
+        results['messagesPerSecond'] += result['messagesReceived'] / elapsed
+        results['updatesPerSecond'] += result['updatesReceived'] / elapsed
+        latencies += result['latencies']
+
+    latencies.sort()
+    results['latencyP50'] = _getPercentile(latencies, 50) / 1000.0
+    results['latencyP99'] = _getPercentile(latencies, 99) / 1000.0
+    results['latencyMax'] = _getPercentile(latencies, 100) / 1000.0
+
+    serverElapsed = max(serverResult['elapsed'], 1e-9)
+    results['serverCpu'] = serverResult['cpu'] / serverElapsed
+    results['shardCpu'] = serverResult['shardCpu'] / serverElapsed
+    results['driverCpu'] = [result['cpu'] / max(result['elapsed'], 1e-9)
+                            for result in driverResults]
+    results['serverMessagesSent'] = serverResult['messagesSent']
+    results['serverBytesSent'] = serverResult['bytesSent']
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Benchmark the distributed stack on localhost.')
+    parser.add_argument('--role', choices = ['benchmark', 'server', 'driver'],
+                        default = 'benchmark', help = argparse.SUPPRESS)
+    parser.add_argument('--port', type = int, default = 4450)
+    parser.add_argument('--clients', type = int, default = 100)
+    parser.add_argument('--first-client', type = int, default = 0,
+                        help = argparse.SUPPRESS)
+    parser.add_argument('--zones', type = int, default = 10)
+    parser.add_argument('--rate', type = float, default = 10.0,
+                        help = 'updates per second per client')
+    parser.add_argument('--churn', type = float, default = 0.0,
+                        help = 'zone changes per second per client')
+    parser.add_argument('--duration', type = float, default = 10.0)
+    parser.add_argument('--drivers', type = int, default = 1)
+    parser.add_argument('--shards', type = int, default = 0)
+    parser.add_argument('--aggregate', action = 'store_true')
+    parser.add_argument('--cache-generates', action = 'store_true')
+    parser.add_argument('--json', action = 'store_true',
+                        help = 'print the results as JSON')
+    parser.add_argument('dcFiles', nargs = '*')
+    options = parser.parse_args()
+
+    if options.role == 'server':
+        _runServer(options.port, options.shards, options.aggregate,
+                   options.cache_generates, options.dcFiles or None,
+                   options.duration + 60.0)
+    elif options.role == 'driver':
+        _runDriver(options.port, options.clients, options.first_client,
+                   options.zones, options.rate, options.churn,
+                   options.duration, options.dcFiles or None)
+    else:
+        results = runDistributedBenchmark(
+            options.clients, options.zones, options.rate, options.churn,
+            options.duration, options.port, options.drivers, options.shards,
+            options.aggregate, options.cache_generates, options.dcFiles or None)
+        if options.json:
+            print(json.dumps(results, sort_keys = True))
+        else:
+            print('%s clients sent %s updates and received %s (%s messages, %s bytes)' % (
+                results['clients'], results['updatesSent'], results['updatesReceived'],
+                results['messagesReceived'], results['bytesReceived']))
+            print('%.0f messages per second, %.0f updates per second, %s zone changes' % (
+                results['messagesPerSecond'], results['updatesPerSecond'],
+                results['zoneChanges']))
+            print('latency p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+                results['latencyP50'], results['latencyP99'], results['latencyMax']))
+            print('cpu: server %.0f%%, shards %.0f%%, drivers %s' % (
+                results['serverCpu'] * 100, results['shardCpu'] * 100,
+                ', '.join(['%.0f%%' % (cpu * 100) for cpu in results['driverCpu']])))
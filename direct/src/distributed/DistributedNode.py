@@ -42,6 +42,11 @@ class DistributedNode(DistributedObject.DistributedObject, NodePath):
         DistributedObject.DistributedObject.generate(self)
         self.gotStringParentToken = 0
 
+    def announceGenerate(self):
+        DistributedObject.DistributedObject.announceGenerate(self)
+        # The required fields may have placed us.
+        self.cr.updateSpatialIndex(self)
+
     def setLocation(self, parentId, zoneId, teleport=0):
         # Redefine DistributedObject setLocation, so that when
         # location is set to the ocean grid, we can update our parenting
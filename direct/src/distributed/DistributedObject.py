@@ -40,6 +40,11 @@ class DistributedObject(DistributedObjectBase):
     # even to the quiet zone.
     neverDisable = 0
 
+    # Objects of a class that sets deferrable to True are generated
+    # no more than one per cr.deferInterval seconds; see
+    # ClientRepositoryBase.setDeferInterval().
+    deferrable = False
+
     def __init__(self, cr):
         assert self.notify.debugStateCall(self)
         try:
@@ -184,6 +189,13 @@ class DistributedObject(DistributedObjectBase):
     def getCacheable(self):
         return self.cacheable
 
+    def getCacheCost(self):
+        # Returns the estimated cost of keeping this object in the
+        # CRCache when it is disabled, for instance its size in bytes.
+        # Heavy objects should override this, so that the cache can
+        # hold many more lightweight objects than heavy ones.
+        return 1
+
     def deleteOrDelay(self):
         if len(self._token2delayDeleteName) > 0:
             if not self._delayDeleted:
@@ -113,6 +113,7 @@ class DistributedSmoothNode(DistributedNode.DistributedNode,
         to specialize the behavior.
         """
         self.smoother.computeAndApplySmoothPosHpr(self, self)
+        self.cr.updateSpatialIndex(self)
 
     def doSmoothTask(self, task):
         self.smoothPosition()
@@ -165,6 +166,7 @@ class DistributedSmoothNode(DistributedNode.DistributedNode,
         if (not self.isLocal()) and \
            self.smoother.getLatestPosition():
             self.smoother.applySmoothPosHpr(self, self)
+            self.cr.updateSpatialIndex(self)
         self.smoother.clearPositions(1)
 
     def reloadPosition(self):
@@ -379,6 +381,7 @@ class DistributedSmoothNode(DistributedNode.DistributedNode,
         if not self.localControl and not self.smoothStarted and \
            self.smoother.getLatestPosition():
             self.smoother.applySmoothPosHpr(self, self)
+            self.cr.updateSpatialIndex(self)
 
     # These are all required by the CMU server, which requires get* to
     # match set* in more cases than the Disney server does.
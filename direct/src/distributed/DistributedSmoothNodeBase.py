@@ -109,6 +109,7 @@ class DistributedSmoothNodeBase:
         # startPosHprBroadcast; we should at least make an effort to keep
         # this task accurately aligned with its period and starting time.
         self.d_broadcastPosHpr()
+        self.cr.updateSpatialIndex(self)
         task.setDelay(self.__broadcastPeriod)
         return Task.again
 
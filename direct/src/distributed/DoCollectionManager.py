@@ -1,4 +1,5 @@
 from direct.distributed import DoHierarchy
+from direct.distributed.DoSpatialIndex import DoSpatialIndex
 import re
 
 #hack:
@@ -19,6 +20,17 @@ class DoCollectionManager:
         #   parent DistributedObject id:
         #     { zoneIds: [child DistributedObject ids] }}
         self._doHierarchy = DoHierarchy.DoHierarchy()
+        # Dict of {
+        #   DistributedObject class:
+        #     { DistributedObject ids: DistributedObjects }}
+        # for the objects in doId2do, so that queries by class need
+        # not look at every object.
+        self._doClassIndex = {}
+        # Dict of { queried class: [doClassIndex dicts of its subclasses] }
+        self._doClassMatches = {}
+        # The DoSpatialIndex of the objects in doId2do that are
+        # NodePaths; built by the first spatial query.
+        self._doSpatialIndex = None
 
     def getDo(self, doId):
         return self.doId2do.get(doId)
@@ -86,16 +98,58 @@ class DoCollectionManager:
         for objects of a particular type
         """
         matches = []
-        for value in self.doId2do.values():
-            if query in str(value.__class__):
-                matches.append(value)
+        for cls, classDict in self._doClassIndex.items():
+            if query in str(cls):
+                matches.extend(classDict.values())
         return matches, len(matches)
 
     def doFindAllInstances(self, cls):
         matches = []
-        for value in self.doId2do.values():
-            if isinstance(value, cls):
-                matches.append(value)
+        for classDict in self.getClassIndexDicts(cls):
+            matches.extend(classDict.values())
+        return matches
+
+    def addDOToClassIndex(self, do):
+        """
+        Adds the object to the class index, which must be kept in step
+        with doId2do; addDOToTables() does this, as must any code that
+        adds to doId2do directly.
+        """
+        cls = do.__class__
+        classDict = self._doClassIndex.get(cls)
+        if classDict is None:
+            classDict = self._doClassIndex[cls] = {}
+            # A new class may match any of the earlier queries.
+            self._doClassMatches = {}
+        classDict[do.doId] = do
+        if self._doSpatialIndex is not None:
+            self._doSpatialIndex.add(do)
+
+    def removeDOFromClassIndex(self, do):
+        """
+        Removes the object from the class index; see addDOToClassIndex().
+        """
+        classDict = self._doClassIndex.get(do.__class__)
+        if classDict is not None:
+            classDict.pop(do.doId, None)
+        if self._doSpatialIndex is not None:
+            self._doSpatialIndex.remove(do)
+
+    def getClassIndexDicts(self, classType):
+        """
+        Returns the list of {doId: object} dicts, one per class that
+        inherits from classType, which together hold all of the
+        objects in doId2do that are instances of classType.  The
+        dicts must not be modified.
+        """
+        matches = self._doClassMatches.get(classType)
+        if matches is None:
+            # The dicts are kept even when they are emptied, so this
+            # list only goes stale when a new class is indexed.
+            matches = [classDict
+                       for cls, classDict in self._doClassIndex.items()
+                       if issubclass(cls, classType)]
+            self._doClassMatches[classType] = matches
         return matches
 
     def _getDistanceFromLA(self, do):
@@ -117,10 +171,53 @@ class DoCollectionManager:
         return 1
 
     def dosByDistance(self):
-        objs = list(self.doId2do.values())
-        objs.sort(cmp=self._compareDistance)
+        index = self.getSpatialIndex()
+        objs = index.getNearest(localAvatar, len(index))
+        # The objects that have no position go last.
+        for obj in self.doId2do.values():
+            if obj not in index:
+                objs.append(obj)
         return objs
 
+    def getSpatialIndex(self):
+        """
+        Returns the DoSpatialIndex of the objects in doId2do that are
+        NodePaths, building it if this is the first call.  From then on
+        it is kept up to date as objects come and go; see
+        updateSpatialIndex() for objects that move.
+        """
+        if self._doSpatialIndex is None:
+            self._doSpatialIndex = DoSpatialIndex()
+            for do in self.doId2do.values():
+                self._doSpatialIndex.add(do)
+        return self._doSpatialIndex
+
+    def updateSpatialIndex(self, do):
+        """
+        Records the new position of the object in the spatial index,
+        if there is one.  DistributedSmoothNodes call this whenever
+        they are repositioned; code that moves other distributed
+        NodePaths should call it too.
+        """
+        if self._doSpatialIndex is not None and do.doId in self.doId2do:
+            self._doSpatialIndex.update(do)
+
+    def getNearestDos(self, center, k = 1, classType = None, maxDistance = None):
+        """
+        Returns the list of the k distributed objects nearest center,
+        which is a point or a NodePath, nearest first; see
+        DoSpatialIndex.getNearest().
+        """
+        return self.getSpatialIndex().getNearest(center, k, classType, maxDistance)
+
+    def getDosWithinRadius(self, center, radius, classType = None, sort = False):
+        """
+        Returns the list of distributed objects within radius of
+        center, which is a point or a NodePath; see
+        DoSpatialIndex.getWithinRadius().
+        """
+        return self.getSpatialIndex().getWithinRadius(center, radius, classType, sort)
+
     def doByDistance(self):
         objs = self.dosByDistance()
         for obj in objs:
@@ -243,9 +340,8 @@ class DoCollectionManager:
         repository (for testing purposes)
         """
         count = 0
-        for dobj in self.doId2do.values():
-            if isinstance(dobj, classType):
-                count += 1
+        for classDict in self.getClassIndexDicts(classType):
+            count += len(classDict)
         return count
 
 
@@ -253,15 +349,14 @@ class DoCollectionManager:
         # Returns a list of all DistributedObjects in the repository
         # of a particular type.
         result = []
-        for obj in self.doId2do.values():
-            if isinstance(obj, type):
-                result.append(obj)
+        for classDict in self.getClassIndexDicts(type):
+            result.extend(classDict.values())
         return result
 
     def findAnyOfType(self, type):
         # Searches the repository for any object of the given type.
-        for obj in self.doId2do.values():
-            if isinstance(obj, type):
+        for classDict in self.getClassIndexDicts(type):
+            for obj in classDict.values():
                 return obj
         return None
 
@@ -397,6 +492,7 @@ class DoCollectionManager:
         doTable[do.doId]=do
 
         if not ownerView:
+            self.addDOToClassIndex(do)
             if self.isValidLocationTuple(location):
                 self.storeObjectLocation(do, location[0], location[1])
                 ##assert do.doId not in self.zoneId2doIds.get(location, {})
@@ -437,6 +533,7 @@ class DoCollectionManager:
         ##             del self.zoneId2doIds[location]
         if do.doId in self.doId2do:
             del self.doId2do[do.doId]
+            self.removeDOFromClassIndex(do)
 
     ## def changeDOZoneInTables(self, do, newParentId, newZoneId, oldParentId, oldZoneId):
     ##     if 1:
@@ -10,6 +10,9 @@ class DoHierarchy:
     def __init__(self):
         # parentId->zoneId->set(child DoIds)
         self._table = {}
+        # parentId->zoneId->class->set(child DoIds), for the classType
+        # queries of getDoIds()
+        self._classTable = {}
         self._allDoIds = set()
 
     def isEmpty(self):
@@ -22,6 +25,7 @@ class DoHierarchy:
     def clear(self):
         assert self.notify.debugCall()
         self._table = {}
+        self._classTable = {}
         self._allDoIds = set()
 
     def getDoIds(self, getDo, parentId, zoneId=None, classType=None):
@@ -39,6 +43,8 @@ class DoHierarchy:
         If dclassName is None then all objects in the zone are returned;
         otherwise the list is filtered to only include objects of that type.
         """
+        if classType is not None:
+            return self._getDoIdsOfClass(parentId, zoneId, classType)
         parent=self._table.get(parentId)
         if parent is None:
             return []
@@ -49,13 +55,26 @@ class DoHierarchy:
                     r.append(obj)
         else:
             r = parent.get(zoneId, [])
-        if classType is not None:
-            a = []
-            for doId in r:
-                obj = getDo(doId)
-                if isinstance(obj, classType):
-                    a.append(doId)
-            r = a
+        return r
+
+    def _getDoIdsOfClass(self, parentId, zoneId, classType):
+        # Only the classes present in the zones are checked against
+        # classType, rather than every object.
+        parent = self._classTable.get(parentId)
+        if parent is None:
+            return []
+        if zoneId is None:
+            zones = parent.values()
+        else:
+            zone = parent.get(zoneId)
+            if zone is None:
+                return []
+            zones = [zone]
+        r = []
+        for zone in zones:
+            for cls, doIds in zone.items():
+                if issubclass(cls, classType):
+                    r.extend(doIds)
         return r
 
     def storeObjectLocation(self, do, parentId, zoneId):
@@ -67,6 +86,8 @@ class DoHierarchy:
         parentZoneDict = self._table.setdefault(parentId, {})
         zoneDoSet = parentZoneDict.setdefault(zoneId, set())
         zoneDoSet.add(doId)
+        self._classTable.setdefault(parentId, {}).setdefault(
+            zoneId, {}).setdefault(do.__class__, set()).add(doId)
         self._allDoIds.add(doId)
         self.notify.debug('storeObjectLocation: %s(%s) @ (%s, %s)' % (
             do.__class__.__name__, doId, parentId, zoneId))
@@ -86,6 +107,7 @@ class DoHierarchy:
             if zoneDoSet is not None:
                 if doId in zoneDoSet:
                     zoneDoSet.remove(doId)
+                    self._deleteClassLocation(do, parentId, zoneId)
                     self._allDoIds.remove(doId)
                     self.notify.debug('deleteObjectLocation: %s(%s) @ (%s, %s)' % (
                         do.__class__.__name__, doId, parentId, zoneId))
@@ -102,3 +124,15 @@ class DoHierarchy:
         else:
             self.notify.error(
                 "deleteObjectLocation: parentId: %s not found" % parentId)
+
+    def _deleteClassLocation(self, do, parentId, zoneId):
+        parentClassDict = self._classTable[parentId]
+        zoneClassDict = parentClassDict[zoneId]
+        classDoSet = zoneClassDict[do.__class__]
+        classDoSet.discard(do.doId)
+        if len(classDoSet) == 0:
+            del zoneClassDict[do.__class__]
+            if len(zoneClassDict) == 0:
+                del parentClassDict[zoneId]
+                if len(parentClassDict) == 0:
+                    del self._classTable[parentId]
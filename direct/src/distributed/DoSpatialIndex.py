@@ -0,0 +1,230 @@
+"""DoSpatialIndex module: contains the DoSpatialIndex class"""
+
+from panda3d.core import NodePath, ConfigVariableDouble
+from direct.directnotify.DirectNotifyGlobal import directNotify
+import math
+
+
+class DoSpatialIndex:
+    """
+    This is a uniform grid over the positions of distributed objects
+    that are also NodePaths, such as DistributedNodes, for answering
+    k-nearest and radius queries without looking at every object.
+
+    The grid is laid over the X and Y axes; distances are still
+    measured in all three dimensions.  Positions are taken relative to
+    the indicated root, or to the top of the scene graph if no root
+    is given.
+
+    The index does not notice when a node is moved; call update()
+    with the object afterwards.  DistributedSmoothNodes do this
+    themselves whenever they apply a smoothed position or broadcast
+    their own position; for other objects, call update() or
+    refresh().
+    """
+    notify = directNotify.newCategory("DoSpatialIndex")
+
+    defaultCellSize = ConfigVariableDouble('do-spatial-index-cell-size', 100.0,
+        'The size, in feet, of each cell of the grid used to find the '
+        'distributed objects near a point.')
+
+    def __init__(self, root = None, cellSize = None):
+        if root is None:
+            root = NodePath()
+        if cellSize is None:
+            cellSize = self.defaultCellSize.getValue()
+        self.root = root
+        self.cellSize = float(cellSize)
+
+        # Dict of { cell: { doId: DistributedObject } }
+        self.cells = {}
+        # Dict of { doId: (cell, x, y, z) }
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, do):
+        return do.doId in self.positions
+
+    def clear(self):
+        self.cells = {}
+        self.positions = {}
+
+    def getCell(self, x, y):
+        return (int(math.floor(x / self.cellSize)),
+                int(math.floor(y / self.cellSize)))
+
+    def add(self, do):
+        """
+        Adds the object at its current position, or moves it there if
+        it is already in the index.  Objects that are not NodePaths, or
+        whose NodePath is empty, are ignored.
+        """
+        self.update(do)
+
+    def remove(self, do):
+        entry = self.positions.pop(do.doId, None)
+        if entry is not None:
+            self.__removeFromCell(do.doId, entry[0])
+
+    def update(self, do):
+        """
+        Moves the object to its current position in the index.
+        """
+        if not isinstance(do, NodePath) or do.isEmpty():
+            self.remove(do)
+            return
+        pos = do.getPos(self.root)
+        x, y, z = pos[0], pos[1], pos[2]
+        cell = self.getCell(x, y)
+        doId = do.doId
+        entry = self.positions.get(doId)
+        if entry is None or entry[0] != cell:
+            if entry is not None:
+                self.__removeFromCell(doId, entry[0])
+            self.cells.setdefault(cell, {})[doId] = do
+        self.positions[doId] = (cell, x, y, z)
+
+    def refresh(self):
+        """
+        Re-reads the position of every object in the index.
+        """
+        for cellDict in list(self.cells.values()):
+            for do in list(cellDict.values()):
+                self.update(do)
+
+    def getPosition(self, do):
+        """
+        Returns the last indexed (x, y, z) of the object, or None if it
+        is not in the index.
+        """
+        entry = self.positions.get(do.doId)
+        if entry is None:
+            return None
+        return entry[1:]
+
+    def getWithinRadius(self, center, radius, classType = None,
+                        sort = False):
+        """
+        Returns the list of objects within radius of center, which is
+        either a point or a NodePath.  If classType is given, only
+        instances of it are returned.  If sort is True, the list is
+        sorted nearest first.
+        """
+        cx, cy, cz = self.__getCenter(center)
+        minCell = self.getCell(cx - radius, cy - radius)
+        maxCell = self.getCell(cx + radius, cy + radius)
+        numCells = (maxCell[0] - minCell[0] + 1) * (maxCell[1] - minCell[1] + 1)
+        if numCells > len(self.cells):
+            # It's faster to look at the occupied cells.
+            cells = [cell for cell in self.cells
+                     if minCell[0] <= cell[0] <= maxCell[0] and
+                     minCell[1] <= cell[1] <= maxCell[1]]
+        else:
+            cells = [(i, j)
+                     for i in range(minCell[0], maxCell[0] + 1)
+                     for j in range(minCell[1], maxCell[1] + 1)]
+
+        radiusSquared = radius * radius
+        result = []
+        for cell in cells:
+            self.__collect(cell, cx, cy, cz, classType, result, radiusSquared)
+        if sort:
+            result.sort(key = lambda item: item[0])
+        return [do for distSquared, do in result]
+
+    def getNearest(self, center, k = 1, classType = None,
+                   maxDistance = None):
+        """
+        Returns the list of the k objects nearest center, which is
+        either a point or a NodePath, sorted nearest first.  If
+        classType is given, only instances of it are returned; if
+        maxDistance is given, only objects within that distance.
+        """
+        if k <= 0 or not self.cells:
+            return []
+        cx, cy, cz = self.__getCenter(center)
+        centerCell = self.getCell(cx, cy)
+        if maxDistance is None:
+            maxDistSquared = None
+        else:
+            maxDistSquared = maxDistance * maxDistance
+
+        # Walk outward one ring of cells at a time.  Everything in the
+        # cells beyond ring r is at least r cells' widths away, so we
+        # can stop once we have k objects nearer than that.
+        result = []
+        cellsSeen = 0
+        ring = 0
+        while True:
+            if ring * 8 > len(self.cells):
+                # The rings have grown bigger than the occupied cells
+                # that remain; look at those directly instead.
+                ci, cj = centerCell
+                for cell in self.cells:
+                    if max(abs(cell[0] - ci), abs(cell[1] - cj)) >= ring:
+                        self.__collect(cell, cx, cy, cz, classType, result,
+                                       maxDistSquared)
+                break
+            for cell in self.__getRing(centerCell, ring):
+                if cell in self.cells:
+                    cellsSeen += 1
+                    self.__collect(cell, cx, cy, cz, classType, result,
+                                   maxDistSquared)
+            bound = ring * self.cellSize
+            if len(result) >= k:
+                result.sort(key = lambda item: item[0])
+                del result[k:]
+                if result[-1][0] <= bound * bound:
+                    break
+            if cellsSeen >= len(self.cells):
+                # There are no more occupied cells to visit.
+                break
+            if maxDistance is not None and bound > maxDistance:
+                break
+            ring += 1
+
+        result.sort(key = lambda item: item[0])
+        return [do for distSquared, do in result[:k]]
+
+    def __getCenter(self, center):
+        if isinstance(center, NodePath):
+            center = center.getPos(self.root)
+        return center[0], center[1], center[2]
+
+    def __getRing(self, centerCell, ring):
+        ci, cj = centerCell
+        if ring == 0:
+            return [centerCell]
+        cells = []
+        for i in range(ci - ring, ci + ring + 1):
+            cells.append((i, cj - ring))
+            cells.append((i, cj + ring))
+        for j in range(cj - ring + 1, cj + ring):
+            cells.append((ci - ring, j))
+            cells.append((ci + ring, j))
+        return cells
+
+    def __collect(self, cell, cx, cy, cz, classType, result, maxDistSquared):
+        cellDict = self.cells.get(cell)
+        if not cellDict:
+            return
+        positions = self.positions
+        for doId, do in cellDict.items():
+            if classType is not None and not isinstance(do, classType):
+                continue
+            entry = positions[doId]
+            dx = entry[1] - cx
+            dy = entry[2] - cy
+            dz = entry[3] - cz
+            distSquared = dx * dx + dy * dy + dz * dz
+            if maxDistSquared is None or distSquared <= maxDistSquared:
+                result.append((distSquared, do))
+
+    def __removeFromCell(self, doId, cell):
+        cellDict = self.cells.get(cell)
+        if cellDict is not None:
+            cellDict.pop(doId, None)
+            if not cellDict:
+                del self.cells[cell]
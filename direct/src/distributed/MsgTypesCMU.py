@@ -19,6 +19,13 @@ MsgName2Id = {
     'CLIENT_HEARTBEAT_CMU'                    : 9011,
     'CLIENT_OBJECT_UPDATE_FIELD_TARGETED_CMU'  : 9011,
 
+    # These are sent only between a ShardedServerRepository and its
+    # ServerShards.
+    'SHARD_CLIENT_CONNECT_CMU'                : 9020,
+    'SHARD_CLIENT_MESSAGE_CMU'                : 9021,
+    'SHARD_OBJECT_LEAVE_CMU'                  : 9022,
+    'SHARD_SEND_CMU'                          : 9023,
+
     'CLIENT_OBJECT_UPDATE_FIELD' : 24,  # Matches MsgTypes.CLIENT_OBJECT_UPDATE_FIELD
     }
 
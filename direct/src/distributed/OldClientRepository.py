@@ -33,12 +33,15 @@ class OldClientRepository(ClientRepositoryBase):
         # that particular zone.
 
         assert self.DOIDnext < self.DOIDlast
-        zone = di.getUint32()
+        # The request may list several zones.
+        zones = set()
+        while di.getRemainingSize() > 0:
+            zones.add(di.getUint32())
         for obj in self.doId2do.values():
-            if obj.zone == zone:
+            if obj.zone in zones:
                 id = obj.doId
                 if (self.isLocalId(id)):
-                    self.send(obj.dclass.clientFormatGenerate(obj, id, zone, []))
+                    self.send(obj.dclass.clientFormatGenerate(obj, id, obj.zone, []))
 
     def createWithRequired(self, className, zoneId = 0, optionalFields=None):
         if self.DOIDnext >= self.DOIDlast:
@@ -57,6 +60,7 @@ class OldClientRepository(ClientRepositoryBase):
         obj.zone = zoneId
         obj.doId = id
         self.doId2do[id] = obj
+        self.addDOToClassIndex(obj)
         obj.generateInit()
         obj._retrieveCachedData()
         obj.generate()
@@ -183,6 +187,7 @@ class OldClientRepository(ClientRepositoryBase):
             assert distObj.dclass == dclass
             # put it in the dictionary:
             self.doId2do[doId] = distObj
+            self.addDOToClassIndex(distObj)
             # and update it.
             distObj.generate()
             distObj.updateRequiredFields(dclass, di)
@@ -200,6 +205,7 @@ class OldClientRepository(ClientRepositoryBase):
             distObj.doId = doId
             # Put the new do in the dictionary
             self.doId2do[doId] = distObj
+            self.addDOToClassIndex(distObj)
             # Update the required fields
             distObj.generateInit()  # Only called when constructed
             distObj.generate()
@@ -0,0 +1,187 @@
+"""Contains a load test for a ServerRepository or
+ShardedServerRepository that is already running.  It connects many
+simulated clients from this one process, each of which takes interest
+in one zone, creates an object there, and sends updates for it at a
+fixed rate, and reports how many updates went out and how many came
+back.  Run this module directly to print the results, eg.:
+
+    python -m direct.distributed.ServerLoadTest --port 4400 --clients 500
+
+The clients speak the CMU protocol directly, without a
+ClientRepository, so that one process can drive many of them.  They
+read the bundled direct.dc unless other dc files are given; the server
+must have been started with the same files. """
+
+__all__ = ['runServerLoadTest', 'getDCFileNames', 'readDCFiles']
+
+from pandac.PandaModules import *
+from direct.distributed.MsgTypesCMU import *
+from direct.distributed.PyDatagram import PyDatagram
+from direct.distributed.PyDatagramIterator import PyDatagramIterator
+import time
+import os
+
+# The dc file that defines DistributedNode and DistributedSmoothNode.
+# It sits beside this module, both in the source tree and in a build.
+DefaultDCFileName = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'direct.dc')
+
+
+class _LoadClient:
+    def __init__(self, connection, zoneId):
+        self.connection = connection
+        self.zoneId = zoneId
+        self.doIdBase = None
+        self.doId = None
+        self.nextUpdate = 0.0
+
+
+def getDCFileNames(dcFileNames = None):
+    """Returns the list of dc files named in dcFileNames, resolved on
+    the model path as ServerRepository.readDCFile() resolves them, or
+    the bundled direct.dc if dcFileNames is empty. """
+    if not dcFileNames:
+        return [Filename.fromOsSpecific(DefaultDCFileName)]
+    vfs = VirtualFileSystem.getGlobalPtr()
+    searchPath = getModelPath().getValue()
+    result = []
+    for dcFileName in dcFileNames:
+        pathname = Filename(dcFileName)
+        vfs.resolveFilename(pathname, searchPath)
+        result.append(pathname)
+    return result
+
+def readDCFiles(dcFileNames = None):
+    """Returns a DCFile with the dc files of getDCFileNames() read
+    into it. """
+    dcFile = DCFile()
+    for pathname in getDCFileNames(dcFileNames):
+        if not dcFile.read(pathname):
+            raise IOError('Could not read dc file: %s' % (pathname))
+    return dcFile
+
+def runServerLoadTest(host = '127.0.0.1', port = 4400, numClients = 100,
+                      numZones = 10, updateRate = 10.0, duration = 10.0,
+                      dcFileNames = None, className = 'DistributedNode',
+                      fieldName = 'setX', args = [0]):
+    """Connects numClients simulated clients to the server, spread
+    over numZones zones.  Each creates an object of className, which
+    must have no required fields, and sends the fieldName update with
+    the indicated args updateRate times per second, for duration
+    seconds.  Returns a dictionary of the results: the numbers of
+    clients connected, updates sent, and messages and bytes received,
+    and the messages received per second. """
+
+    # The DCFile owns its classes, so keep it around while they are used.
+    dcFile = readDCFiles(dcFileNames)
+    dclass = dcFile.getClassByName(className)
+    if dclass is None:
+        raise ValueError('No class named %s in the dc files' % (className))
+
+    qcm = QueuedConnectionManager()
+    qcr = QueuedConnectionReader(qcm, 0)
+    cw = ConnectionWriter(qcm, 0)
+
+    clients = []
+    for i in range(numClients):
+        connection = qcm.openTCPClientConnection(host, port, 5000)
+        if not connection:
+            break
+        qcr.addConnection(connection)
+        clients.append(_LoadClient(connection, i % numZones + 1))
+    clientsByConnection = dict([(client.connection, client) for client in clients])
+
+    results = {
+        'clients': len(clients),
+        'updatesSent': 0,
+        'messagesReceived': 0,
+        'bytesReceived': 0,
+        }
+
+    def poll():
+        while qcr.dataAvailable():
+            datagram = NetDatagram()
+            if not qcr.getData(datagram):
+                break
+            results['messagesReceived'] += 1
+            results['bytesReceived'] += datagram.getLength()
+            client = clientsByConnection.get(datagram.getConnection())
+            dgi = PyDatagramIterator(datagram)
+            if client and client.doIdBase is None and \
+               dgi.getUint16() == SET_DOID_RANGE_CMU:
+                client.doIdBase = dgi.getUint32()
+                startClient(client)
+
+    def startClient(client):
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_SET_INTEREST_CMU)
+        dg.addUint32(client.zoneId)
+        cw.send(dg, client.connection)
+
+        client.doId = client.doIdBase
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_OBJECT_GENERATE_CMU)
+        dg.addUint32(client.zoneId)
+        dg.addUint16(dclass.getNumber())
+        dg.addUint32(client.doId)
+        cw.send(dg, client.connection)
+
+    # Wait for the doId ranges, which start everyone off.
+    stopTime = time.time() + 10.0
+    while time.time() < stopTime and \
+          [client for client in clients if client.doIdBase is None]:
+        poll()
+        time.sleep(0.001)
+    results['messagesReceived'] = 0
+    results['bytesReceived'] = 0
+
+    period = 1.0 / updateRate
+    startTime = time.time()
+    stopTime = startTime + duration
+    while True:
+        now = time.time()
+        if now >= stopTime:
+            break
+        for client in clients:
+            if client.doId is not None and now >= client.nextUpdate:
+                # Reformat the packed update with the CMU message type.
+                datagram = dclass.clientFormatUpdate(fieldName, client.doId, args)
+                dgi = PyDatagramIterator(datagram)
+                dgi.getUint16()
+                dg = PyDatagram()
+                dg.addUint16(CLIENT_OBJECT_UPDATE_FIELD)
+                dg.appendData(dgi.getRemainingBytes())
+                cw.send(dg, client.connection)
+                client.nextUpdate = now + period
+                results['updatesSent'] += 1
+        poll()
+        time.sleep(0.001)
+
+    elapsed = time.time() - startTime
+    results['messagesPerSecond'] = results['messagesReceived'] / elapsed
+
+    for client in clients:
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_DISCONNECT_CMU)
+        cw.send(dg, client.connection)
+        qcr.removeConnection(client.connection)
+        qcm.closeConnection(client.connection)
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Load test a running ServerRepository.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 4400)
+    parser.add_argument('--clients', type = int, default = 100)
+    parser.add_argument('--zones', type = int, default = 10)
+    parser.add_argument('--rate', type = float, default = 10.0)
+    parser.add_argument('--duration', type = float, default = 10.0)
+    parser.add_argument('dcFiles', nargs = '*')
+    options = parser.parse_args()
+
+    results = runServerLoadTest(options.host, options.port, options.clients,
+                                options.zones, options.rate, options.duration,
+                                options.dcFiles or None)
+    print('%s clients sent %s updates; received %s messages (%s bytes), %.0f messages per second' % (
+        results['clients'], results['updatesSent'], results['messagesReceived'],
+        results['bytesReceived'], results['messagesPerSecond']))
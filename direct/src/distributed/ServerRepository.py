@@ -5,6 +5,8 @@ from direct.distributed.MsgTypesCMU import *
 from direct.task import Task
 from direct.directnotify import DirectNotifyGlobal
 from direct.distributed.PyDatagram import PyDatagram
+from collections import OrderedDict
+import inspect
 
 
 class ServerRepository:
@@ -57,6 +59,30 @@ class ServerRepository:
             # objects created by this client.
             self.objectsByZoneId = {}
 
+            # The messages waiting to be sent to the client, when
+            # outbound aggregation is enabled (see
+            # ServerRepository.setAggregateSends()).  Each is a list of
+            # [data, coalesceKey]; sendQueueKeys maps the coalesceKey
+            # of each queued latest-wins update to its entry.
+            self.sendQueue = []
+            self.sendQueueKeys = {}
+            self.queuedBytes = 0
+            self.queueStartTime = 0.0
+
+            # The bytes the client may still be sent under the
+            # per-client rate limit, as of lastFlushTime.
+            self.sendAllowance = 0.0
+            self.lastFlushTime = 0.0
+
+            self.queueStats = {
+                'maxDepth': 0,
+                'maxBytes': 0,
+                'batches': 0,
+                'messages': 0,
+                'bytes': 0,
+                'coalesced': 0,
+                }
+
     class Object:
         """ This internal class keeps track of the data associated
         with each extent distributed object. """
@@ -71,9 +97,16 @@ class ServerRepository:
             # The object's class type.
             self.dclass = dclass
 
-            # Note that the server does not store any other data about
-            # the distributed objects; in particular, it doesn't
-            # record its current fields.  That is left to the clients.
+            # Unless generates are cached (see
+            # ServerRepository.cacheGenerates), the server does not
+            # store any other data about the distributed objects; in
+            # particular, it doesn't record its current fields.  That
+            # is left to the clients.  Otherwise, this is the packed
+            # field data of its last generate, and a dictionary of
+            # fieldId -> (sender doIdBase, packed args) of the "ram"
+            # updates since, oldest first.
+            self.generateData = None
+            self.ramUpdates = OrderedDict()
 
 
     def __init__(self, tcpPort, serverAddress = None,
@@ -92,6 +125,11 @@ class ServerRepository:
         self.qcr = QueuedConnectionReader(self.qcm, numThreads)
         self.cw = ConnectionWriter(self.qcm, numThreads)
 
+        # The aggregated batches already carry the length of each
+        # message, so they are written without another header.
+        self.rawCw = ConnectionWriter(self.qcm, numThreads)
+        self.rawCw.setRawMode(True)
+
         taskMgr.setupTaskChain('flushTask')
         if threadedNet:
             taskMgr.setupTaskChain('flushTask', numThreads = 1,
@@ -108,6 +146,19 @@ class ServerRepository:
         # need to be flushed.
         self.needsFlush = set()
 
+        # The messages and bytes sent to each zone, by sendToClients(),
+        # since resetSendStats().
+        self.resetSendStats()
+
+        # The clients with messages in their send queue.
+        self.clientsWithQueues = set()
+        self.batchBytes = base.config.GetInt('server-batch-bytes', 1400)
+        self.batchLatency = base.config.GetDouble('server-batch-latency', 0.05)
+        self.clientMaxRate = base.config.GetDouble('server-client-max-rate', -1)
+        self.clientQueueLimit = base.config.GetInt('server-client-queue-limit', 65536)
+        self.aggregateSends = False
+        self.setAggregateSends(base.config.GetBool('server-aggregate-sends', False))
+
         collectTcpInterval = ConfigVariableDouble('collect-tcp-interval').getValue()
         taskMgr.doMethodLater(collectTcpInterval, self.flushTask, 'flushTask',
                               taskChain = 'flushTask')
@@ -134,7 +185,18 @@ class ServerRepository:
 
         # An allocator object that assigns the next doIdBase to each
         # client.
-        self.idAllocator = UniqueIdAllocator(0, 0xffffffff / self.doIdRange)
+        self.idAllocator = UniqueIdAllocator(0, 0xffffffff // self.doIdRange)
+
+        # If this is true, the server keeps the generate and "ram"
+        # fields of each object, and sends them itself to a client
+        # that opens interest in the object's zone, rather than asking
+        # the object's owner to send the generate again.
+        self.cacheGenerates = base.config.GetBool('server-cache-generates', False)
+
+        # A dictionary of zoneId -> [(owner doIdBase, datagram)], the
+        # cached generates and updates for the objects in each zone,
+        # built as needed and discarded when any of them changes.
+        self.zoneSnapshots = {}
 
         self.dcFile = DCFile()
         self.dcSuffix = ''
@@ -153,6 +215,163 @@ class ServerRepository:
 
         return Task.again
 
+    def setAggregateSends(self, aggregateSends):
+        """ Specifies whether the messages to each client are
+        queued and sent in batches, rather than written one at a time.
+        A client's queue is flushed once it holds server-batch-bytes,
+        or its oldest message has waited server-batch-latency seconds.
+        If server-client-max-rate is 0 or more, no client is sent more
+        than that many bytes per second; a client whose queue then
+        grows beyond server-client-queue-limit bytes is considered
+        slow, and an update to one of its "coalesce" fields replaces
+        the queued update to the same field, if there is one, so the
+        queue holds at most one message per such field.  The client sees
+        the same messages either way, since each message in a batch
+        keeps its length header. """
+
+        if aggregateSends and self.getTcpHeaderSize() not in (2, 4):
+            self.notify.warning(
+                "Cannot aggregate sends with a TCP header size of %s" % (
+                self.getTcpHeaderSize()))
+            aggregateSends = False
+
+        if not aggregateSends:
+            # Send off anything that is still queued.
+            for client in list(self.clientsWithQueues):
+                self.flushClientQueue(client, force = True)
+            taskMgr.remove('serverAggregateFlush')
+        elif not self.aggregateSends:
+            taskMgr.add(self.aggregateFlushTask, 'serverAggregateFlush')
+        self.aggregateSends = aggregateSends
+
+    def getAggregateSends(self):
+        return self.aggregateSends
+
+    def sendToClient(self, client, datagram, coalesceKey = None):
+        """ Sends the datagram to the client, or queues it if sends
+        are aggregated.  coalesceKey, if not None, identifies an update
+        to a latest-wins field, such as (doId, fieldId), which a slow
+        client may be spared. """
+        if self.aggregateSends:
+            self.queueMessage(client, datagram.getMessage(), coalesceKey)
+        else:
+            self.cw.send(datagram, client.connection)
+            self.needsFlush.add(client)
+
+    def queueMessage(self, client, data, coalesceKey = None):
+        """ Adds the message data to the client's send queue. """
+        stats = client.queueStats
+        if coalesceKey is not None and \
+           client.queuedBytes > self.clientQueueLimit:
+            # The client is not keeping up.  Don't add to its backlog
+            # an update that supersedes one already queued; but if
+            # there is none, queue this one, so that the client still
+            # gets the latest value.
+            entry = client.sendQueueKeys.get(coalesceKey)
+            if entry is not None:
+                client.queuedBytes += len(data) - len(entry[0])
+                entry[0] = data
+                stats['coalesced'] += 1
+                return
+
+        if not client.sendQueue:
+            client.queueStartTime = globalClock.getRealTime()
+            self.clientsWithQueues.add(client)
+        entry = [data, coalesceKey]
+        client.sendQueue.append(entry)
+        if coalesceKey is not None:
+            client.sendQueueKeys[coalesceKey] = entry
+        client.queuedBytes += len(data)
+        stats['maxDepth'] = max(stats['maxDepth'], len(client.sendQueue))
+        stats['maxBytes'] = max(stats['maxBytes'], client.queuedBytes)
+
+        if client.queuedBytes >= self.batchBytes and self.clientMaxRate < 0:
+            self.flushClientQueue(client)
+
+    def aggregateFlushTask(self, task):
+        """ This task sends the queued messages of each client whose
+        queue is full enough, or old enough. """
+        now = globalClock.getRealTime()
+        for client in list(self.clientsWithQueues):
+            if client.queuedBytes >= self.batchBytes or \
+               now - client.queueStartTime >= self.batchLatency:
+                self.flushClientQueue(client, now)
+        return Task.cont
+
+    def flushClientQueue(self, client, now = None, force = False):
+        """ Sends the messages in the client's queue, in batches of
+        up to server-batch-bytes, as far as its rate limit allows, or
+        all of them if force is True. """
+        if now is None:
+            now = globalClock.getRealTime()
+        if self.clientMaxRate >= 0 and not force:
+            # Top up the client's allowance, but don't let an idle
+            # client save up more than a second's worth.
+            client.sendAllowance = min(
+                client.sendAllowance + (now - client.lastFlushTime) * self.clientMaxRate,
+                max(self.clientMaxRate, self.batchBytes))
+            allowance = client.sendAllowance
+        else:
+            allowance = None
+        client.lastFlushTime = now
+
+        if self.getTcpHeaderSize() == 2:
+            addLength = Datagram.addUint16
+        else:
+            addLength = Datagram.addUint32
+
+        queue = client.sendQueue
+        keys = client.sendQueueKeys
+        stats = client.queueStats
+        numSent = 0
+        while numSent < len(queue) and (allowance is None or allowance > 0):
+            batch = Datagram()
+            while numSent < len(queue) and batch.getLength() < self.batchBytes:
+                data, coalesceKey = queue[numSent]
+                addLength(batch, len(data))
+                batch.appendData(data)
+                if coalesceKey is not None and keys.get(coalesceKey) is queue[numSent]:
+                    del keys[coalesceKey]
+                numSent += 1
+            self.rawCw.send(batch, client.connection)
+            if allowance is not None:
+                allowance -= batch.getLength()
+            stats['batches'] += 1
+            stats['bytes'] += batch.getLength()
+
+        if numSent:
+            for data, coalesceKey in queue[:numSent]:
+                client.queuedBytes -= len(data)
+            del queue[:numSent]
+            stats['messages'] += numSent
+            self.needsFlush.add(client)
+        if allowance is not None:
+            client.sendAllowance = allowance
+        if queue:
+            client.queueStartTime = now
+        else:
+            self.clientsWithQueues.discard(client)
+
+    def getClientQueueStats(self):
+        """ Returns a dictionary of doIdBase -> dictionary of
+        statistics about each client's send queue: its current depth
+        (in messages), bytes and age (in seconds), the greatest depth
+        and bytes it has reached, and the batches, messages and bytes
+        sent from it, and the latest-wins updates coalesced because
+        the client was slow. """
+        now = globalClock.getRealTime()
+        result = {}
+        for client in self.clientsByConnection.values():
+            stats = dict(client.queueStats)
+            stats['depth'] = len(client.sendQueue)
+            stats['queuedBytes'] = client.queuedBytes
+            if client.sendQueue:
+                stats['age'] = now - client.queueStartTime
+            else:
+                stats['age'] = 0.0
+            result[client.doIdBase] = stats
+        return result
+
     def setTcpHeaderSize(self, headerSize):
         """Sets the header size of TCP packets.  At the present, legal
         values for this are 0, 2, or 4; this specifies the number of
@@ -272,12 +491,12 @@ class ServerRepository:
             if classDef == None:
                 self.notify.debug("No class definition for %s." % (className))
             else:
-                if type(classDef) == types.ModuleType:
+                if inspect.ismodule(classDef):
                     if not hasattr(classDef, className):
                         self.notify.error("Module %s does not define class %s." % (className, className))
                     classDef = getattr(classDef, className)
 
-                if type(classDef) != types.ClassType and type(classDef) != types.TypeType:
+                if not inspect.isclass(classDef):
                     self.notify.error("Symbol %s is not a class name." % (className))
                 else:
                     dclass.setClassDef(classDef)
@@ -302,24 +521,36 @@ class ServerRepository:
             # Crazy dereferencing
             newConnection = newConnection.p()
 
-            #  Add clients information to dictionary
-            id = self.idAllocator.allocate()
-            doIdBase = id * self.doIdRange + 1
+            self.handleNewConnection(newConnection, netAddress)
 
-            self.notify.info(
-                "Got client %s from %s" % (doIdBase, netAddress))
+        return Task.cont
 
-            client = self.Client(newConnection, netAddress, doIdBase)
-            self.clientsByConnection[client.connection] = client
-            self.clientsByDoIdBase[client.doIdBase] = client
+    def handleNewConnection(self, newConnection, netAddress):
+        """ A new client has connected.  Assigns it a range of
+        doId's, and starts listening to it.  Returns the new Client
+        object. """
 
-            # Now we can start listening to that new connection.
-            self.qcr.addConnection(newConnection)
+        #  Add clients information to dictionary
+        id = self.idAllocator.allocate()
+        doIdBase = id * self.doIdRange + 1
 
-            self.lastConnection = newConnection
-            self.sendDoIdRange(client)
+        self.notify.info(
+            "Got client %s from %s" % (doIdBase, netAddress))
 
-        return Task.cont
+        client = self.Client(newConnection, netAddress, doIdBase)
+        self.clientsByConnection[client.connection] = client
+        self.clientsByDoIdBase[client.doIdBase] = client
+
+        # Now we can start listening to that new connection.
+        self.qcr.addConnection(newConnection)
+
+        self.lastConnection = newConnection
+        self.sendDoIdRange(client)
+        return client
+
+    def getDatagramClient(self, datagram):
+        """ Returns the Client that sent the datagram, or None. """
+        return self.clientsByConnection.get(datagram.getConnection())
 
     def readerPollUntilEmpty(self, task):
         """ continuously polls for new messages on the server """
@@ -342,7 +573,7 @@ class ServerRepository:
     def handleDatagram(self, datagram):
         """ switching station for messages """
 
-        client = self.clientsByConnection.get(datagram.getConnection())
+        client = self.getDatagramClient(datagram)
 
         if not client:
             # This shouldn't be possible, though it appears to happen
@@ -384,12 +615,11 @@ class ServerRepository:
         """ client wants to create an object, so we store appropriate
         data, and then pass message along to corresponding zones """
 
-        connection = datagram.getConnection()
         zoneId  = dgi.getUint32()
         classId = dgi.getUint16()
         doId    = dgi.getUint32()
 
-        client = self.clientsByConnection[connection]
+        client = self.getDatagramClient(datagram)
 
         if self.getDoIdBase(doId) != client.doIdBase:
             self.notify.warning(
@@ -397,6 +627,7 @@ class ServerRepository:
             return
 
         dclass = self.dclassesByNumber[classId]
+        data = dgi.getRemainingBytes()
 
         object = client.objectsByDoId.get(doId)
         if object:
@@ -407,6 +638,7 @@ class ServerRepository:
                     "Ignoring attempt to change object %s from %s to %s by client %s" % (
                     doId, object.dclass.getName(), dclass.getName(), client.doIdBase))
                 return
+            self.cacheGenerate(object, data)
             self.setObjectZone(client, object, zoneId)
         else:
             if self.notify.getDebug():
@@ -415,11 +647,12 @@ class ServerRepository:
                     doId, dclass.getName(), client.doIdBase))
 
             object = self.Object(doId, zoneId, dclass)
+            self.cacheGenerate(object, data)
             client.objectsByDoId[doId] = object
             client.objectsByZoneId.setdefault(zoneId, set()).add(object)
             self.objectsByZoneId.setdefault(zoneId, set()).add(object)
 
-            self.updateClientInterestZones(client)
+            self.updateClientInterestZones(client, [zoneId])
 
 
         # Rebuild the new datagram that we'll send on.  We shim in the
@@ -430,14 +663,64 @@ class ServerRepository:
         dg.addUint32(zoneId)
         dg.addUint16(classId)
         dg.addUint32(doId)
-        dg.appendData(dgi.getRemainingBytes())
+        dg.appendData(data)
 
         self.sendToZoneExcept(zoneId, dg, [client])
 
+    def cacheGenerate(self, object, data):
+        """ Records the packed fields of a generate for the object, if
+        generates are cached.  The required fields it carries
+        supersede any earlier updates to them. """
+        if not self.cacheGenerates:
+            return
+        object.generateData = data
+        for fieldId in list(object.ramUpdates.keys()):
+            if object.dclass.getFieldByIndex(fieldId).hasKeyword('required'):
+                del object.ramUpdates[fieldId]
+        self.zoneSnapshots.pop(object.zoneId, None)
+
+    def cacheUpdate(self, object, sender, fieldId, data):
+        """ Records the packed args of an update to a "ram" field of
+        the object, if generates are cached. """
+        if not self.cacheGenerates:
+            return
+        # Move the field to the end, to keep them in order.
+        object.ramUpdates.pop(fieldId, None)
+        object.ramUpdates[fieldId] = (sender.doIdBase, data)
+        self.zoneSnapshots.pop(object.zoneId, None)
+
+    def getZoneSnapshot(self, zoneId):
+        """ Returns the list of (owner doIdBase, datagram) that
+        brings a client up to date with the objects in the zone, from
+        the cached generates and updates. """
+        snapshot = self.zoneSnapshots.get(zoneId)
+        if snapshot is None:
+            snapshot = []
+            for object in self.objectsByZoneId.get(zoneId, ()):
+                ownerId = self.getDoIdBase(object.doId)
+                dg = PyDatagram()
+                dg.addUint16(OBJECT_GENERATE_CMU)
+                dg.addUint32(ownerId)
+                dg.addUint32(zoneId)
+                dg.addUint16(object.dclass.getNumber())
+                dg.addUint32(object.doId)
+                dg.appendData(object.generateData or b'')
+                snapshot.append((ownerId, dg))
+
+                for fieldId, (senderId, data) in object.ramUpdates.items():
+                    dg = PyDatagram()
+                    dg.addUint16(OBJECT_UPDATE_FIELD_CMU)
+                    dg.addUint32(senderId)
+                    dg.addUint32(object.doId)
+                    dg.addUint16(fieldId)
+                    dg.appendData(data)
+                    snapshot.append((ownerId, dg))
+            self.zoneSnapshots[zoneId] = snapshot
+        return snapshot
+
     def handleClientObjectUpdateField(self, datagram, dgi, targeted = False):
         """ Received an update request from a client. """
-        connection = datagram.getConnection()
-        client = self.clientsByConnection[connection]
+        client = self.getDatagramClient(datagram)
 
         if targeted:
             targetId = dgi.getUint32()
@@ -474,7 +757,14 @@ class ServerRepository:
         dg.addUint32(client.doIdBase)
         dg.addUint32(doId)
         dg.addUint16(fieldId)
-        dg.appendData(dgi.getRemainingBytes())
+        data = dgi.getRemainingBytes()
+        dg.appendData(data)
+
+        # A slow client may be spared all but the latest update to
+        # this field; see setAggregateSends().
+        coalesceKey = None
+        if dcfield.hasKeyword('coalesce'):
+            coalesceKey = (doId, fieldId)
 
         if targeted:
             # A targeted update: only to the indicated client.
@@ -485,21 +775,23 @@ class ServerRepository:
                     targetId,
                     dclass.getName(), dcfield.getName(), doId, client.doIdBase))
                 return
-            self.cw.send(dg, target.connection)
-            self.needsFlush.add(target)
+            self.sendToClient(target, dg, coalesceKey)
 
         elif dcfield.hasKeyword('p2p'):
             # p2p: to object owner only
-            self.cw.send(dg, owner.connection)
-            self.needsFlush.add(owner)
+            self.sendToClient(owner, dg, coalesceKey)
 
         elif dcfield.hasKeyword('broadcast'):
             # Broadcast: to everyone except orig sender
-            self.sendToZoneExcept(object.zoneId, dg, [client])
+            if dcfield.hasKeyword('ram'):
+                self.cacheUpdate(object, client, fieldId, data)
+            self.sendToZoneExcept(object.zoneId, dg, [client], coalesceKey)
 
         elif dcfield.hasKeyword('reflect'):
             # Reflect: broadcast to everyone including orig sender
-            self.sendToZoneExcept(object.zoneId, dg, [])
+            if dcfield.hasKeyword('ram'):
+                self.cacheUpdate(object, client, fieldId, data)
+            self.sendToZoneExcept(object.zoneId, dg, [], coalesceKey)
 
         else:
             self.notify.warning(
@@ -516,8 +808,7 @@ class ServerRepository:
         """ client deletes an object, let everyone who has interest in
         the object's zone know about it. """
 
-        connection = datagram.getConnection()
-        client = self.clientsByConnection[connection]
+        client = self.getDatagramClient(datagram)
         object = client.objectsByDoId.get(doId)
         if not object:
             self.notify.warning(
@@ -534,8 +825,9 @@ class ServerRepository:
         if not client.objectsByZoneId[object.zoneId]:
             del client.objectsByZoneId[object.zoneId]
         del client.objectsByDoId[doId]
+        self.zoneSnapshots.pop(object.zoneId, None)
 
-        self.updateClientInterestZones(client)
+        self.updateClientInterestZones(client, [object.zoneId])
 
     def handleClientObjectSetZone(self, datagram, dgi):
         """ The client is telling us the object is changing to a new
@@ -543,8 +835,7 @@ class ServerRepository:
         doId = dgi.getUint32()
         zoneId = dgi.getUint32()
 
-        connection = datagram.getConnection()
-        client = self.clientsByConnection[connection]
+        client = self.getDatagramClient(datagram)
         object = client.objectsByDoId.get(doId)
         if not object:
             # Don't know this object.
@@ -569,8 +860,10 @@ class ServerRepository:
         object.zoneId = zoneId
         self.objectsByZoneId.setdefault(zoneId, set()).add(object)
         owner.objectsByZoneId.setdefault(zoneId, set()).add(object)
+        self.zoneSnapshots.pop(oldZoneId, None)
+        self.zoneSnapshots.pop(zoneId, None)
 
-        self.updateClientInterestZones(owner)
+        self.updateClientInterestZones(owner, [oldZoneId, zoneId])
 
         # Any clients that are listening to oldZoneId but not zoneId
         # should receive a disable message: this object has just gone
@@ -578,11 +871,9 @@ class ServerRepository:
         datagram = PyDatagram()
         datagram.addUint16(OBJECT_DISABLE_CMU)
         datagram.addUint32(object.doId)
-        for client in self.zonesToClients[oldZoneId]:
-            if client != owner:
-                if zoneId not in client.currentInterestZoneIds:
-                    self.cw.send(datagram, client.connection)
-                    self.needsFlush.add(client)
+        clients = self.zonesToClients.get(oldZoneId, set()) - \
+                  self.zonesToClients.get(zoneId, set())
+        self.sendToClients(datagram, clients, set([owner]), oldZoneId)
 
         # The client is now responsible for sending a generate for the
         # object that just switched zones, to inform the clients that
@@ -597,8 +888,7 @@ class ServerRepository:
         datagram.addUint32(client.doIdBase)
         datagram.addUint32(self.doIdRange)
 
-        self.cw.send(datagram, client.connection)
-        self.needsFlush.add(client)
+        self.sendToClient(client, datagram)
 
     # a client disconnected from us, we need to update our data, also
     # tell other clients to remove the disconnected clients objects
@@ -618,14 +908,24 @@ class ServerRepository:
             self.objectsByZoneId[object.zoneId].remove(object)
             if not self.objectsByZoneId[object.zoneId]:
                 del self.objectsByZoneId[object.zoneId]
+            self.zoneSnapshots.pop(object.zoneId, None)
 
         client.objectsByDoId = {}
         client.objectsByZoneId = {}
+        client.sendQueue = []
+        client.sendQueueKeys = {}
+        client.queuedBytes = 0
+        self.clientsWithQueues.discard(client)
 
+        self.forgetClient(client)
+
+    def forgetClient(self, client):
+        """ Removes the disconnected client from the tables, and
+        closes its connection. """
         del self.clientsByConnection[client.connection]
         del self.clientsByDoIdBase[client.doIdBase]
 
-        id = client.doIdBase / self.doIdRange
+        id = client.doIdBase // self.doIdRange
         self.idAllocator.free(id)
 
         self.qcr.removeConnection(client.connection)
@@ -641,47 +941,87 @@ class ServerRepository:
             zoneId = dgi.getUint32()
             zoneIds.add(zoneId)
 
+        changedZoneIds = zoneIds ^ client.explicitInterestZoneIds
         client.explicitInterestZoneIds = zoneIds
-        self.updateClientInterestZones(client)
+        self.updateClientInterestZones(client, changedZoneIds)
 
-    def updateClientInterestZones(self, client):
+    def updateClientInterestZones(self, client, zoneIds = None):
         """ Something about the client has caused its set of interest
-        zones to potentially change.  Recompute them. """
+        zones to potentially change.  If zoneIds is given, only those
+        zones can have changed; otherwise, recompute them all. """
 
         origZoneIds = client.currentInterestZoneIds
-        newZoneIds = client.explicitInterestZoneIds | set(client.objectsByZoneId.keys())
-        if origZoneIds == newZoneIds:
+        if zoneIds is None:
+            newZoneIds = client.explicitInterestZoneIds | set(client.objectsByZoneId.keys())
+            addedZoneIds = newZoneIds - origZoneIds
+            removedZoneIds = origZoneIds - newZoneIds
+        else:
+            addedZoneIds = set()
+            removedZoneIds = set()
+            for zoneId in zoneIds:
+                wanted = zoneId in client.explicitInterestZoneIds or \
+                         zoneId in client.objectsByZoneId
+                if wanted and zoneId not in origZoneIds:
+                    addedZoneIds.add(zoneId)
+                elif not wanted and zoneId in origZoneIds:
+                    removedZoneIds.add(zoneId)
+
+        if not addedZoneIds and not removedZoneIds:
             # No change.
             return
 
-        client.currentInterestZoneIds = newZoneIds
-        addedZoneIds = newZoneIds - origZoneIds
-        removedZoneIds = origZoneIds - newZoneIds
+        origZoneIds.difference_update(removedZoneIds)
+        origZoneIds.update(addedZoneIds)
 
         for zoneId in addedZoneIds:
             self.zonesToClients.setdefault(zoneId, set()).add(client)
 
-            # The client is opening interest in this zone. Need to get
-            # all of the data from clients who may have objects in
-            # this zone
-            datagram = NetDatagram()
-            datagram.addUint16(REQUEST_GENERATES_CMU)
-            datagram.addUint32(zoneId)
-            self.sendToZoneExcept(zoneId, datagram, [client])
-
-        datagram = PyDatagram()
-        datagram.addUint16(OBJECT_DISABLE_CMU)
-        for zoneId in removedZoneIds:
-            self.zonesToClients[zoneId].remove(client)
-
-            # The client is abandoning interest in this zone.  Any
-            # objects in this zone should be disabled for the client.
-            for object in self.objectsByZoneId.get(zoneId, []):
-                datagram.addUint32(object.doId)
-        self.cw.send(datagram, client.connection)
+        # The client is opening interest in these zones.  It needs to
+        # get all of the data about the objects in them.
+        self.sendZoneGenerates(client, addedZoneIds)
+
+        if removedZoneIds:
+            datagram = PyDatagram()
+            datagram.addUint16(OBJECT_DISABLE_CMU)
+            for zoneId in removedZoneIds:
+                zoneClients = self.zonesToClients[zoneId]
+                zoneClients.remove(client)
+                if not zoneClients:
+                    del self.zonesToClients[zoneId]
+
+                # The client is abandoning interest in this zone.  Any
+                # objects in this zone should be disabled for the client.
+                for object in self.objectsByZoneId.get(zoneId, []):
+                    datagram.addUint32(object.doId)
+            self.sendToClient(client, datagram)
+
+    def sendZoneGenerates(self, client, zoneIds):
+        """ Sees to it that the client receives the generates of the
+        objects, other than its own, in the indicated zones: from the
+        cache, if generates are cached, or else by asking each owner
+        to send them again, with one REQUEST_GENERATES_CMU listing all
+        of the owner's zones among these. """
+
+        if self.cacheGenerates:
+            for zoneId in zoneIds:
+                for ownerId, datagram in self.getZoneSnapshot(zoneId):
+                    if ownerId != client.doIdBase:
+                        self.sendToClient(client, datagram)
+            return
 
-        self.needsFlush.add(client)
+        ownerZoneIds = {}
+        for zoneId in zoneIds:
+            for object in self.objectsByZoneId.get(zoneId, ()):
+                owner = self.clientsByDoIdBase.get(self.getDoIdBase(object.doId))
+                if owner and owner != client:
+                    ownerZoneIds.setdefault(owner, set()).add(zoneId)
 
+        for owner, zoneIds in ownerZoneIds.items():
+            datagram = PyDatagram()
+            datagram.addUint16(REQUEST_GENERATES_CMU)
+            for zoneId in zoneIds:
+                datagram.addUint32(zoneId)
+            self.sendToClient(owner, datagram)
 
     def clientHardDisconnectTask(self, task):
         """ client did not tell us he was leaving but we lost connection to
@@ -691,7 +1031,8 @@ class ServerRepository:
                 self.handleClientDisconnect(client)
         return Task.cont
 
-    def sendToZoneExcept(self, zoneId, datagram, exceptionList):
+    def sendToZoneExcept(self, zoneId, datagram, exceptionList,
+                         coalesceKey = None):
         """sends a message to everyone who has interest in the
         indicated zone, except for the clients on exceptionList."""
 
@@ -700,13 +1041,8 @@ class ServerRepository:
                 "ServerRepository sending to all in zone %s except %s:" % (zoneId, [c.doIdBase for c in exceptionList]))
             #datagram.dumpHex(ostream)
 
-        for client in self.zonesToClients.get(zoneId, []):
-            if client not in exceptionList:
-                if self.notify.getDebug():
-                    self.notify.debug(
-                        "  -> %s" % (client.doIdBase))
-                self.cw.send(datagram, client.connection)
-                self.needsFlush.add(client)
+        self.sendToClients(datagram, self.zonesToClients.get(zoneId, ()),
+                           exceptionList, zoneId, coalesceKey)
 
     def sendToAllExcept(self, datagram, exceptionList):
         """ sends a message to all connected clients, except for
@@ -717,10 +1053,64 @@ class ServerRepository:
                 "ServerRepository sending to all except %s:" % ([c.doIdBase for c in exceptionList],))
             #datagram.dumpHex(ostream)
 
-        for client in self.clientsByConnection.values():
-            if client not in exceptionList:
-                if self.notify.getDebug():
-                    self.notify.debug(
-                        "  -> %s" % (client.doIdBase))
-                self.cw.send(datagram, client.connection)
-                self.needsFlush.add(client)
+        self.sendToClients(datagram, self.clientsByConnection.values(),
+                           exceptionList)
+
+    def sendToClients(self, datagram, clients, exceptClients = None,
+                      zoneId = None, coalesceKey = None):
+        """ sends a message to each of the indicated clients, except
+        for those in exceptClients.  clients is best passed as a set,
+        such as one of the sets in zonesToClients, which is not
+        modified; exceptClients may be any iterable.  The message is
+        counted towards the send statistics of zoneId; see
+        getSendStats().  If sends are aggregated, the message is
+        queued for each client instead, with the indicated coalesceKey;
+        see sendToClient().  Returns the number of clients sent to. """
+
+        if exceptClients:
+            if not isinstance(clients, (set, frozenset)):
+                clients = set(clients)
+            clients = clients.difference(exceptClients)
+        if not clients:
+            return 0
+
+        if self.notify.getDebug():
+            for client in clients:
+                self.notify.debug(
+                    "  -> %s" % (client.doIdBase))
+
+        if self.aggregateSends:
+            data = datagram.getMessage()
+            queueMessage = self.queueMessage
+            for client in clients:
+                queueMessage(client, data, coalesceKey)
+        else:
+            send = self.cw.send
+            for client in clients:
+                send(datagram, client.connection)
+            self.needsFlush.update(clients)
+
+        numClients = len(clients)
+        stats = self.sendStats.get(zoneId)
+        if stats is None:
+            stats = self.sendStats[zoneId] = [0, 0]
+        stats[0] += numClients
+        stats[1] += numClients * datagram.getLength()
+        return numClients
+
+    def getSendStats(self):
+        """ Returns a dictionary of zoneId -> (messagesPerSecond,
+        bytesPerSecond), the rate of messages and bytes sent to the
+        clients in each zone since resetSendStats() was last called.
+        Messages sent to all clients are counted under the zoneId
+        None. """
+
+        elapsed = max(globalClock.getRealTime() - self.sendStatsStartTime, 0.001)
+        rates = {}
+        for zoneId, (messages, bytes) in self.sendStats.items():
+            rates[zoneId] = (messages / elapsed, bytes / elapsed)
+        return rates
+
+    def resetSendStats(self):
+        self.sendStats = {}
+        self.sendStatsStartTime = globalClock.getRealTime()
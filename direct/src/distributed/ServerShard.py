@@ -0,0 +1,180 @@
+"""ServerShard module: contains the ServerShard class"""
+
+from pandac.PandaModules import *
+from direct.distributed.MsgTypesCMU import *
+from direct.task import Task
+from direct.directnotify import DirectNotifyGlobal
+from direct.distributed.PyDatagram import PyDatagram
+from direct.distributed.ServerRepository import ServerRepository
+
+
+class ServerShard(ServerRepository):
+
+    """ This is one worker process of a ShardedServerRepository.  It
+    owns the objects in its share of the zones, and does all of the
+    work of the ServerRepository for them, but it has no connections
+    to the clients: the ShardedServerRepository (the "front") forwards
+    the messages of each client to the shard owning the zone they are
+    about, and sends on the messages that the shard addresses to the
+    clients.
+
+    A shard is normally started by the front, as its own process:
+
+        python -m direct.distributed.ServerShard port [dcFile ...]
+    """
+
+    notify = DirectNotifyGlobal.directNotify.newCategory("ServerShard")
+
+    def __init__(self, tcpPort, serverAddress = None, dcFileNames = None,
+                 threadedNet = None):
+        # The connection to the front, once it has connected.
+        self.frontConnection = None
+        self.frontNeedsFlush = False
+
+        # The client on whose behalf the current message is handled.
+        self.currentClient = None
+
+        ServerRepository.__init__(self, tcpPort, serverAddress or '127.0.0.1',
+                                  dcFileNames = dcFileNames,
+                                  threadedNet = threadedNet)
+
+        # The front does the aggregating, for all of the shards.
+        self.setAggregateSends(False)
+
+    def flushTask(self, task):
+        if self.frontNeedsFlush:
+            self.frontNeedsFlush = False
+            self.frontConnection.flush()
+        return Task.again
+
+    def handleNewConnection(self, newConnection, netAddress):
+        """ The front has connected.  There is no Client for it; the
+        clients are announced by the front. """
+        if self.frontConnection:
+            self.notify.warning(
+                "Ignoring second connection from %s" % (netAddress))
+            self.qcm.closeConnection(newConnection)
+            return None
+
+        self.notify.info("Got front from %s" % (netAddress))
+        self.frontConnection = newConnection
+        self.qcr.addConnection(newConnection)
+        return None
+
+    def getDatagramClient(self, datagram):
+        return self.currentClient
+
+    def handleDatagram(self, datagram):
+        """ switching station for messages from the front """
+
+        if datagram.getConnection() != self.frontConnection:
+            self.notify.warning(
+                "Ignoring datagram from unknown connection %s" % (datagram.getConnection()))
+            return
+
+        dgi = DatagramIterator(datagram)
+        type = dgi.getUint16()
+
+        if type == SHARD_CLIENT_MESSAGE_CMU:
+            doIdBase = dgi.getUint32()
+            client = self.clientsByDoIdBase.get(doIdBase)
+            if not client:
+                self.notify.warning(
+                    "Ignoring message from unknown client %s" % (doIdBase))
+                return
+            self.currentClient = client
+            try:
+                ServerRepository.handleDatagram(self, Datagram(dgi.getRemainingBytes()))
+            finally:
+                self.currentClient = None
+        elif type == SHARD_CLIENT_CONNECT_CMU:
+            doIdBase = dgi.getUint32()
+            client = self.Client(None, None, doIdBase)
+            self.clientsByDoIdBase[doIdBase] = client
+        elif type == SHARD_OBJECT_LEAVE_CMU:
+            self.handleObjectLeave(dgi.getUint32())
+        else:
+            self.handleMessageType(type, dgi)
+
+    def handleObjectLeave(self, doId):
+        """ The object has moved into a zone of another shard, where
+        its owner will generate it again.  Disable it for the clients
+        watching its zone here, and forget it. """
+
+        owner = self.clientsByDoIdBase.get(self.getDoIdBase(doId))
+        object = owner and owner.objectsByDoId.get(doId)
+        if not object:
+            self.notify.warning("Ignoring object leave for %s: unknown" % (doId))
+            return
+
+        datagram = PyDatagram()
+        datagram.addUint16(OBJECT_DISABLE_CMU)
+        datagram.addUint32(doId)
+        self.sendToZoneExcept(object.zoneId, datagram, [owner])
+
+        self.objectsByZoneId[object.zoneId].remove(object)
+        if not self.objectsByZoneId[object.zoneId]:
+            del self.objectsByZoneId[object.zoneId]
+        owner.objectsByZoneId[object.zoneId].remove(object)
+        if not owner.objectsByZoneId[object.zoneId]:
+            del owner.objectsByZoneId[object.zoneId]
+        del owner.objectsByDoId[doId]
+        self.zoneSnapshots.pop(object.zoneId, None)
+
+        self.updateClientInterestZones(owner, [object.zoneId])
+
+    def forgetClient(self, client):
+        # The front owns the connection.
+        del self.clientsByDoIdBase[client.doIdBase]
+
+    def clientHardDisconnectTask(self, task):
+        """ The shard has no reason to go on without its front. """
+        if self.frontConnection and \
+           not self.qcr.isConnectionOk(self.frontConnection):
+            self.notify.info("Lost the front; shutting down.")
+            taskMgr.stop()
+        return Task.cont
+
+    def sendToClient(self, client, datagram, coalesceKey = None):
+        self.sendToClients(datagram, [client], None, None, coalesceKey)
+
+    def sendToClients(self, datagram, clients, exceptClients = None,
+                      zoneId = None, coalesceKey = None):
+        """ Asks the front to send the message to each of the
+        indicated clients, except for those in exceptClients. """
+
+        if exceptClients:
+            clients = set(clients).difference(exceptClients)
+        if not clients or not self.frontConnection:
+            return 0
+
+        dg = PyDatagram()
+        dg.addUint16(SHARD_SEND_CMU)
+        dg.addUint8(zoneId is not None)
+        dg.addUint32(zoneId or 0)
+        if coalesceKey is not None:
+            dg.addUint8(1)
+            dg.addUint32(coalesceKey[0])
+            dg.addUint16(coalesceKey[1])
+        else:
+            dg.addUint8(0)
+        dg.addUint32(len(clients))
+        for client in clients:
+            dg.addUint32(client.doIdBase)
+        dg.appendData(datagram.getMessage())
+
+        self.cw.send(dg, self.frontConnection)
+        self.frontNeedsFlush = True
+        return len(clients)
+
+
+if __name__ == '__main__':
+    import sys
+    # A shard is headless; don't open a window or the audio device.
+    loadPrcFileData('ServerShard',
+                    'window-type none\n'
+                    'audio-library-name null\n')
+    from direct.showbase.ShowBase import ShowBase
+    base = ShowBase(windowType = 'none')
+    ServerShard(int(sys.argv[1]), dcFileNames = sys.argv[2:] or None)
+    base.run()
@@ -0,0 +1,293 @@
+"""ShardedServerRepository module: contains the ShardedServerRepository class"""
+
+from pandac.PandaModules import *
+from direct.distributed.MsgTypesCMU import *
+from direct.task import Task
+from direct.directnotify import DirectNotifyGlobal
+from direct.distributed.PyDatagram import PyDatagram
+from direct.distributed.ServerRepository import ServerRepository
+import subprocess
+import sys
+import time
+
+
+class ShardedServerRepository(ServerRepository):
+
+    """ This is a ServerRepository that spreads the zones across
+    several worker processes, the ServerShards, so that one busy zone
+    does not hold up the rest.  This process, the "front", owns the
+    connections to the clients, and forwards each client message to
+    the shard that owns the zone the message is about; the shards
+    send their messages for the clients back through the front.  A
+    client's interest in zones of several shards is split up among
+    those shards.
+
+    The shards listen on localhost, on consecutive ports starting at
+    shardBasePort.  By default the front starts them itself; pass
+    spawnShards = False to start them some other way. """
+
+    notify = DirectNotifyGlobal.directNotify.newCategory("ShardedServerRepository")
+
+    def __init__(self, tcpPort, serverAddress = None,
+                 udpPort = None, dcFileNames = None,
+                 threadedNet = None, numShards = None,
+                 shardBasePort = None, spawnShards = True):
+        if numShards is None:
+            numShards = base.config.GetInt('server-num-shards', 2)
+        if shardBasePort is None:
+            shardBasePort = base.config.GetInt('server-shard-base-port', tcpPort + 1)
+
+        # The connections to the shards, indexed by shard number, and
+        # the reverse.
+        self.shardConnections = []
+        self.shardsByConnection = {}
+        self.shardsNeedFlush = set()
+        self.shardProcesses = []
+
+        # A dictionary of doId -> zoneId, for every object, so that
+        # the messages about it can be routed to its shard.
+        self.objectZones = {}
+
+        ServerRepository.__init__(self, tcpPort, serverAddress = serverAddress,
+                                  udpPort = udpPort, dcFileNames = dcFileNames,
+                                  threadedNet = threadedNet)
+
+        ports = [shardBasePort + i for i in range(numShards)]
+        if spawnShards:
+            for port in ports:
+                self.shardProcesses.append(self.spawnShard(port, dcFileNames))
+        for port in ports:
+            connection = self.connectToShard(port)
+            self.shardsByConnection[connection] = len(self.shardConnections)
+            self.shardConnections.append(connection)
+
+    def spawnShard(self, port, dcFileNames):
+        """ Starts a ServerShard process listening on the indicated
+        port, and returns its Popen object. """
+        args = [sys.executable, '-m', 'direct.distributed.ServerShard', str(port)]
+        if dcFileNames:
+            args += [str(dcFileName) for dcFileName in dcFileNames]
+        self.notify.info("Starting shard on port %s" % (port))
+        return subprocess.Popen(args)
+
+    def connectToShard(self, port, timeout = 10.0):
+        """ Opens the connection to the shard on the indicated port,
+        waiting up to timeout seconds for it to start listening. """
+        stopTime = time.time() + timeout
+        while True:
+            connection = self.qcm.openTCPClientConnection('127.0.0.1', port, 1000)
+            if connection:
+                self.qcr.addConnection(connection)
+                return connection
+            if time.time() >= stopTime:
+                self.notify.error("Could not connect to shard on port %s" % (port))
+            time.sleep(0.1)
+
+    def stopShards(self):
+        """ Closes the connections to the shards, which makes them shut
+        down, and waits for the processes this front started. """
+        for connection in self.shardConnections:
+            self.qcr.removeConnection(connection)
+            self.qcm.closeConnection(connection)
+        self.shardConnections = []
+        self.shardsByConnection = {}
+        for process in self.shardProcesses:
+            process.wait()
+        self.shardProcesses = []
+
+    def getShardForZone(self, zoneId):
+        """ Returns the number of the shard that owns the zone.  This
+        may be overridden to partition the zones differently; it must
+        always give the same answer for the same zone. """
+        return zoneId % len(self.shardConnections)
+
+    def flushTask(self, task):
+        flush = self.shardsNeedFlush
+        self.shardsNeedFlush = set()
+        for shard in flush:
+            self.shardConnections[shard].flush()
+
+        return ServerRepository.flushTask(self, task)
+
+    def sendToShard(self, shard, datagram):
+        self.cw.send(datagram, self.shardConnections[shard])
+        self.shardsNeedFlush.add(shard)
+
+    def forwardToShard(self, shard, client, datagram):
+        """ Passes the client's message on to the shard. """
+        dg = PyDatagram()
+        dg.addUint16(SHARD_CLIENT_MESSAGE_CMU)
+        dg.addUint32(client.doIdBase)
+        dg.appendData(datagram.getMessage())
+        self.sendToShard(shard, dg)
+
+    def handleNewConnection(self, newConnection, netAddress):
+        client = ServerRepository.handleNewConnection(self, newConnection, netAddress)
+
+        # The doIds of the objects the client has created.
+        client.objectDoIds = set()
+
+        # Every shard needs to know every client, for targeted
+        # updates.
+        dg = PyDatagram()
+        dg.addUint16(SHARD_CLIENT_CONNECT_CMU)
+        dg.addUint32(client.doIdBase)
+        for shard in range(len(self.shardConnections)):
+            self.sendToShard(shard, dg)
+        return client
+
+    def handleDatagram(self, datagram):
+        """ switching station for messages """
+
+        shard = self.shardsByConnection.get(datagram.getConnection())
+        if shard is not None:
+            self.handleShardDatagram(shard, datagram)
+            return
+
+        client = self.getDatagramClient(datagram)
+        if not client:
+            self.notify.warning(
+                "Ignoring datagram from unknown connection %s" % (datagram.getConnection()))
+            return
+
+        dgi = DatagramIterator(datagram)
+        type = dgi.getUint16()
+
+        if type == CLIENT_DISCONNECT_CMU:
+            self.handleClientDisconnect(client)
+        elif type == CLIENT_SET_INTEREST_CMU:
+            self.handleClientSetInterest(client, dgi)
+        elif type == CLIENT_OBJECT_GENERATE_CMU:
+            zoneId = dgi.getUint32()
+            classId = dgi.getUint16()
+            doId = dgi.getUint32()
+            self.routeObjectZone(client, doId, zoneId, datagram, True)
+        elif type == OBJECT_SET_ZONE_CMU:
+            doId = dgi.getUint32()
+            zoneId = dgi.getUint32()
+            self.routeObjectZone(client, doId, zoneId, datagram, False)
+        elif type == CLIENT_OBJECT_UPDATE_FIELD or \
+             type == CLIENT_OBJECT_UPDATE_FIELD_TARGETED_CMU:
+            if type == CLIENT_OBJECT_UPDATE_FIELD_TARGETED_CMU:
+                dgi.getUint32()
+            doId = dgi.getUint32()
+            zoneId = self.objectZones.get(doId)
+            if zoneId is None:
+                self.notify.warning(
+                    "Ignoring update for unknown object %s from client %s" % (
+                    doId, client.doIdBase))
+                return
+            self.forwardToShard(self.getShardForZone(zoneId), client, datagram)
+        elif type == OBJECT_DELETE_CMU:
+            doId = dgi.getUint32()
+            zoneId = self.objectZones.get(doId)
+            if zoneId is None or doId not in client.objectDoIds:
+                self.notify.warning(
+                    "Ignoring delete for unknown object %s from client %s" % (
+                    doId, client.doIdBase))
+                return
+            del self.objectZones[doId]
+            client.objectDoIds.remove(doId)
+            self.forwardToShard(self.getShardForZone(zoneId), client, datagram)
+        else:
+            self.handleMessageType(type, dgi)
+
+    def routeObjectZone(self, client, doId, zoneId, datagram, isGenerate):
+        """ Routes a generate or zone change for the object to the
+        shard owning its new zone.  If that is a different shard than
+        before, the old shard is told the object has left. """
+
+        if self.getDoIdBase(doId) != client.doIdBase:
+            self.notify.warning(
+                "Ignoring object %s from client %s: not owner" % (doId, client.doIdBase))
+            return
+
+        shard = self.getShardForZone(zoneId)
+        oldZoneId = self.objectZones.get(doId)
+        crossing = oldZoneId is not None and self.getShardForZone(oldZoneId) != shard
+        if crossing:
+            dg = PyDatagram()
+            dg.addUint16(SHARD_OBJECT_LEAVE_CMU)
+            dg.addUint32(doId)
+            self.sendToShard(self.getShardForZone(oldZoneId), dg)
+
+        self.objectZones[doId] = zoneId
+        client.objectDoIds.add(doId)
+
+        if isGenerate or not crossing:
+            # After a zone change to another shard, the object's owner
+            # sends a generate for it in the new zone, which creates
+            # it in the new shard.
+            self.forwardToShard(shard, client, datagram)
+
+    def handleClientSetInterest(self, client, dgi):
+        """ Splits the client's interest among the shards.  Each shard
+        is told of the zones it owns, even if there are none, so that
+        it can drop the client's earlier interest. """
+
+        zoneIds = set()
+        while dgi.getRemainingSize() > 0:
+            zoneIds.add(dgi.getUint32())
+        client.explicitInterestZoneIds = zoneIds
+
+        shardZoneIds = [[] for shard in self.shardConnections]
+        for zoneId in zoneIds:
+            shardZoneIds[self.getShardForZone(zoneId)].append(zoneId)
+
+        for shard, zoneIds in enumerate(shardZoneIds):
+            dg = PyDatagram()
+            dg.addUint16(CLIENT_SET_INTEREST_CMU)
+            for zoneId in zoneIds:
+                dg.addUint32(zoneId)
+            self.forwardToShard(shard, client, dg)
+
+    def handleClientDisconnect(self, client):
+        # Each shard deletes the client's objects in its zones.
+        dg = PyDatagram()
+        dg.addUint16(CLIENT_DISCONNECT_CMU)
+        for shard in range(len(self.shardConnections)):
+            self.forwardToShard(shard, client, dg)
+
+        for doId in client.objectDoIds:
+            self.objectZones.pop(doId, None)
+        client.objectDoIds = set()
+
+        client.sendQueue = []
+        client.sendQueueKeys = {}
+        client.queuedBytes = 0
+        self.clientsWithQueues.discard(client)
+
+        self.forgetClient(client)
+
+    def handleShardDatagram(self, shard, datagram):
+        """ A shard has sent us a message to pass on to some clients. """
+
+        dgi = DatagramIterator(datagram)
+        type = dgi.getUint16()
+        if type != SHARD_SEND_CMU:
+            self.handleMessageType(type, dgi)
+            return
+
+        hasZoneId = dgi.getUint8()
+        zoneId = dgi.getUint32()
+        if not hasZoneId:
+            zoneId = None
+        coalesceKey = None
+        if dgi.getUint8():
+            doId = dgi.getUint32()
+            coalesceKey = (doId, dgi.getUint16())
+
+        clients = set()
+        for i in range(dgi.getUint32()):
+            client = self.clientsByDoIdBase.get(dgi.getUint32())
+            if client:
+                clients.add(client)
+
+        self.sendToClients(Datagram(dgi.getRemainingBytes()), clients,
+                           None, zoneId, coalesceKey)
+
+    def clientHardDisconnectTask(self, task):
+        for connection, shard in self.shardsByConnection.items():
+            if not self.qcr.isConnectionOk(connection):
+                self.notify.error("Lost connection to shard %s" % (shard))
+        return ServerRepository.clientHardDisconnectTask(self, task)
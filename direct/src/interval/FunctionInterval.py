@@ -45,6 +45,10 @@ class FunctionInterval(Interval.Interval):
     # create FunctionInterval DirectNotify category
     notify = directNotify.newCategory('FunctionInterval')
 
+    # The pose intervals below store (nodePath, other, pos, hpr, scale)
+    # here, so they can be compiled into C++ intervals.
+    pose = None
+
     # Class methods
     def __init__(self, function, **kw):
         """__init__(function, name = None, openEnded = 1, extraArgs = [])
@@ -90,6 +94,27 @@ class FunctionInterval(Interval.Interval):
         self.notify.debug(
             'updateFunc() - %s: executing Function' % self.name)
 
+    def makeCInterval(self):
+        # A pose interval can be replaced by a zero-length lerp, which
+        # just sets the pose, unless something is listening for it.
+        # Unlike this interval, the lerp also sets the pose when it is
+        # played backwards past it.
+        if self.pose is None or self.doneEvent or self.setTHooks:
+            return None
+        nodePath, other, pos, hpr, scale = self.pose
+        if other is None:
+            other = NodePath()
+        ival = CLerpNodePathInterval(self.getName(), 0.0,
+                                     CLerpInterval.BTNoBlend, 1, 0,
+                                     nodePath, other)
+        if pos is not None:
+            ival.setEndPos(pos)
+        if hpr is not None:
+            ival.setEndHpr(hpr)
+        if scale is not None:
+            ival.setEndScale(scale)
+        return ival
+
 
 ### FunctionInterval subclass for throwing events ###
 class EventInterval(FunctionInterval):
@@ -186,6 +211,7 @@ class PosInterval(FunctionInterval):
             PosInterval.posIntervalNum += 1
         # Create function interval
         FunctionInterval.__init__(self, posFunc, name = name)
+        self.pose = (nodePath, other, pos, None, None)
 
 class HprInterval(FunctionInterval):
     # HprInterval counter
@@ -207,6 +233,7 @@ class HprInterval(FunctionInterval):
             HprInterval.hprIntervalNum += 1
         # Create function interval
         FunctionInterval.__init__(self, hprFunc, name = name)
+        self.pose = (nodePath, other, None, hpr, None)
 
 class ScaleInterval(FunctionInterval):
     # ScaleInterval counter
@@ -228,6 +255,7 @@ class ScaleInterval(FunctionInterval):
             ScaleInterval.scaleIntervalNum += 1
         # Create function interval
         FunctionInterval.__init__(self, scaleFunc, name = name)
+        self.pose = (nodePath, other, None, None, scale)
 
 class PosHprInterval(FunctionInterval):
     # PosHprInterval counter
@@ -249,6 +277,7 @@ class PosHprInterval(FunctionInterval):
             PosHprInterval.posHprIntervalNum += 1
         # Create function interval
         FunctionInterval.__init__(self, posHprFunc, name = name)
+        self.pose = (nodePath, other, pos, hpr, None)
 
 class HprScaleInterval(FunctionInterval):
     # HprScaleInterval counter
@@ -272,6 +301,7 @@ class HprScaleInterval(FunctionInterval):
             HprScaleInterval.hprScaleIntervalNum += 1
         # Create function interval
         FunctionInterval.__init__(self, hprScaleFunc, name = name)
+        self.pose = (nodePath, other, None, hpr, scale)
 
 class PosHprScaleInterval(FunctionInterval):
     # PosHprScaleInterval counter
@@ -295,6 +325,7 @@ class PosHprScaleInterval(FunctionInterval):
             PosHprScaleInterval.posHprScaleIntervalNum += 1
         # Create function interval
         FunctionInterval.__init__(self, posHprScaleFunc, name = name)
+        self.pose = (nodePath, other, pos, hpr, scale)
 
 
 
@@ -196,6 +196,14 @@ class Interval(DirectObject):
     def getDoneEvent(self):
         return self.doneEvent
 
+    def makeCInterval(self):
+        # Returns a new C++ interval that does exactly what this one
+        # does, or None if there is no such interval.  A MetaInterval
+        # may use it in place of this interval when the
+        # IntervalManager's native Python intervals are enabled.
+        # Subclasses may redefine this function.
+        return None
+
     def privDoEvent(self, t, event):
         if self.pstats:
             self.pstats.start()
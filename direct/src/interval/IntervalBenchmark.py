@@ -0,0 +1,83 @@
+"""Contains a timing benchmark for the IntervalManager, which plays
+many intervals at once, with and without native Python intervals (see
+IntervalManager.setNativePythonIntervals()).  Run this module directly
+to print the results, eg.:
+
+    python -m direct.interval.IntervalBenchmark
+"""
+
+__all__ = ['benchmarkIntervals']
+
+from panda3d.core import ClockObject, NodePath, Point3, Vec3
+from direct.task.TaskManagerGlobal import taskMgr
+from direct.interval.IntervalManager import ivalMgr
+from direct.interval.FunctionInterval import Func, PosInterval, HprInterval, ScaleInterval
+from direct.interval.LerpInterval import LerpPosInterval, LerpHprInterval
+from direct.interval.MetaInterval import Sequence
+from panda3d.direct import WaitInterval
+import time
+
+
+def _noop():
+    pass
+
+def _makeIntervals(root, numIntervals):
+    # Each interval is a short looping Sequence of lerps, pose
+    # intervals and a Func, as an NPC's idle cycle might be.  Only the
+    # pose intervals differ between the two modes.
+    ivals = []
+    for i in range(numIntervals):
+        np = root.attachNewNode('actor-%s' % (i))
+        ival = Sequence(
+            PosInterval(np, Point3(0, 0, 0)),
+            LerpPosInterval(np, 0.1, Point3(i, 0, 0)),
+            HprInterval(np, Vec3(0, 0, 0)),
+            WaitInterval(1.0 / 30.0),
+            ScaleInterval(np, 1.0),
+            LerpHprInterval(np, 0.1, Vec3(90, 0, 0)),
+            Func(_noop),
+            name = 'benchmarkSeq-%s' % (i))
+        ival.loop()
+        ivals.append(ival)
+    return ivals
+
+def benchmarkIntervals(numIntervals = 10000, numFrames = 60,
+                       nativePythonIntervals = False):
+    """Plays numIntervals concurrent intervals for numFrames frames of
+    1/60 second each.  Returns the average number of seconds spent per
+    frame in the IntervalManager and the TaskManager. """
+
+    clock = ClockObject.getGlobalClock()
+    saved = ivalMgr.getNativePythonIntervals()
+    savedMode = clock.getMode()
+    ivalMgr.setNativePythonIntervals(nativePythonIntervals)
+    clock.setMode(ClockObject.MSlave)
+    root = NodePath('benchmarkRoot')
+    try:
+        ivals = _makeIntervals(root, numIntervals)
+
+        total = 0.0
+        for frame in range(numFrames):
+            clock.setFrameTime(clock.getFrameTime() + 1.0 / 60.0)
+            t0 = time.time()
+            taskMgr.step()
+            ivalMgr.step()
+            total += time.time() - t0
+
+        for ival in ivals:
+            ival.pause()
+    finally:
+        root.removeNode()
+        clock.setMode(savedMode)
+        ivalMgr.setNativePythonIntervals(saved)
+
+    return total / numFrames
+
+if __name__ == '__main__':
+    numIntervals = 10000
+    # The first run pays for warming up, so don't count it.
+    benchmarkIntervals(numIntervals // 10, 10)
+    for nativePythonIntervals in (False, True):
+        perFrame = benchmarkIntervals(numIntervals, 240, nativePythonIntervals = nativePythonIntervals)
+        print('%s intervals (native Python intervals %s): %.2f ms per frame' % (
+            numIntervals, nativePythonIntervals, perFrame * 1000.0))
@@ -7,6 +7,7 @@ from panda3d.direct import *
 from direct.directnotify.DirectNotifyGlobal import *
 from direct.showbase import EventManager
 import fnmatch
+import bisect
 
 class IntervalManager(CIntervalManager):
 
@@ -15,6 +16,11 @@ class IntervalManager(CIntervalManager):
     # the Python extensions is to add support for Python-based
     # intervals (like MetaIntervals).
 
+    # Set this true to compile the Python intervals that have a C++
+    # equivalent when they are added to a MetaInterval.  See
+    # setNativePythonIntervals().
+    wantNativePythonIntervals = ConfigVariableBool('interval-native-python', False)
+
     def __init__(self, globalPtr = 0):
         # Pass globalPtr == 1 to the constructor to trick it into
         # "constructing" a Python wrapper around the global
@@ -30,17 +36,54 @@ class IntervalManager(CIntervalManager):
         self.setEventQueue(self.eventQueue)
         self.ivals = []
         self.removedIvals = {}
+        self.nativePythonIntervals = self.wantNativePythonIntervals.getValue()
+
+        # The names of the Python intervals on this manager, sorted
+        # when a lookup needs them sorted, so that a pattern with a
+        # constant prefix need only look at the names that begin with
+        # it.  The manager tells us when a Python interval is removed,
+        # but C++ intervals come and go without passing through here,
+        # so the index is used only while every interval on the
+        # manager is in it; otherwise a lookup checks every interval.
+        self.__names = set()
+        self.__sortedNames = None
+        self.__purgeSize = 64
+
+        # Maps each tag to a dictionary of name -> interval, and to
+        # the size at which that group is next purged of intervals
+        # that have stopped.  See tagInterval().
+        self.__tags = {}
+        self.__tagPurgeSizes = {}
+
+    def setNativePythonIntervals(self, flag):
+        """Enables or disables the compiling of Python intervals into
+        C++ intervals.  When it is enabled, the pose intervals
+        (PosInterval, HprInterval, ScaleInterval and their
+        combinations) are replaced by C++ lerps when they are added to
+        a MetaInterval, so that the MetaInterval need not call back
+        into Python for them.  The Lerp intervals and Wait are C++
+        intervals already, and a Func must always call Python.
+
+        MetaIntervals that have already been built are not
+        affected. """
+        self.nativePythonIntervals = flag
+
+    def getNativePythonIntervals(self):
+        return self.nativePythonIntervals
 
     def addInterval(self, interval):
         index = self.addCInterval(interval, 1)
         self.__storeInterval(interval, index)
+        self.__indexName(interval.getName())
 
     def removeInterval(self, interval):
-        index = self.findCInterval(interval.getName())
+        name = interval.getName()
+        index = self.findCInterval(name)
         if index >= 0:
             self.removeCInterval(index)
             if index < len(self.ivals):
                 self.ivals[index] = None
+            self.__unindexName(name)
             return 1
         return 0
 
@@ -54,12 +97,139 @@ class IntervalManager(CIntervalManager):
         return None
 
     def getIntervalsMatching(self, pattern):
+        """Returns the list of playing intervals whose names match the
+        indicated glob pattern, in the syntax of fnmatch. """
+        # The part of the pattern before the first wildcard must begin
+        # every matching name.
+        prefix = pattern
+        for char in '*?[':
+            i = prefix.find(char)
+            if i >= 0:
+                prefix = prefix[:i]
+
+        if prefix == pattern:
+            # There are no wildcards; it can only match one interval.
+            ival = self.getInterval(pattern)
+            if ival is None:
+                return []
+            return [ival]
+
+        if not prefix or len(self.__names) != self.getNumIntervals():
+            # Either every name must be checked anyway, or there are
+            # C++ intervals on the manager that the index can't see.
+            return self.__scanIntervalsMatching(pattern)
+
         ivals = []
+        stale = []
+        sortedNames = self.__sortedNames
+        if sortedNames is None:
+            sortedNames = sorted(self.__names)
+            self.__sortedNames = sortedNames
+        i = bisect.bisect_left(sortedNames, prefix)
+        while i < len(sortedNames) and sortedNames[i].startswith(prefix):
+            name = sortedNames[i]
+            if fnmatch.fnmatchcase(name, pattern):
+                ival = self.getInterval(name)
+                if ival is not None:
+                    ivals.append(ival)
+                else:
+                    # It has finished since it was indexed.
+                    stale.append(name)
+            i += 1
+
+        for name in stale:
+            self.__unindexName(name)
+        return ivals
+
+    def finishIntervalsMatching(self, pattern):
+        ivals = self.getIntervalsMatching(pattern)
+        for ival in ivals:
+            ival.finish()
+        self.__unindexIntervals(ivals)
+        return len(ivals)
+
+    def pauseIntervalsMatching(self, pattern):
+        ivals = self.getIntervalsMatching(pattern)
+        for ival in ivals:
+            ival.pause()
+        self.__unindexIntervals(ivals)
+        return len(ivals)
+
+    def tagInterval(self, interval, tag):
+        """Adds the interval to the group of intervals with the
+        indicated tag, which may be any hashable value, eg. an avatar's
+        doId.  The whole group can then be finished or paused at once
+        with finishIntervalsTagged() or pauseIntervalsTagged(), without
+        matching any names.  This works for Python Intervals as well as
+        for the intervals on this manager.
+
+        An interval leaves the group when it is untagged, or when it is
+        found to be no longer playing; so tag an interval after it has
+        been started. """
+        group = self.__tags.get(tag)
+        if group is None:
+            group = {}
+            self.__tags[tag] = group
+            self.__tagPurgeSizes[tag] = 64
+        elif len(group) >= self.__tagPurgeSizes[tag]:
+            self.__purgeGroup(tag, group)
+            self.__tags[tag] = group
+            self.__tagPurgeSizes[tag] = max(64, len(group) * 2)
+        group[interval.getName()] = interval
+
+    def untagInterval(self, interval, tag):
+        """Removes the interval from the group with the indicated tag.
+        Returns true if it was in the group, false otherwise. """
+        group = self.__tags.get(tag)
+        if group is None or group.get(interval.getName()) is not interval:
+            return 0
+        del group[interval.getName()]
+        if not group:
+            del self.__tags[tag]
+            del self.__tagPurgeSizes[tag]
+        return 1
+
+    def getIntervalsTagged(self, tag):
+        """Returns the list of playing intervals with the indicated
+        tag. """
+        group = self.__tags.get(tag)
+        if group is None:
+            return []
+        return self.__purgeGroup(tag, group)
+
+    def finishIntervalsTagged(self, tag):
+        ivals = self.getIntervalsTagged(tag)
+        self.__tags.pop(tag, None)
+        self.__tagPurgeSizes.pop(tag, None)
+        for ival in ivals:
+            ival.finish()
+        return len(ivals)
+
+    def pauseIntervalsTagged(self, tag):
+        ivals = self.getIntervalsTagged(tag)
+        self.__tags.pop(tag, None)
+        self.__tagPurgeSizes.pop(tag, None)
+        for ival in ivals:
+            ival.pause()
+        return len(ivals)
+
+    def getTags(self):
+        """Returns the list of tags that have intervals in their
+        group. """
+        return list(self.__tags.keys())
+
+    def __scanIntervalsMatching(self, pattern):
+        # Checks the name of every interval on the manager.  This also
+        # rebuilds the index from the Python intervals.
+        ivals = []
+        names = set()
 
         count = 0
         maxIndex = self.getMaxIndex()
         for index in range(maxIndex):
             ival = self.getCInterval(index)
+            if ival and index < len(self.ivals) and self.ivals[index]:
+                names.add(ival.getName())
             if ival and \
                fnmatch.fnmatchcase(ival.getName(), pattern):
                 # Finish and remove this interval.  Finishing it
@@ -72,19 +242,50 @@ class IntervalManager(CIntervalManager):
                     # Otherwise, it's a C-only interval.
                     ivals.append(ival)
 
+        self.__names = names
+        self.__sortedNames = None
+        self.__purgeSize = max(64, len(names) * 2)
         return ivals
 
-    def finishIntervalsMatching(self, pattern):
-        ivals = self.getIntervalsMatching(pattern)
-        for ival in ivals:
-            ival.finish()
-        return len(ivals)
+    def __indexName(self, name):
+        if name not in self.__names:
+            if len(self.__names) >= self.__purgeSize:
+                self.__purgeNames()
+            self.__names.add(name)
+            self.__sortedNames = None
 
-    def pauseIntervalsMatching(self, pattern):
-        ivals = self.getIntervalsMatching(pattern)
+    def __unindexName(self, name):
+        if name in self.__names:
+            self.__names.remove(name)
+            self.__sortedNames = None
+
+    def __unindexIntervals(self, ivals):
+        # Drops the names of the intervals that have just been stopped.
         for ival in ivals:
-            ival.pause()
-        return len(ivals)
+            name = ival.getName()
+            if self.findCInterval(name) < 0:
+                self.__unindexName(name)
+
+    def __purgeNames(self):
+        # Drops the names of all the intervals that have finished.
+        self.__names = set([name for name in self.__names
+                            if self.findCInterval(name) >= 0])
+        self.__sortedNames = None
+        self.__purgeSize = max(64, len(self.__names) * 2)
+
+    def __purgeGroup(self, tag, group):
+        # Drops the intervals that are no longer playing from the
+        # group, and returns the rest.
+        ivals = []
+        for name, ival in list(group.items()):
+            if ival.isPlaying():
+                ivals.append(ival)
+            else:
+                del group[name]
+        if not group:
+            del self.__tags[tag]
+            del self.__tagPurgeSizes[tag]
+        return ivals
 
     def step(self):
         # This method should be called once per frame to perform all
@@ -107,20 +308,27 @@ class IntervalManager(CIntervalManager):
         # It is important to call all of the python callbacks on the
         # just-removed intervals before we call any of the callbacks
         # on the still-running intervals.
-        index = self.getNextRemoval()
+        ivals = self.ivals
+        getNextRemoval = self.getNextRemoval
+        index = getNextRemoval()
         while index >= 0:
             # We have to clear the interval first before we call
             # privPostEvent() on it, because the interval might itself
             # try to add a new interval.
-            ival = self.ivals[index]
-            self.ivals[index] = None
+            ival = ivals[index]
+            ivals[index] = None
+            name = ival.getName()
+            if self.findCInterval(name) < 0:
+                # It wasn't replaced by another interval of the same name.
+                self.__unindexName(name)
             ival.privPostEvent()
-            index = self.getNextRemoval()
+            index = getNextRemoval()
 
-        index = self.getNextEvent()
+        getNextEvent = self.getNextEvent
+        index = getNextEvent()
         while index >= 0:
-            self.ivals[index].privPostEvent()
-            index = self.getNextEvent()
+            ivals[index].privPostEvent()
+            index = getNextEvent()
 
         # Finally, throw all the events on the custom event queue.
         # These are the done events that may have been generated in
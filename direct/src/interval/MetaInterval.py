@@ -324,13 +324,22 @@ class MetaInterval(CMetaInterval):
                 self.addCInterval(ival, relTime, relTo)
 
         elif isinstance(ival, Interval.Interval):
-            # It's a Python-style Interval, so add it as an external.
-            index = len(self.pythonIvals)
-            self.pythonIvals.append(ival)
-            if self.pstats:
-                ival.pstats = PStatCollector(self.pstats, ival.pname)
-            self.addExtIndex(index, ival.getName(), ival.getDuration(),
-                             ival.getOpenEnded(), relTime, relTo)
+            cival = None
+            if self.__manager.getNativePythonIntervals():
+                # It may have a C++ equivalent, which we can run
+                # without calling back into Python at all.
+                cival = ival.makeCInterval()
+
+            if cival is not None:
+                self.addCInterval(cival, relTime, relTo)
+            else:
+                # It's a Python-style Interval, so add it as an external.
+                index = len(self.pythonIvals)
+                self.pythonIvals.append(ival)
+                if self.pstats:
+                    ival.pstats = PStatCollector(self.pstats, ival.pname)
+                self.addExtIndex(index, ival.getName(), ival.getDuration(),
+                                 ival.getOpenEnded(), relTime, relTo)
 
         else:
             self.notify.error("Not an Interval: %s" % (ival,))
@@ -26,9 +26,18 @@ class DirectObject:
     def acceptOnce(self, event, method, extraArgs=[]):
         return messenger.accept(event, self, method, extraArgs, 0)
 
+    def acceptPattern(self, pattern, method, extraArgs=[]):
+        return messenger.acceptPattern(pattern, self, method, extraArgs, 1)
+
+    def acceptPatternOnce(self, pattern, method, extraArgs=[]):
+        return messenger.acceptPattern(pattern, self, method, extraArgs, 0)
+
     def ignore(self, event):
         return messenger.ignore(event, self)
 
+    def ignorePattern(self, pattern):
+        return messenger.ignorePattern(pattern, self)
+
     def ignoreAll(self):
         return messenger.ignoreAll(self)
 
@@ -86,7 +95,7 @@ class DirectObject:
         # if it's leaking, will notify user
 
         # make sure we're not still listening for messenger events
-        events = messenger.getAllAccepting(self)
+        events = messenger.getAllAccepting(self) + messenger.getAllAcceptingPatterns(self)
         # make sure we're not leaking tasks
         # TODO: include tasks that were added directly to the taskMgr
         tasks = []
@@ -7,7 +7,7 @@ from .MessengerGlobal import *
 from direct.directnotify.DirectNotifyGlobal import *
 from direct.task.TaskManagerGlobal import taskMgr
 from panda3d.core import PStatCollector, EventQueue, EventHandler
-from panda3d.core import ConfigVariableBool
+from panda3d.core import ConfigVariableBool, ConfigVariableList
 
 class EventManager:
 
@@ -26,6 +26,41 @@ class EventManager:
 
         self._wantPstats = ConfigVariableBool('pstats-eventmanager', False)
 
+        # Events of which only the last one in each batch is processed;
+        # see setCoalescedEvents().
+        coalesceList = ConfigVariableList('coalesce-event')
+        self._coalescedEvents = set([coalesceList.getStringValue(i)
+                                     for i in range(coalesceList.getNumValues())])
+        self.numCoalescedEvents = 0
+
+    def setCoalescedEvents(self, eventNames):
+        """
+        Specifies the names of C++ events, such as 'window-event', that
+        may be sent many times in one frame although only the latest
+        one matters.  Of the events with one of these names that are
+        drained from the queue together, only the last one is
+        processed, in the place of the first one, so that it keeps its
+        order relative to the other events; the others are dropped, and
+        counted in numCoalescedEvents.  Events are compared by name and by their
+        first parameter, if any, so that for instance a 'window-event'
+        is kept for each window.
+        """
+        self._coalescedEvents = set(eventNames)
+
+    def getCoalescedEvents(self):
+        return list(self._coalescedEvents)
+
+    def drainEvents(self):
+        """
+        Dequeue all the events currently on the C++ event queue, and
+        return them as a list
+        """
+        events = []
+        eventQueue = self.eventQueue
+        while not eventQueue.isQueueEmpty():
+            events.append(eventQueue.dequeueEvent())
+        return events
+
     def doEvents(self):
         """
         Process all the events on the C++ event queue
@@ -36,8 +71,66 @@ class EventManager:
             processFunc = self.processEventPstats
         else:
             processFunc = self.processEvent
+        # Events thrown while we process a batch are queued behind it,
+        # so they are still handled in the order they were thrown.
         while (not self.eventQueue.isQueueEmpty()):
-            processFunc(self.eventQueue.dequeueEvent())
+            events = self.drainEvents()
+            if self._coalescedEvents:
+                events = self.__coalesceEvents(events)
+            i = 0
+            try:
+                while i < len(events):
+                    event = events[i]
+                    i += 1
+                    processFunc(event)
+            finally:
+                if i < len(events):
+                    # A handler raised an exception.  Put the rest of
+                    # the batch back on the queue, ahead of the events
+                    # thrown since, as if it had never been drained.
+                    self.__requeueEvents(events[i:])
+
+    def __requeueEvents(self, events):
+        eventQueue = self.eventQueue
+        newEvents = self.drainEvents()
+        for event in events + newEvents:
+            eventQueue.queueEvent(event)
+
+    def __coalesceEvents(self, events):
+        """
+        Remove all but the last of each coalesced event from the batch
+        """
+        coalescedEvents = self._coalescedEvents
+        firstIndex = {}
+        result = []
+        for event in events:
+            key = self.__getCoalesceKey(event, coalescedEvents)
+            if key is None:
+                result.append(event)
+            elif key in firstIndex:
+                # The later event replaces the earlier one, in its
+                # place in the batch.
+                result[firstIndex[key]] = event
+            else:
+                firstIndex[key] = len(result)
+                result.append(event)
+        self.numCoalescedEvents += len(events) - len(result)
+        return result
+
+    def __getCoalesceKey(self, event, coalescedEvents):
+        # Returns the key by which the event is coalesced with others,
+        # or None if it isn't.
+        name = event.getName()
+        if name not in coalescedEvents:
+            return None
+        if event.getNumParameters() == 0:
+            return (name,)
+        key = (name, self.parseEventParameter(event.getParameter(0)))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
 
     def eventLoopTask(self, task):
         """
@@ -79,13 +172,19 @@ class EventManager:
         # Get the event name
         eventName = event.getName()
         if eventName:
+            # Don't bother converting the parameters if no one in
+            # Python is listening, unless the event is to be logged.
+            debug = EventManager.notify.getDebug()
+            wantSend = debug or messenger.isLogging() or \
+                       messenger.hasListeners(eventName)
             paramList = []
-            for i in range(event.getNumParameters()):
-                eventParameter = event.getParameter(i)
-                eventParameterData = self.parseEventParameter(eventParameter)
-                paramList.append(eventParameterData)
+            if wantSend:
+                for i in range(event.getNumParameters()):
+                    eventParameter = event.getParameter(i)
+                    eventParameterData = self.parseEventParameter(eventParameter)
+                    paramList.append(eventParameterData)
             # Do not print the new frame debug, it is too noisy!
-            if (EventManager.notify.getDebug() and eventName != 'NewFrame'):
+            if (debug and eventName != 'NewFrame'):
                 EventManager.notify.debug('received C++ event named: ' + eventName +
                                           ' parameters: ' + repr(paramList))
             # **************************************************************
@@ -95,7 +194,7 @@ class EventManager:
             # name as a parameter, but now you can use extraArgs for that
             if paramList:
                 messenger.send(eventName, paramList)
-            else:
+            elif wantSend:
                 messenger.send(eventName)
             # Also send the event down into C++ land
             if self.eventHandler:
@@ -116,13 +215,19 @@ class EventManager:
         # Get the event name
         eventName = event.getName()
         if eventName:
+            # Don't bother converting the parameters if no one in
+            # Python is listening, unless the event is to be logged.
+            debug = EventManager.notify.getDebug()
+            wantSend = debug or messenger.isLogging() or \
+                       messenger.hasListeners(eventName)
             paramList = []
-            for i in range(event.getNumParameters()):
-                eventParameter = event.getParameter(i)
-                eventParameterData = self.parseEventParameter(eventParameter)
-                paramList.append(eventParameterData)
+            if wantSend:
+                for i in range(event.getNumParameters()):
+                    eventParameter = event.getParameter(i)
+                    eventParameterData = self.parseEventParameter(eventParameter)
+                    paramList.append(eventParameterData)
             # Do not print the new frame debug, it is too noisy!
-            if (EventManager.notify.getDebug() and eventName != 'NewFrame'):
+            if (debug and eventName != 'NewFrame'):
                 EventManager.notify.debug('received C++ event named: ' + eventName +
                                           ' parameters: ' + repr(paramList))
             # Send the event, we used to send it with the event
@@ -143,7 +248,7 @@ class EventManager:
 
             if paramList:
                 messenger.send(eventName, paramList)
-            else:
+            elif wantSend:
                 messenger.send(eventName)
             # Also send the event down into C++ land
             if self.eventHandler:
@@ -6,6 +6,10 @@ from panda3d.core import *
 from panda3d.core import Loader as PandaLoader
 from direct.directnotify.DirectNotifyGlobal import *
 from direct.showbase.DirectObject import DirectObject
+from direct.task.TaskManagerGlobal import taskMgr
+import heapq
+import traceback
+import os
 
 # You can specify a phaseChecker callback to check
 # a modelPath to see if it is being loaded in the correct
@@ -20,6 +24,21 @@ class Loader(DirectObject):
     notify = directNotify.newCategory("Loader")
     loaderIndex = 0
 
+    # If this is true, asynchronous loadModel() calls for a model that
+    # is already being loaded in the background share the request in
+    # flight, rather than loading the same file again.
+    coalesceRequests = ConfigVariableBool('loader-coalesce-requests', True)
+
+    # The number of seconds per frame to spend calling back the
+    # asynchronous requests that have finished, or -1 for no limit.
+    # See setCompletionBudget().
+    completionBudget = ConfigVariableDouble('loader-completion-budget', -1)
+
+    # The file in which the assets loaded in each scene are recorded,
+    # to be prefetched the next time the scene is entered.  See
+    # enterScene().  If this is empty, the manifest is not saved.
+    prefetchManifest = ConfigVariableFilename('loader-prefetch-manifest', '')
+
     class Callback:
         def __init__(self, numObjects, gotList, callback, extraArgs):
             self.objects = [None] * numObjects
@@ -30,6 +49,10 @@ class Loader(DirectObject):
             self.cancelled = False
             self.requests = set()
 
+            # This is cleared for a caller that only wants the model in
+            # the ModelPool, and not a copy of its own.
+            self.wantsObjects = True
+
         def gotObject(self, index, object):
             self.objects[index] = object
             self.numRemaining -= 1
@@ -40,19 +63,102 @@ class Loader(DirectObject):
                 else:
                     self.callback(*(self.objects + self.extraArgs))
 
+    class Prefetch:
+        """ Tracks the assets that are being prefetched for one visit
+        to a scene, and which of them are then actually requested. """
+
+        def __init__(self, sceneName, assets, callback, extraArgs):
+            self.sceneName = sceneName
+            self.assets = assets
+            self.callback = callback
+            self.extraArgs = extraArgs
+            self.cancelled = False
+
+            # The (kind, path) pairs still loading, already loaded,
+            # and requested by the application.
+            self.pending = set(assets)
+            self.done = set()
+            self.requested = set()
+
+            # The Callbacks of the loads in flight.
+            self.cbs = []
+
+            self.hits = 0
+            self.late = 0
+            self.misses = 0
+
+        def gotAsset(self, key):
+            self.pending.discard(key)
+            self.done.add(key)
+            if not self.pending:
+                self.finish()
+
+        def finish(self):
+            if self.callback is not None:
+                callback = self.callback
+                self.callback = None
+                callback(*self.extraArgs)
+
+        def getStats(self):
+            return {
+                'scene': self.sceneName,
+                'assets': len(self.assets),
+                'prefetched': len(self.done),
+                'hits': self.hits,
+                'late': self.late,
+                'misses': self.misses,
+                'unused': len(set(self.assets) - self.requested),
+                }
+
     # special methods
     def __init__(self, base):
         self.base = base
         self.loader = PandaLoader.getGlobalPtr()
 
+        # Each asynchronous request in flight, mapped to the list of
+        # (Callback, index) pairs that are waiting for it.
         self.__requests = {}
 
+        # The model load requests in flight, keyed by filename and
+        # options, so that they may be shared.
+        self.__pendingLoads = {}
+
+        self.coalesceRequests = Loader.coalesceRequests.getValue()
+        self.completionBudget = Loader.completionBudget.getValue()
+
+        # The requests that have finished but have not been called back
+        # yet, because of the completion budget.  This is a heap of
+        # (-priority, sequence, request).
+        self.__completed = []
+        self.__completedSeq = 0
+        self.__completionFrame = None
+        self.__completionTime = 0.0
+        self.__numCompletions = 0
+
+        # The scene manifest: a dictionary of scene names to lists of
+        # (kind, path) pairs.  It is read when it is first needed.
+        self.__manifest = None
+        self.manifestFilename = Loader.prefetchManifest.getValue()
+
+        # The scene that has been entered, the assets loaded in it so
+        # far, and its Prefetch.
+        self.__sceneName = None
+        self.__sceneAssets = []
+        self.__sceneAssetSet = set()
+        self.__prefetch = None
+        self.__lastPrefetch = None
+        self.__prefetching = False
+
         self.hook = "async_loader_%s" % (Loader.loaderIndex)
+        self.completionTaskName = self.hook + "-completions"
         Loader.loaderIndex += 1
         self.accept(self.hook, self.__gotAsyncObject)
 
     def destroy(self):
         self.ignore(self.hook)
+        self.__cancelPrefetch()
+        taskMgr.remove(self.completionTaskName)
+        self.__completed = []
         self.loader.stopThreads()
         del self.base
         del self.loader
@@ -108,6 +214,14 @@ class Loader(DirectObject):
         over this model over all of the other asynchronous load
         requests (higher numbers are loaded first).
 
+        Asynchronous requests for a model that is already being loaded
+        in the background, with the same options, share the load in
+        flight; each caller still receives its own copy of the model
+        (unless allowInstance is True).  If the new request has a
+        higher priority, the priority of the shared load is raised.
+        This may be disabled with the loader-coalesce-requests config
+        variable.
+
         True asynchronous model loading requires Panda to have been
         compiled with threading support enabled (you can test
         Thread.isThreadingSupported()).  In the absence of threading
@@ -152,6 +266,10 @@ class Loader(DirectObject):
             modelList = modelPath
             gotList = True
 
+        if self.__sceneName is not None and not self.__prefetching:
+            for modelPath in modelList:
+                self.__noteAsset('model', modelPath)
+
         if callback is None:
             # We got no callback, so it's a synchronous load.
 
@@ -183,16 +301,78 @@ class Loader(DirectObject):
             cb = Loader.Callback(len(modelList), gotList, callback, extraArgs)
             i = 0
             for modelPath in modelList:
-                request = self.loader.makeAsyncRequest(Filename(modelPath), loaderOptions)
-                if priority is not None:
-                    request.setPriority(priority)
-                request.setDoneEvent(self.hook)
-                self.loader.loadAsync(request)
-                cb.requests.add(request)
-                self.__requests[request] = (cb, i)
+                filename = Filename(modelPath)
+                request = None
+                if self.coalesceRequests:
+                    key = self.__getLoadKey(filename, loaderOptions)
+                    request = self.__pendingLoads.get(key)
+
+                if request is not None:
+                    # This model is already being loaded; wait for
+                    # that request too.  It may be a prefetch, which
+                    # has a negative priority, so raise it to ours,
+                    # which is 0 by default.
+                    effective = 0 if priority is None else priority
+                    if effective > request.getPriority():
+                        request.setPriority(effective)
+                else:
+                    request = self.loader.makeAsyncRequest(filename, loaderOptions)
+                    if priority is not None:
+                        request.setPriority(priority)
+                    request.setDoneEvent(self.hook)
+                    self.loader.loadAsync(request)
+                    if self.coalesceRequests:
+                        self.__pendingLoads[key] = request
+
+                self.__addRequest(request, cb, i)
                 i += 1
             return cb
 
+    def __loadAsync(self, loadFunc, args, callback, extraArgs, priority):
+        # Calls loadFunc(*args) on the loader's task chain, in a
+        # sub-thread if threading is available, as a request that is
+        # tracked and called back in the same way as a model load.
+        # This is for the assets that have no request of their own in
+        # the C++ loader.
+        cb = Loader.Callback(1, False, callback, extraArgs)
+        request = PythonTask(self.__runLoadRequest, 'loadAsync-%s' % (args[0],))
+        request.setArgs([loadFunc, args], True)
+        if priority is not None:
+            request.setPriority(priority)
+        request.setDoneEvent(self.hook)
+        self.loader.loadAsync(request)
+        self.__addRequest(request, cb, 0)
+        return cb
+
+    def __runLoadRequest(self, loadFunc, args, task):
+        # An exception can't reach the caller from the loader thread,
+        # so it is logged, and the callback gets None.
+        task.loadedObject = None
+        try:
+            task.loadedObject = loadFunc(*args)
+        except Exception:
+            self.notify.warning("Could not load %s:\n%s" % (
+                args[0], traceback.format_exc()))
+        return task.done
+
+    def __getLoadKey(self, filename, loaderOptions):
+        # Two model loads may share a request only if they load the
+        # same file in the same way.
+        return (str(filename), loaderOptions.getFlags(),
+                loaderOptions.getTextureFlags())
+
+    def __addRequest(self, request, cb, i):
+        cb.requests.add(request)
+        self.__requests.setdefault(request, []).append((cb, i))
+
+    def __forgetPendingLoad(self, request):
+        # Stops sharing the indicated model load request with new
+        # callers.
+        if hasattr(request, "getModel"):
+            key = self.__getLoadKey(request.getFilename(), request.getOptions())
+            if self.__pendingLoads.get(key) is request:
+                del self.__pendingLoads[key]
+
     def cancelRequest(self, cb):
         """Cancels an aysynchronous loading or flatten request issued
         earlier.  The callback associated with the request will not be
@@ -201,10 +381,30 @@ class Loader(DirectObject):
         if not cb.cancelled:
             cb.cancelled = True
             for request in cb.requests:
-                self.loader.remove(request)
-                del self.__requests[request]
+                waiters = self.__requests.get(request)
+                if waiters is None:
+                    continue
+
+                # The request may be shared with other callers; only
+                # remove it if no one else is waiting for it.
+                waiters[:] = [waiter for waiter in waiters if waiter[0] is not cb]
+                if not waiters:
+                    del self.__requests[request]
+                    self.__forgetPendingLoad(request)
+                    self.loader.remove(request)
             cb.requests = None
 
+    def setRequestPriority(self, cb, priority):
+        """Raises the priority of an asynchronous loading request
+        issued earlier, if it is still pending, to the indicated
+        priority.  Since requests may be shared with other callers,
+        this never lowers the priority. """
+
+        if cb.requests:
+            for request in cb.requests:
+                if priority > request.getPriority():
+                    request.setPriority(priority)
+
     def isRequestPending(self, cb):
         """ Returns true if an asynchronous loading or flatten request
         issued earlier is still pending, or false if it has completed or
@@ -352,8 +552,7 @@ class Loader(DirectObject):
                     request.setPriority(priority)
                 request.setDoneEvent(self.hook)
                 self.loader.saveAsync(request)
-                cb.requests.add(request)
-                self.__requests[request] = (cb, i)
+                self.__addRequest(request, cb, i)
                 i += 1
             return cb
 
@@ -557,7 +756,8 @@ class Loader(DirectObject):
                     readMipmaps = False, okMissing = False,
                     minfilter = None, magfilter = None,
                     anisotropicDegree = None, loaderOptions = None,
-                    multiview = None):
+                    multiview = None, callback = None, extraArgs = [],
+                    priority = None):
         """
         texturePath is a string.
 
@@ -598,6 +798,17 @@ class Loader(DirectObject):
         hash character ('#') that will be replaced with '0' for the
         left image and '1' for the right image.  Larger numbers are
         also allowed if you need more than two views.
+
+        If callback is not None, then the texture is loaded
+        asynchronously, just as in loadModel(): loadTexture() returns
+        immediately, with an object that may be passed to
+        cancelRequest(), and the callback is later invoked with the
+        texture, followed by extraArgs.  An asynchronous load always
+        behaves as if okMissing were True: the texture is None if it
+        could not be loaded, and the error is logged rather than
+        raised.  priority is the relative importance of the request,
+        as in loadModel().  The same applies to the other texture,
+        sound and shader loading functions.
         """
         if loaderOptions is None:
             loaderOptions = LoaderOptions()
@@ -611,6 +822,20 @@ class Loader(DirectObject):
                 flags &= ~LoaderOptions.TFMultiview
             loaderOptions.setTextureFlags(flags)
 
+        if self.__sceneName is not None and alphaPath is None and not readMipmaps \
+           and not self.__prefetching:
+            self.__noteAsset('texture', texturePath)
+
+        args = [texturePath, alphaPath, readMipmaps, okMissing,
+                minfilter, magfilter, anisotropicDegree, loaderOptions]
+        if callback is not None:
+            args[3] = True
+            return self.__loadAsync(self.__loadTexture, args,
+                                    callback, extraArgs, priority)
+        return self.__loadTexture(*args)
+
+    def __loadTexture(self, texturePath, alphaPath, readMipmaps, okMissing,
+                      minfilter, magfilter, anisotropicDegree, loaderOptions):
         if alphaPath is None:
             assert Loader.notify.debug("Loading texture: %s" % (texturePath))
             texture = TexturePool.loadTexture(texturePath, 0, readMipmaps, loaderOptions)
@@ -621,18 +846,20 @@ class Loader(DirectObject):
             message = 'Could not load texture: %s' % (texturePath)
             raise IOError(message)
 
-        if minfilter is not None:
-            texture.setMinfilter(minfilter)
-        if magfilter is not None:
-            texture.setMagfilter(magfilter)
-        if anisotropicDegree is not None:
-            texture.setAnisotropicDegree(anisotropicDegree)
+        if texture:
+            if minfilter is not None:
+                texture.setMinfilter(minfilter)
+            if magfilter is not None:
+                texture.setMagfilter(magfilter)
+            if anisotropicDegree is not None:
+                texture.setAnisotropicDegree(anisotropicDegree)
 
         return texture
 
     def load3DTexture(self, texturePattern, readMipmaps = False, okMissing = False,
                       minfilter = None, magfilter = None, anisotropicDegree = None,
-                      loaderOptions = None, multiview = None, numViews = 2):
+                      loaderOptions = None, multiview = None, numViews = 2,
+                      callback = None, extraArgs = [], priority = None):
         """
         texturePattern is a string that contains a sequence of one or
         more hash characters ('#'), which will be filled in with the
@@ -659,6 +886,12 @@ class Loader(DirectObject):
         numbered 0 - 7 will be part of the left eye view, and images
         numbered 8 - 15 will be part of the right eye view.
         """
+        if callback is not None:
+            return self.__loadAsync(self.load3DTexture, [
+                texturePattern, readMipmaps, True, minfilter, magfilter,
+                anisotropicDegree, loaderOptions, multiview, numViews],
+                callback, extraArgs, priority)
+
         assert Loader.notify.debug("Loading 3-D texture: %s" % (texturePattern))
         if loaderOptions is None:
             loaderOptions = LoaderOptions()
@@ -678,18 +911,20 @@ class Loader(DirectObject):
             message = 'Could not load 3-D texture: %s' % (texturePattern)
             raise IOError(message)
 
-        if minfilter is not None:
-            texture.setMinfilter(minfilter)
-        if magfilter is not None:
-            texture.setMagfilter(magfilter)
-        if anisotropicDegree is not None:
-            texture.setAnisotropicDegree(anisotropicDegree)
+        if texture:
+            if minfilter is not None:
+                texture.setMinfilter(minfilter)
+            if magfilter is not None:
+                texture.setMagfilter(magfilter)
+            if anisotropicDegree is not None:
+                texture.setAnisotropicDegree(anisotropicDegree)
 
         return texture
 
     def load2DTextureArray(self, texturePattern, readMipmaps = False, okMissing = False,
                       minfilter = None, magfilter = None, anisotropicDegree = None,
-                      loaderOptions = None, multiview = None, numViews = 2):
+                      loaderOptions = None, multiview = None, numViews = 2,
+                      callback = None, extraArgs = [], priority = None):
         """
         texturePattern is a string that contains a sequence of one or
         more hash characters ('#'), which will be filled in with the
@@ -716,6 +951,12 @@ class Loader(DirectObject):
         numbered 0 - 7 will be part of the left eye view, and images
         numbered 8 - 15 will be part of the right eye view.
         """
+        if callback is not None:
+            return self.__loadAsync(self.load2DTextureArray, [
+                texturePattern, readMipmaps, True, minfilter, magfilter,
+                anisotropicDegree, loaderOptions, multiview, numViews],
+                callback, extraArgs, priority)
+
         assert Loader.notify.debug("Loading 2-D texture array: %s" % (texturePattern))
         if loaderOptions is None:
             loaderOptions = LoaderOptions()
@@ -735,18 +976,20 @@ class Loader(DirectObject):
             message = 'Could not load 2-D texture array: %s' % (texturePattern)
             raise IOError(message)
 
-        if minfilter is not None:
-            texture.setMinfilter(minfilter)
-        if magfilter is not None:
-            texture.setMagfilter(magfilter)
-        if anisotropicDegree is not None:
-            texture.setAnisotropicDegree(anisotropicDegree)
+        if texture:
+            if minfilter is not None:
+                texture.setMinfilter(minfilter)
+            if magfilter is not None:
+                texture.setMagfilter(magfilter)
+            if anisotropicDegree is not None:
+                texture.setAnisotropicDegree(anisotropicDegree)
 
         return texture
 
     def loadCubeMap(self, texturePattern, readMipmaps = False, okMissing = False,
                     minfilter = None, magfilter = None, anisotropicDegree = None,
-                    loaderOptions = None, multiview = None):
+                    loaderOptions = None, multiview = None,
+                    callback = None, extraArgs = [], priority = None):
         """
         texturePattern is a string that contains a sequence of one or
         more hash characters ('#'), which will be filled in with the
@@ -770,6 +1013,12 @@ class Loader(DirectObject):
         the number of images found on disk must be a multiple of six,
         and each six images will define a new view.
         """
+        if callback is not None:
+            return self.__loadAsync(self.loadCubeMap, [
+                texturePattern, readMipmaps, True, minfilter, magfilter,
+                anisotropicDegree, loaderOptions, multiview],
+                callback, extraArgs, priority)
+
         assert Loader.notify.debug("Loading cube map: %s" % (texturePattern))
         if loaderOptions is None:
             loaderOptions = LoaderOptions()
@@ -788,12 +1037,13 @@ class Loader(DirectObject):
             message = 'Could not load cube map: %s' % (texturePattern)
             raise IOError(message)
 
-        if minfilter is not None:
-            texture.setMinfilter(minfilter)
-        if magfilter is not None:
-            texture.setMagfilter(magfilter)
-        if anisotropicDegree is not None:
-            texture.setAnisotropicDegree(anisotropicDegree)
+        if texture:
+            if minfilter is not None:
+                texture.setMinfilter(minfilter)
+            if magfilter is not None:
+                texture.setMagfilter(magfilter)
+            if anisotropicDegree is not None:
+                texture.setAnisotropicDegree(anisotropicDegree)
 
         return texture
 
@@ -842,14 +1092,14 @@ class Loader(DirectObject):
             return None
 
     def loadSound(self, manager, soundPath, positional = False,
-                  callback = None, extraArgs = []):
+                  callback = None, extraArgs = [], priority = None):
 
         """Loads one or more sound files, specifying the particular
         AudioManager that should be used to load them.  The soundPath
         may be either a single filename, or a list of filenames.  If a
         callback is specified, the loading happens in the background,
-        just as in loadModel(); otherwise, the loading happens before
-        loadSound() returns."""
+        just as in loadModel(), with the indicated priority; otherwise,
+        the loading happens before loadSound() returns."""
 
         if not isinstance(soundPath, (MovieAudio, tuple, list, set)):
             # We were given a single sound pathname.
@@ -883,10 +1133,11 @@ class Loader(DirectObject):
             cb = Loader.Callback(len(soundList), gotList, callback, extraArgs)
             for i, soundPath in enumerate(soundList):
                 request = AudioLoadRequest(manager, soundPath, positional)
+                if priority is not None:
+                    request.setPriority(priority)
                 request.setDoneEvent(self.hook)
                 self.loader.loadAsync(request)
-                cb.requests.add(request)
-                self.__requests[request] = (cb, i)
+                self.__addRequest(request, cb, i)
             return cb
 
     def unloadSfx(self, sfx):
@@ -903,7 +1154,15 @@ class Loader(DirectObject):
 ##             nodeCount += 1
 ##             self.makeNodeNamesUnique(nodePath.getChild(i), nodeCount)
 
-    def loadShader(self, shaderPath, okMissing = False):
+    def loadShader(self, shaderPath, okMissing = False,
+                   callback = None, extraArgs = [], priority = None):
+        """Loads a shader from the indicated file, through the
+        ShaderPool.  If callback is not None, the shader is loaded
+        asynchronously, as in loadTexture(). """
+        if callback is not None:
+            return self.__loadAsync(self.loadShader, [shaderPath, True],
+                                    callback, extraArgs, priority)
+
         shader = ShaderPool.loadShader (shaderPath)
         if not shader and not okMissing:
             message = 'Could not load shader file: %s' % (shaderPath)
@@ -950,8 +1209,7 @@ class Loader(DirectObject):
             request = ModelFlattenRequest(model.node())
             request.setDoneEvent(self.hook)
             self.loader.loadAsync(request)
-            cb.requests.add(request)
-            self.__requests[request] = (cb, i)
+            self.__addRequest(request, cb, i)
             i += 1
         return cb
 
@@ -974,6 +1232,251 @@ class Loader(DirectObject):
             else:
                 callback(*(origModelList + extraArgs))
 
+    def enterScene(self, sceneName, callback = None, extraArgs = [],
+                   priority = -1):
+        """Indicates that the application is entering the named scene
+        (or zone, or level).  The models and textures that were loaded
+        the last time the scene was entered, according to the
+        manifest, are prefetched in the background, in the order they
+        were first loaded then, so that they are already in the
+        ModelPool and TexturePool when they are requested.  They are
+        loaded as asynchronous loadModel() and loadTexture() requests
+        with the indicated priority, or lower, so they yield to the
+        application's own requests, which have priority 0 by default.
+
+        The models are requested with the default loader options, so
+        that if coalesceRequests is set, an application loadModel()
+        of the same file with default options shares the prefetch's
+        request while it is still in flight, and raises it to its own
+        priority, 0 if none is given.  (A model in the manifest
+        that no longer exists is therefore reported as an error.)
+        Textures have no requests to share; a texture requested while
+        it is still being prefetched is loaded again, and the
+        TexturePool keeps whichever finishes first.
+
+        If callback is not None, it is called with extraArgs once all
+        of the assets have been prefetched (or immediately, if there
+        is nothing to prefetch), so that the scene change may wait for
+        it.
+
+        From now until exitScene(), each model and texture that is
+        loaded is recorded, and counted as a hit if it had already
+        been prefetched; see getPrefetchStats().  Returns the Prefetch
+        object. """
+
+        if self.__sceneName is not None:
+            self.exitScene()
+
+        self.__sceneName = sceneName
+        self.__sceneAssets = []
+        self.__sceneAssetSet = set()
+
+        assets = self.getSceneAssets(sceneName)
+        prefetch = Loader.Prefetch(sceneName, assets, callback, extraArgs)
+        self.__prefetch = prefetch
+        if not assets:
+            prefetch.finish()
+            return prefetch
+
+        self.notify.info("Prefetching %s assets for %s" % (len(assets), sceneName))
+        self.__prefetching = True
+        try:
+            for kind, path in assets:
+                if kind == 'model':
+                    cb = self.loadModel(path,
+                                        callback = self.__gotPrefetchAsset,
+                                        extraArgs = [prefetch, (kind, path)],
+                                        priority = priority)
+                    cb.wantsObjects = False
+                else:
+                    cb = self.loadTexture(path, okMissing = True,
+                                          callback = self.__gotPrefetchAsset,
+                                          extraArgs = [prefetch, (kind, path)],
+                                          priority = priority)
+                prefetch.cbs.append(cb)
+                priority -= 1
+        finally:
+            self.__prefetching = False
+
+        return prefetch
+
+    def exitScene(self):
+        """Indicates that the application is leaving the scene that
+        was entered with enterScene().  Any prefetching still in
+        progress is cancelled.  The assets that were loaded in the
+        scene replace the scene's entry in the manifest, which is
+        saved to the manifest file, if there is one.  Returns the
+        prefetch statistics for the visit. """
+
+        if self.__sceneName is None:
+            return None
+
+        prefetch = self.__prefetch
+        self.__cancelPrefetch()
+        self.__lastPrefetch = prefetch
+
+        manifest = self.__getManifest()
+        if self.__sceneAssets:
+            manifest[self.__sceneName] = self.__sceneAssets
+        self.__sceneName = None
+        self.__sceneAssets = []
+        self.__sceneAssetSet = set()
+
+        if not self.manifestFilename.empty():
+            self.writeManifest()
+
+        stats = prefetch.getStats()
+        self.notify.info("Prefetch stats for %s: %s" % (prefetch.sceneName, stats))
+        return stats
+
+    def getSceneName(self):
+        """Returns the name of the scene that has been entered, or
+        None. """
+        return self.__sceneName
+
+    def getSceneAssets(self, sceneName):
+        """Returns the list of (kind, path) pairs recorded for the
+        named scene in the manifest, where kind is 'model' or
+        'texture'. """
+        return list(self.__getManifest().get(sceneName, []))
+
+    def getPrefetchStats(self):
+        """Returns a dictionary of statistics about the prefetching for
+        the scene that has been entered, or if none, the scene that
+        was last exited:
+
+            assets - the number of assets in the manifest
+            prefetched - the number of those that have been loaded
+            hits - assets requested after they had been prefetched
+            late - assets requested while still being prefetched
+            misses - assets requested that were not in the manifest
+            unused - assets in the manifest not yet requested
+
+        Each asset is counted only once per visit. """
+
+        prefetch = self.__prefetch or self.__lastPrefetch
+        if prefetch is None:
+            return None
+        return prefetch.getStats()
+
+    def readManifest(self, filename = None):
+        """Reads the scene manifest from the indicated file, or from
+        the loader-prefetch-manifest file, replacing the scenes already
+        recorded.  It is not an error if the file does not exist. """
+
+        if filename is None:
+            filename = self.manifestFilename
+        filename = Filename(filename)
+
+        manifest = {}
+        self.__manifest = manifest
+        if filename.empty() or not filename.exists():
+            return
+
+        assets = None
+        with open(filename.toOsSpecific(), 'r') as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                words = line.split(None, 1)
+                if len(words) != 2:
+                    self.notify.warning("Ignoring line in %s: %s" % (filename, line))
+                elif words[0] == 'scene':
+                    assets = manifest.setdefault(words[1], [])
+                elif assets is not None:
+                    assets.append((words[0], words[1]))
+
+    def writeManifest(self, filename = None):
+        """Writes the scene manifest to the indicated file, or to the
+        loader-prefetch-manifest file. """
+
+        if filename is None:
+            filename = self.manifestFilename
+        filename = Filename(filename)
+        filename.makeDir()
+
+        # Write to a temporary file first, so that an error doesn't
+        # leave a partial manifest behind.
+        osFilename = filename.toOsSpecific()
+        tempFilename = osFilename + '.tmp'
+        try:
+            with open(tempFilename, 'w') as file:
+                file.write('# The assets loaded in each scene, in order, to be prefetched\n')
+                file.write('# by Loader.enterScene().\n')
+                for sceneName, assets in sorted(self.__getManifest().items()):
+                    file.write('\nscene %s\n' % (sceneName))
+                    for kind, path in assets:
+                        file.write('%s %s\n' % (kind, path))
+            if os.path.exists(osFilename):
+                os.remove(osFilename)
+            os.rename(tempFilename, osFilename)
+        except:
+            if os.path.exists(tempFilename):
+                os.remove(tempFilename)
+            raise
+
+    def __getManifest(self):
+        if self.__manifest is None:
+            self.readManifest()
+        return self.__manifest
+
+    def __noteAsset(self, kind, path):
+        # Records an asset loaded in the current scene, and counts it
+        # against the prefetch.
+        key = (kind, str(path))
+        if key not in self.__sceneAssetSet:
+            self.__sceneAssetSet.add(key)
+            self.__sceneAssets.append(key)
+
+        prefetch = self.__prefetch
+        if prefetch is not None and key not in prefetch.requested:
+            prefetch.requested.add(key)
+            if key in prefetch.done:
+                prefetch.hits += 1
+            elif key in prefetch.pending:
+                prefetch.late += 1
+            else:
+                prefetch.misses += 1
+
+    def __gotPrefetchAsset(self, asset, prefetch, key):
+        # The asset is now in the ModelPool or TexturePool.  A model
+        # is passed as None; a texture is the pool's own.
+        if not prefetch.cancelled:
+            prefetch.gotAsset(key)
+
+    def __cancelPrefetch(self):
+        prefetch = self.__prefetch
+        if prefetch is None:
+            return
+        self.__prefetch = None
+        prefetch.cancelled = True
+        prefetch.callback = None
+        for cb in prefetch.cbs:
+            self.cancelRequest(cb)
+
+    def setCompletionBudget(self, budget):
+        """Sets the number of seconds per frame that may be spent
+        calling back the asynchronous requests that have finished
+        loading.  Once that is spent, the remaining requests are called
+        back in the following frames, highest priority first, so that
+        a burst of completions does not make one frame run long.  At
+        least one request is called back each frame.  The default, -1,
+        means no limit: each request is called back as soon as it has
+        finished. """
+        self.completionBudget = budget
+        if self.__completed:
+            self.__processCompletions()
+
+    def getCompletionBudget(self):
+        return self.completionBudget
+
+    def getNumCompletionsPending(self):
+        """Returns the number of asynchronous requests that have
+        finished loading but are being held back by the completion
+        budget. """
+        return len(self.__completed)
+
     def __gotAsyncObject(self, request):
         """A model or sound file or some such thing has just been
         loaded asynchronously by the sub-thread.  Add it to the list
@@ -983,21 +1486,59 @@ class Loader(DirectObject):
         if request not in self.__requests:
             return
 
-        cb, i = self.__requests[request]
-        if cb.cancelled:
-            # Shouldn't be here.
-            del self.__requests[request]
+        if self.completionBudget < 0 and not self.__completed:
+            self.__deliverRequest(request)
             return
 
-        cb.requests.discard(request)
-        if not cb.requests:
-            del self.__requests[request]
+        heapq.heappush(self.__completed, (-request.getPriority(), self.__completedSeq, request))
+        self.__completedSeq += 1
+        self.__processCompletions()
+
+    def __processCompletions(self):
+        # Calls back as many finished requests as the completion budget
+        # allows this frame, and leaves the rest for a task to call
+        # back in the following frames.
+        clock = ClockObject.getGlobalClock()
+        frame = clock.getFrameCount()
+        if frame != self.__completionFrame:
+            self.__completionFrame = frame
+            self.__completionTime = 0.0
+            self.__numCompletions = 0
+
+        while self.__completed:
+            if self.completionBudget >= 0 and self.__numCompletions > 0 and \
+               self.__completionTime >= self.completionBudget:
+                break
+            request = heapq.heappop(self.__completed)[2]
+            t0 = clock.getRealTime()
+            try:
+                self.__deliverRequest(request)
+            finally:
+                self.__completionTime += clock.getRealTime() - t0
+                self.__numCompletions += 1
+
+        if self.__completed and not taskMgr.hasTaskNamed(self.completionTaskName):
+            taskMgr.add(self.__completionTask, self.completionTaskName)
+
+    def __completionTask(self, task):
+        self.__processCompletions()
+        if self.__completed:
+            return task.cont
+        return task.done
+
+    def __deliverRequest(self, request):
+        # Hands the result of the finished request to each of the
+        # callers that are waiting for it.
+        waiters = self.__requests.pop(request, None)
+        if waiters is None:
+            return
+        self.__forgetPendingLoad(request)
 
+        node = None
         object = None
         if hasattr(request, "getModel"):
             node = request.getModel()
-            if node is not None:
-                object = NodePath(node)
+            instance = (request.getOptions().getFlags() & LoaderOptions.LFAllowInstance) != 0
 
         elif hasattr(request, "getSound"):
             object = request.getSound()
@@ -1005,10 +1546,36 @@ class Loader(DirectObject):
         elif hasattr(request, "getSuccess"):
             object = request.getSuccess()
 
-        cb.gotObject(i, object)
+        elif hasattr(request, "loadedObject"):
+            object = request.loadedObject
+
+        waiters = [(cb, i) for cb, i in waiters if not cb.cancelled]
+        if node is not None:
+            # The first caller gets the model that was loaded, and any
+            # others get copies of it.  The copies are all made before
+            # any callback runs, so that none of them sees what an
+            # earlier callback did to the model.  A prefetch needs no
+            # model of its own.
+            objects = []
+            shared = False
+            for cb, i in waiters:
+                if not cb.wantsObjects:
+                    objects.append(None)
+                elif not shared or instance:
+                    objects.append(NodePath(node))
+                    shared = True
+                else:
+                    objects.append(NodePath(node.copySubgraph()))
+        else:
+            objects = [object] * len(waiters)
+
+        for (cb, i), object in zip(waiters, objects):
+            cb.requests.discard(request)
+            cb.gotObject(i, object)
 
     load_model = loadModel
     cancel_request = cancelRequest
+    set_request_priority = setRequestPriority
     is_request_pending = isRequestPending
     unload_model = unloadModel
     save_model = saveModel
@@ -1024,3 +1591,9 @@ class Loader(DirectObject):
     load_shader = loadShader
     unload_shader = unloadShader
     async_flatten_strong = asyncFlattenStrong
+    set_completion_budget = setCompletionBudget
+    enter_scene = enterScene
+    exit_scene = exitScene
+    get_prefetch_stats = getPrefetchStats
+    get_completion_budget = getCompletionBudget
+    get_num_completions_pending = getNumCompletionsPending
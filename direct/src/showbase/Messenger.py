@@ -6,13 +6,87 @@ __all__ = ['Messenger']
 from .PythonUtil import *
 from direct.directnotify import DirectNotifyGlobal
 import types
+import fnmatch
+import re
+from collections import deque
 
 from direct.stdpy.threading import Lock
 
+
+class _EventPattern:
+    """ One glob pattern that objects are accepting with
+    Messenger.acceptPattern(), and the hooks of those objects. """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        # objMsgrId->callbackInfo, as in Messenger.__callbacks
+        self.acceptorDict = {}
+
+        # The literal text that every matching event begins with, and
+        # the literal text after the last '*' for patterns that have no
+        # other special characters.  The Messenger indexes patterns by
+        # whichever of these is not empty.
+        self.prefix = pattern
+        for i, c in enumerate(pattern):
+            if c in '*?[':
+                self.prefix = pattern[:i]
+                break
+        self.suffix = ''
+        if '?' not in pattern and '[' not in pattern:
+            self.suffix = pattern[pattern.rfind('*') + 1:]
+
+        # A pattern of the form "prefix*" or "*suffix" is matched by
+        # the index lookup itself; anything else needs a regex.
+        rest = pattern[len(self.prefix):]
+        if rest == '*' or (not self.prefix and rest == '*' + self.suffix):
+            self.match = None
+        else:
+            self.match = re.compile(fnmatch.translate(pattern)).match
+
+    def matches(self, event):
+        return self.match is None or self.match(event) is not None
+
+
+class _TaskChainQueue:
+    """ The events sent to one task chain with
+    Messenger.send(taskChain = ...), waiting to be dispatched by a task
+    on that chain.  Senders only append to the deque, which is safe
+    from any thread without a lock; the lock is taken only when the
+    dispatch task has to be started or stopped. """
+
+    def __init__(self, taskChain):
+        self.taskChain = taskChain
+        self.events = deque()
+        # True while a dispatch task is spawned for this chain.
+        self.scheduled = False
+        self.lock = Lock('Messenger-%s' % (taskChain))
+
+        self.numDispatched = 0
+        self.numBatches = 0
+        self.maxBatchSize = 0
+        # The number of times the dispatch task found the Messenger's
+        # lock already held by another thread.  Senders don't take it.
+        self.numLockContentions = 0
+
+    def getStats(self):
+        return {
+            'depth': len(self.events),
+            'dispatched': self.numDispatched,
+            'batches': self.numBatches,
+            'maxBatchSize': self.maxBatchSize,
+            'lockContentions': self.numLockContentions,
+            }
+
+
 class Messenger:
 
     notify = DirectNotifyGlobal.directNotify.newCategory("Messenger")
 
+    # Set this false to dispatch every event through the general
+    # path, which re-reads the acceptor dictionary for each listener.
+    # This is only useful for comparison; see MessengerBenchmark.
+    wantDispatchLists = True
+
     def __init__(self):
         """
         One is keyed off the event name. It has the following structure:
@@ -35,12 +109,34 @@ class Messenger:
         self.__callbacks = {}
         # objMsgrId->set(eventName)
         self.__objectEvents = {}
+        # eventName->tuple of (objMsgrId, callInfo, method, extraArgs,
+        # persistent), a snapshot of __callbacks[eventName] that is
+        # built when the event is sent and discarded whenever the
+        # acceptors of the event change.
+        self.__dispatchLists = {}
         self._messengerIdGen = 0
         # objMsgrId->listenerObject
         self._id2object = {}
 
-        # A mapping of taskChain -> eventList, used for sending events
-        # across task chains (and therefore across threads).
+        # Subscriptions made with acceptPattern().
+        # pattern->_EventPattern
+        self.__patterns = {}
+        # objMsgrId->set(pattern)
+        self.__objectPatterns = {}
+        # prefix->{pattern: _EventPattern}, and the same for suffixes,
+        # for the patterns with a non-empty prefix or suffix.  The
+        # lengths dictionaries count the patterns of each prefix or
+        # suffix length, so that send() need only try those lengths.
+        self.__patternsByPrefix = {}
+        self.__prefixLengths = {}
+        self.__patternsBySuffix = {}
+        self.__suffixLengths = {}
+        # Patterns with neither, eg. "*", which must be tried on every
+        # event.
+        self.__unanchoredPatterns = {}
+
+        # A mapping of taskChain -> _TaskChainQueue, used for sending
+        # events across task chains (and therefore across threads).
         self._eventQueuesByTaskChain = {}
 
         # This protects the data structures within this object from
@@ -156,6 +252,7 @@ class Messenger:
                             (object.__class__.__name__, safeRepr(event), method.__name__, oldMethod.__name__))
 
             acceptorDict[id] = [method, extraArgs, persistent]
+            self.__dispatchLists.pop(event, None)
 
             # Remember that this object is listening for this event
             eventDict = self.__objectEvents.setdefault(id, {})
@@ -183,6 +280,7 @@ class Messenger:
             # If this object is there, delete it from the dictionary
             if acceptorDict and id in acceptorDict:
                 del acceptorDict[id]
+                self.__dispatchLists.pop(event, None)
                 # If this dictionary is now empty, remove the event
                 # entry from the Messenger alltogether
                 if (len(acceptorDict) == 0):
@@ -220,15 +318,179 @@ class Messenger:
                     # If this object is there, delete it from the dictionary
                     if acceptorDict and id in acceptorDict:
                         del acceptorDict[id]
+                        self.__dispatchLists.pop(event, None)
                         # If this dictionary is now empty, remove the event
                         # entry from the Messenger alltogether
                         if (len(acceptorDict) == 0):
                             del self.__callbacks[event]
                     self._releaseObject(object)
                 del self.__objectEvents[id]
+
+            # And the patterns it is accepting
+            patternDict = self.__objectPatterns.get(id)
+            if patternDict:
+                for pattern in list(patternDict.keys()):
+                    self.__removePatternAcceptor(pattern, id)
+        finally:
+            self.lock.release()
+
+    def acceptPattern(self, pattern, object, method, extraArgs=[], persistent=1):
+        """ acceptPattern(self, string, DirectObject, Function, List, Boolean)
+
+        Make this object accept all events whose names match the
+        pattern, which can include standard shell globbing characters
+        like *, ?, and [], eg. "*-generated" or "avatar-123-*".  The
+        method is called with extraArgs, then the name of the event
+        that matched, then the sent arguments.
+
+        Patterns with literal text at the start (or at the end, after
+        a '*') are indexed, so that sending an event only costs time
+        for the patterns that could match it.  Exact subscriptions made
+        with accept() are called before pattern subscriptions.
+
+        If the persistent flag is not set, the object stops accepting
+        the pattern after the first matching event.
+        """
+        if Messenger.notify.getDebug():
+            Messenger.notify.debug(
+                "object: %s (%s)\n accepting pattern: %s\n method: %s\n extraArgs: %s\n persistent: %s" %
+                (safeRepr(object), self._getMessengerId(object), pattern, safeRepr(method),
+                 safeRepr(extraArgs), persistent))
+
+        assert hasattr(method, '__call__'), (
+            "method not callable in acceptPattern (ignoring): %s %s"%
+            (safeRepr(method), safeRepr(extraArgs)))
+
+        if not (isinstance(extraArgs, list) or isinstance(extraArgs, tuple) or isinstance(extraArgs, set)):
+            raise TypeError("A list is required as extraArgs argument")
+
+        self.lock.acquire()
+        try:
+            info = self.__patterns.get(pattern)
+            if info is None:
+                info = _EventPattern(pattern)
+                self.__patterns[pattern] = info
+                self.__indexPattern(info)
+
+            id = self._getMessengerId(object)
+            info.acceptorDict[id] = [method, list(extraArgs), persistent]
+
+            patternDict = self.__objectPatterns.setdefault(id, {})
+            if pattern not in patternDict:
+                self._storeObject(object)
+                patternDict[pattern] = None
         finally:
             self.lock.release()
 
+    def ignorePattern(self, pattern, object):
+        """ ignorePattern(self, string, DirectObject)
+        Make this object no longer respond to events matching this
+        pattern.  It is safe to call even if it was not already
+        accepting it.  Note that this only undoes acceptPattern() with
+        the very same pattern string.
+        """
+        self.lock.acquire()
+        try:
+            self.__removePatternAcceptor(pattern, self._getMessengerId(object))
+        finally:
+            self.lock.release()
+
+    def isAcceptingPattern(self, pattern, object):
+        self.lock.acquire()
+        try:
+            info = self.__patterns.get(pattern)
+            return info is not None and self._getMessengerId(object) in info.acceptorDict
+        finally:
+            self.lock.release()
+
+    def getAllAcceptingPatterns(self, object):
+        """
+        Returns the list of all patterns accepted by the indicated object.
+        """
+        self.lock.acquire()
+        try:
+            patternDict = self.__objectPatterns.get(self._getMessengerId(object))
+            if patternDict:
+                return list(patternDict.keys())
+            return []
+        finally:
+            self.lock.release()
+
+    def getPatterns(self):
+        return list(self.__patterns.keys())
+
+    def __indexPattern(self, info):
+        # assumes lock is held.
+        if info.prefix:
+            self.__patternsByPrefix.setdefault(info.prefix, {})[info.pattern] = info
+            length = len(info.prefix)
+            self.__prefixLengths[length] = self.__prefixLengths.get(length, 0) + 1
+        elif info.suffix:
+            self.__patternsBySuffix.setdefault(info.suffix, {})[info.pattern] = info
+            length = len(info.suffix)
+            self.__suffixLengths[length] = self.__suffixLengths.get(length, 0) + 1
+        else:
+            self.__unanchoredPatterns[info.pattern] = info
+
+    def __unindexPattern(self, info):
+        # assumes lock is held.
+        if info.prefix:
+            table, lengths, key = self.__patternsByPrefix, self.__prefixLengths, info.prefix
+        elif info.suffix:
+            table, lengths, key = self.__patternsBySuffix, self.__suffixLengths, info.suffix
+        else:
+            del self.__unanchoredPatterns[info.pattern]
+            return
+        patterns = table[key]
+        del patterns[info.pattern]
+        if not patterns:
+            del table[key]
+        length = len(key)
+        lengths[length] -= 1
+        if lengths[length] == 0:
+            del lengths[length]
+
+    def __removePatternAcceptor(self, pattern, id):
+        # assumes lock is held.
+        info = self.__patterns.get(pattern)
+        if info and id in info.acceptorDict:
+            del info.acceptorDict[id]
+            if not info.acceptorDict:
+                del self.__patterns[pattern]
+                self.__unindexPattern(info)
+
+        patternDict = self.__objectPatterns.get(id)
+        if patternDict and pattern in patternDict:
+            del patternDict[pattern]
+            if not patternDict:
+                del self.__objectPatterns[id]
+            self._releaseObject(self._getObject(id))
+
+    def __findPatterns(self, event):
+        # Returns the list of _EventPatterns that match the event.
+        # assumes lock is held.
+        if not isinstance(event, str):
+            return []
+        found = []
+        eventLen = len(event)
+        if self.__prefixLengths:
+            table = self.__patternsByPrefix
+            for length in self.__prefixLengths:
+                if length <= eventLen:
+                    patterns = table.get(event[:length])
+                    if patterns:
+                        found.extend(patterns.values())
+        if self.__suffixLengths:
+            table = self.__patternsBySuffix
+            for length in self.__suffixLengths:
+                if length <= eventLen:
+                    patterns = table.get(event[eventLen - length:])
+                    if patterns:
+                        found.extend(patterns.values())
+        if self.__unanchoredPatterns:
+            found.extend(self.__unanchoredPatterns.values())
+        return [info for info in found if info.matches(event)]
+
     def getAllAccepting(self, object):
         """
         Returns the list of all events accepted by the indicated object.
@@ -262,6 +524,21 @@ class Messenger:
         finally:
             self.lock.release()
 
+    def hasListeners(self, event):
+        """
+        Returns true if any object is accepting the given event, either
+        by name or with a matching pattern
+        """
+        if event in self.__callbacks:
+            return True
+        if self.__patterns:
+            self.lock.acquire()
+            try:
+                return len(self.__findPatterns(event)) != 0
+            finally:
+                self.lock.release()
+        return False
+
     def whoAccepts(self, event):
         """
         Return objects accepting the given event
@@ -294,67 +571,173 @@ class Messenger:
                 'sent event: %s sentArgs = %s, taskChain = %s' % (
                 event, sentArgs, taskChain))
 
+        if taskChain:
+            # The sender takes no lock.  The acceptors are looked up
+            # when the event is dispatched on the receiving chain.  A
+            # dict lookup is atomic, so it is safe to skip the events no
+            # one listens to here.
+            if event not in self.__callbacks and not self.__patterns:
+                return
+            chainQueue = self.__getTaskChainQueue(taskChain)
+            chainQueue.events.append((event, sentArgs))
+            if not chainQueue.scheduled:
+                self.__scheduleTaskChainDispatch(chainQueue)
+            return
+
         self.lock.acquire()
         try:
-            foundWatch=0
-            if __debug__:
-                if self.__isWatching:
-                    for i in self.__watching.keys():
-                        if str(event).find(i) >= 0:
-                            foundWatch=1
-                            break
+            foundWatch = self.__isWatched(event)
             acceptorDict = self.__callbacks.get(event)
-            if not acceptorDict:
+            patternMatches = None
+            if self.__patterns:
+                patternMatches = self.__findPatterns(event)
+            if not acceptorDict and not patternMatches:
                 if __debug__:
                     if foundWatch:
                         print("Messenger: \"%s\" was sent, but no function in Python listened."%(event,))
                 return
 
-            if taskChain:
-                # Queue the event onto the indicated task chain.
-                from direct.task.TaskManagerGlobal import taskMgr
-                queue = self._eventQueuesByTaskChain.setdefault(taskChain, [])
-                queue.append((acceptorDict, event, sentArgs, foundWatch))
-                if len(queue) == 1:
-                    # If this is the first (only) item on the queue,
-                    # spawn the task to empty it.
-                    taskMgr.add(self.__taskChainDispatch, name = 'Messenger-%s' % (taskChain),
-                                extraArgs = [taskChain], taskChain = taskChain,
-                                appendTask = True)
-            else:
-                # Handle the event immediately.
-                self.__dispatch(acceptorDict, event, sentArgs, foundWatch)
+            if acceptorDict:
+                if self.wantDispatchLists:
+                    # Handle the event immediately, from the snapshot
+                    # of its acceptors.
+                    dispatchList = self.__dispatchLists.get(event)
+                    if dispatchList is None:
+                        dispatchList = tuple([(id, callInfo) + tuple(callInfo)
+                                              for id, callInfo in acceptorDict.items()])
+                        self.__dispatchLists[event] = dispatchList
+                    self.__dispatchList(acceptorDict, dispatchList, event, sentArgs, foundWatch)
+                else:
+                    # Handle the event immediately.
+                    self.__dispatch(acceptorDict, event, sentArgs, foundWatch)
+
+            if patternMatches:
+                self.__dispatchPatterns(patternMatches, event, sentArgs, foundWatch)
         finally:
             self.lock.release()
 
-    def __taskChainDispatch(self, taskChain, task):
+    def __isWatched(self, event):
+        if __debug__:
+            if self.__isWatching:
+                for i in self.__watching.keys():
+                    if str(event).find(i) >= 0:
+                        return 1
+        return 0
+
+    def __getTaskChainQueue(self, taskChain):
+        chainQueue = self._eventQueuesByTaskChain.get(taskChain)
+        if chainQueue is None:
+            # setdefault() is atomic, so two threads racing to create
+            # the queue will still end up sharing one.
+            chainQueue = self._eventQueuesByTaskChain.setdefault(
+                taskChain, _TaskChainQueue(taskChain))
+        return chainQueue
+
+    def __scheduleTaskChainDispatch(self, chainQueue):
+        # Spawns the task to empty the queue, unless another sender
+        # has just done so.
+        chainQueue.lock.acquire()
+        try:
+            if chainQueue.scheduled:
+                return
+            chainQueue.scheduled = True
+        finally:
+            chainQueue.lock.release()
+
+        from direct.task.TaskManagerGlobal import taskMgr
+        taskChain = chainQueue.taskChain
+        taskMgr.add(self.__taskChainDispatch, name = 'Messenger-%s' % (taskChain),
+                    extraArgs = [chainQueue], taskChain = taskChain,
+                    appendTask = True)
+
+    def __taskChainDispatch(self, chainQueue, task):
         """ This task is spawned each time an event is sent across
-        task chains.  Its job is to empty the task events on the queue
-        for this particular task chain.  This guarantees that events
-        are still delivered in the same order they were sent. """
+        task chains, and the chain's queue was empty.  Its job is to
+        empty the events on the queue for this particular task chain,
+        a batch at a time.  This guarantees that events are still
+        delivered in the same order they were sent. """
 
+        events = chainQueue.events
         while True:
-            eventTuple = None
-            self.lock.acquire()
+            # Take the events that are queued now as one batch; any sent
+            # while we dispatch them will be in the next batch.
+            batch = deque()
             try:
-                queue = self._eventQueuesByTaskChain.get(taskChain, None)
-                if queue:
-                    eventTuple = queue[0]
-                    del queue[0]
-                if not queue:
-                    # The queue is empty, we're done.
-                    if queue is not None:
-                        del self._eventQueuesByTaskChain[taskChain]
-
-                if not eventTuple:
-                    # No event; we're done.
+                for i in range(len(events)):
+                    batch.append(events.popleft())
+            except IndexError:
+                pass
+
+            if not batch:
+                # The queue looks empty.  Mark it unscheduled first, and
+                # then check again, since a sender may have added an
+                # event after we looked but before it saw the flag.
+                chainQueue.lock.acquire()
+                chainQueue.scheduled = False
+                chainQueue.lock.release()
+                if not events:
                     return task.done
 
-                self.__dispatch(*eventTuple)
-            finally:
-                self.lock.release()
+                chainQueue.lock.acquire()
+                try:
+                    if chainQueue.scheduled:
+                        # That sender has spawned a new task already.
+                        return task.done
+                    chainQueue.scheduled = True
+                finally:
+                    chainQueue.lock.release()
+                continue
 
-        return task.done
+            chainQueue.numBatches += 1
+            chainQueue.maxBatchSize = max(chainQueue.maxBatchSize, len(batch))
+            try:
+                while batch:
+                    event, sentArgs = batch.popleft()
+                    if not self.lock.acquire(False):
+                        chainQueue.numLockContentions += 1
+                        self.lock.acquire()
+                    try:
+                        foundWatch = self.__isWatched(event)
+                        acceptorDict = self.__callbacks.get(event)
+                        patternMatches = None
+                        if self.__patterns:
+                            patternMatches = self.__findPatterns(event)
+                        if __debug__:
+                            if foundWatch and not acceptorDict and not patternMatches:
+                                print("Messenger: \"%s\" was sent, but no function in Python listened."%(event,))
+                        if acceptorDict:
+                            self.__dispatch(acceptorDict, event, sentArgs, foundWatch)
+                        if patternMatches:
+                            self.__dispatchPatterns(patternMatches, event, sentArgs, foundWatch)
+                    finally:
+                        self.lock.release()
+                    chainQueue.numDispatched += 1
+            except:
+                # A handler raised an exception.  Put the rest of the
+                # batch back, ahead of anything sent since, and let a
+                # new task deliver them.
+                events.extendleft(reversed(batch))
+                chainQueue.lock.acquire()
+                chainQueue.scheduled = False
+                chainQueue.lock.release()
+                if events:
+                    self.__scheduleTaskChainDispatch(chainQueue)
+                raise
+
+    def getTaskChainQueueStats(self):
+        """
+        Returns a dictionary of taskChain -> stats for the events sent
+        with a taskChain: the current queue depth, the number of events
+        dispatched and the number of batches, the largest batch, and the
+        number of times the Messenger's lock was contended by the
+        dispatch task on that chain.  Senders never take the
+        Messenger's lock; they take the chain's own lock only when the
+        queue goes from idle to scheduled.
+        """
+        stats = {}
+        for taskChain, chainQueue in list(self._eventQueuesByTaskChain.items()):
+            stats[taskChain] = chainQueue.getStats()
+        return stats
 
     def __dispatch(self, acceptorDict, event, sentArgs, foundWatch):
         for id in list(acceptorDict.keys()):
@@ -372,20 +755,7 @@ class Messenger:
                 # If this object was only accepting this event once,
                 # remove it from the dictionary
                 if not persistent:
-                    # This object is no longer listening for this event
-                    eventDict = self.__objectEvents.get(id)
-                    if eventDict and event in eventDict:
-                        del eventDict[event]
-                        if (len(eventDict) == 0):
-                            del self.__objectEvents[id]
-                        self._releaseObject(self._getObject(id))
-
-                    del acceptorDict[id]
-                    # If the dictionary at this event is now empty, remove
-                    # the event entry from the Messenger altogether
-                    if (event in self.__callbacks \
-                            and (len(self.__callbacks[event]) == 0)):
-                        del self.__callbacks[event]
+                    self.__removeOnce(acceptorDict, id, event)
 
                 if __debug__:
                     if foundWatch:
@@ -412,6 +782,94 @@ class Messenger:
                 finally:
                     self.lock.acquire()
 
+    def __dispatchList(self, acceptorDict, dispatchList, event, sentArgs, foundWatch):
+        """ The fast path of __dispatch(), which walks a snapshot of
+        the acceptors rather than re-reading each one's callInfo.
+        Like __dispatch(), it is called with the lock held, but it
+        only re-acquires the lock to remove an acceptOnce hook. """
+        self.lock.release()
+        try:
+            for id, callInfo, method, extraArgs, persistent in dispatchList:
+                # An earlier handler may have ignored this object's
+                # hook, or replaced it with another one.
+                if acceptorDict.get(id) is not callInfo:
+                    callInfo = acceptorDict.get(id)
+                    if not callInfo:
+                        continue
+                    method, extraArgs, persistent = callInfo
+
+                if not persistent:
+                    self.lock.acquire()
+                    try:
+                        # Another thread may have beaten us to it.
+                        if acceptorDict.get(id) is not callInfo:
+                            continue
+                        self.__removeOnce(acceptorDict, id, event)
+                    finally:
+                        self.lock.release()
+
+                if __debug__:
+                    if foundWatch:
+                        print("Messenger: \"%s\" --> %s%s"%(
+                            event,
+                            self.__methodRepr(method),
+                            tuple(extraArgs + sentArgs)))
+
+                if extraArgs:
+                    method(*(extraArgs + sentArgs))
+                else:
+                    method(*sentArgs)
+        finally:
+            self.lock.acquire()
+
+    def __dispatchPatterns(self, patternMatches, event, sentArgs, foundWatch):
+        # Calls the hooks of the objects accepting the matching
+        # patterns.  Like __dispatch(), this is called with the lock
+        # held, and releases it while calling each method.
+        for info in patternMatches:
+            acceptorDict = info.acceptorDict
+            for id in list(acceptorDict.keys()):
+                # An earlier handler may have ignored this hook.
+                callInfo = acceptorDict.get(id)
+                if callInfo:
+                    method, extraArgs, persistent = callInfo
+                    if not persistent:
+                        self.__removePatternAcceptor(info.pattern, id)
+
+                    args = extraArgs + [event] + list(sentArgs)
+                    if __debug__:
+                        if foundWatch:
+                            print("Messenger: \"%s\" (%s) --> %s%s"%(
+                                event, info.pattern,
+                                self.__methodRepr(method),
+                                tuple(args)))
+
+                    self.lock.release()
+                    try:
+                        method(*args)
+                    finally:
+                        self.lock.acquire()
+
+    def __removeOnce(self, acceptorDict, id, event):
+        # Removes a hook that was only accepting the event once.
+        # Assumes lock is held.
+
+        # This object is no longer listening for this event
+        eventDict = self.__objectEvents.get(id)
+        if eventDict and event in eventDict:
+            del eventDict[event]
+            if (len(eventDict) == 0):
+                del self.__objectEvents[id]
+            self._releaseObject(self._getObject(id))
+
+        del acceptorDict[id]
+        self.__dispatchLists.pop(event, None)
+        # If the dictionary at this event is now empty, remove
+        # the event entry from the Messenger altogether
+        if (event in self.__callbacks \
+                and (len(self.__callbacks[event]) == 0)):
+            del self.__callbacks[event]
+
     def clear(self):
         """
         Start fresh with a clear dict
@@ -419,13 +877,21 @@ class Messenger:
         self.lock.acquire()
         try:
             self.__callbacks.clear()
+            self.__dispatchLists.clear()
+            self.__patterns.clear()
+            self.__objectPatterns.clear()
+            self.__patternsByPrefix.clear()
+            self.__prefixLengths.clear()
+            self.__patternsBySuffix.clear()
+            self.__suffixLengths.clear()
+            self.__unanchoredPatterns.clear()
             self.__objectEvents.clear()
             self._id2object.clear()
         finally:
             self.lock.release()
 
     def isEmpty(self):
-        return (len(self.__callbacks) == 0)
+        return (len(self.__callbacks) == 0 and len(self.__patterns) == 0)
 
     def getEvents(self):
         return list(self.__callbacks.keys())
@@ -436,6 +902,7 @@ class Messenger:
         you redefine functions with Control-c-Control-v
         """
         retFlag = 0
+        self.__dispatchLists.clear()
         for entry in list(self.__callbacks.items()):
             event, objectDict = entry
             for objectEntry in list(objectDict.items()):
@@ -458,6 +925,18 @@ class Messenger:
         # didn't find that method, return false
         return retFlag
 
+    def isLogging(self):
+        """
+        Returns true if the messenger is in verbose mode, or is watching
+        for any events, and so reports the events that are sent to it
+        even when no one is listening to them
+        """
+        if Messenger.notify.getDebug():
+            return True
+        if __debug__:
+            return self.__isWatching > 0
+        return False
+
     def toggleVerbose(self):
         isVerbose = 1 - Messenger.notify.getDebug()
         Messenger.notify.setDebug(isVerbose)
@@ -533,6 +1012,10 @@ class Messenger:
             if repr(event).find(needle) >= 0:
                 print(self.__eventRepr(event))
                 return {event: self.__callbacks[event]}
+        for pattern in sorted(self.__patterns.keys()):
+            if pattern.find(needle) >= 0:
+                print(self.__patternRepr(pattern))
+                return {pattern: self.__patterns[pattern].acceptorDict}
 
     def findAll(self, needle, limit=None):
         """
@@ -549,6 +1032,14 @@ class Messenger:
                 matches[event] = self.__callbacks[event]
                 # if the limit is not None, decrement and
                 # check for break:
+                if limit > 0:
+                    limit -= 1
+                    if limit == 0:
+                        return matches
+        for pattern in sorted(self.__patterns.keys()):
+            if pattern.find(needle) >= 0:
+                print(self.__patternRepr(pattern))
+                matches[pattern] = self.__patterns[pattern].acceptorDict
                 if limit > 0:
                     limit -= 1
                     if limit == 0:
@@ -580,6 +1071,17 @@ class Messenger:
         str = str + '\n'
         return str
 
+    def __patternRepr(self, pattern):
+        """
+        Compact version of pattern, acceptor pairs
+        """
+        str = ('pattern ' + pattern).ljust(32) + '\t'
+        acceptorDict = self.__patterns[pattern].acceptorDict
+        for key, (method, extraArgs, persistent) in list(acceptorDict.items()):
+            str = str + self.__methodRepr(method) + ' '
+        str = str + '\n'
+        return str
+
     def __repr__(self):
         """
         Compact version of event, acceptor pairs
@@ -589,6 +1091,8 @@ class Messenger:
         keys.sort()
         for event in keys:
             str += self.__eventRepr(event)
+        for pattern in sorted(self.__patterns.keys()):
+            str += self.__patternRepr(pattern)
         # Print out the object: event dictionary too
         str += "="*64 + "\n"
         for key, eventDict in list(self.__objectEvents.items()):
@@ -0,0 +1,87 @@
+"""Contains microbenchmarks for Messenger.send().  Each one is run
+with and without the cached dispatch lists, and reports the number of
+events sent per second.  Run this module directly to print the
+results, eg.:
+
+    python -m direct.showbase.MessengerBenchmark
+"""
+
+__all__ = ['benchmarkSend', 'runBenchmarks']
+
+from direct.showbase.Messenger import Messenger
+import time
+
+
+class _Listener:
+    def __init__(self):
+        self.count = 0
+
+    def handle(self, *args):
+        self.count += 1
+
+
+def _sendLoop(messenger, event, sentArgs, numEvents):
+    send = messenger.send
+    t0 = time.time()
+    for i in range(numEvents):
+        send(event, sentArgs)
+    return time.time() - t0
+
+def _acceptOnceLoop(messenger, event, sentArgs, numEvents, listeners):
+    t0 = time.time()
+    for i in range(numEvents):
+        for listener in listeners:
+            messenger.accept(event, listener, listener.handle, [], 0)
+        messenger.send(event, sentArgs)
+    return time.time() - t0
+
+def benchmarkSend(numListeners, extraArgs = [], sentArgs = [],
+                  persistent = 1, numEvents = 100000,
+                  wantDispatchLists = True):
+    """Sends numEvents events to numListeners objects, and returns the
+    number of events sent per second.  If persistent is 0, each
+    listener re-accepts the event with acceptOnce semantics before
+    each send. """
+
+    saved = Messenger.wantDispatchLists
+    Messenger.wantDispatchLists = wantDispatchLists
+    try:
+        messenger = Messenger()
+        listeners = [_Listener() for i in range(numListeners)]
+        event = 'benchmark-event'
+        if persistent:
+            for listener in listeners:
+                messenger.accept(event, listener, listener.handle, extraArgs)
+            elapsed = _sendLoop(messenger, event, sentArgs, numEvents)
+        else:
+            elapsed = _acceptOnceLoop(messenger, event, sentArgs, numEvents, listeners)
+        assert listeners[0].count == numEvents
+        messenger.clear()
+    finally:
+        Messenger.wantDispatchLists = saved
+
+    return numEvents / max(elapsed, 1e-9)
+
+# Each entry is (description, keyword arguments to benchmarkSend).
+Benchmarks = [
+    ('1 listener', dict(numListeners = 1)),
+    ('1 listener, sentArgs', dict(numListeners = 1, sentArgs = [1, 2])),
+    ('10 listeners', dict(numListeners = 10)),
+    ('10 listeners, extraArgs and sentArgs',
+     dict(numListeners = 10, extraArgs = [0], sentArgs = [1, 2])),
+    ('100 listeners', dict(numListeners = 100, numEvents = 10000)),
+    ('10 acceptOnce listeners', dict(numListeners = 10, persistent = 0,
+                                     numEvents = 20000)),
+    ]
+
+def runBenchmarks():
+    """Runs each of the Benchmarks with and without the dispatch
+    lists, and prints the events per second of each. """
+    print('%-40s %14s %14s %8s' % ('', 'general/sec', 'cached/sec', 'ratio'))
+    for description, kwArgs in Benchmarks:
+        before = benchmarkSend(wantDispatchLists = False, **kwArgs)
+        after = benchmarkSend(wantDispatchLists = True, **kwArgs)
+        print('%-40s %14.0f %14.0f %7.2fx' % (description, before, after, after / before))
+
+if __name__ == '__main__':
+    runBenchmarks()
@@ -21,6 +21,8 @@ except ImportError:
 
 from panda3d.core import *
 from direct.extensions_native import HTTPChannel_extensions
+from direct.task.TimerWheel import TimerWheel
+from direct.task.TaskBudget import FrameBudgetScheduler
 
 def print_exc_plus():
     """
@@ -105,14 +107,42 @@ class TaskManager:
     taskTimerVerbose = ConfigVariableBool('task-timer-verbose', False)
     extendedExceptions = ConfigVariableBool('extended-exceptions', False)
     pStatsTasks = ConfigVariableBool('pstats-tasks', False)
+    wantTimerWheel = ConfigVariableBool('task-timer-wheel', False)
+    timerWheelResolution = ConfigVariableDouble('task-timer-wheel-resolution', 1.0 / 60.0)
+    frameTimeBudget = ConfigVariableDouble('task-frame-time-budget', -1.0)
+    maxDeferFrames = ConfigVariableInt('task-max-defer-frames', 10)
+    budgetDeferPriority = ConfigVariableInt('task-budget-defer-priority', 0)
 
     MaxEpochSpeed = 1.0/30.0
 
+    # The number of distinct patterns remembered by the glob cache
+    # used by getTasksMatching() and removeTasksMatching().
+    GlobCacheSize = 1024
+
     def __init__(self):
         self.mgr = AsyncTaskManager.getGlobalPtr()
 
+        # Maps task name patterns to already-constructed GlobPattern
+        # objects.  Code that tears down distributed objects tends to
+        # use the same few patterns over and over again.
+        self._globCache = {}
+
         self.resumeFunc = None
         self.globalClock = self.mgr.getClock()
+
+        # See setTimerWheelEnabled().  The wheel and the budget
+        # scheduler both read the clock, so they come after it.
+        self._timerWheel = None
+        self._timerTicker = None
+        if self.wantTimerWheel:
+            self.setTimerWheelEnabled(True)
+
+        # This is created when a frame time budget is set, or the
+        # first time a task declares a budget.
+        self._budgetScheduler = None
+        if self.frameTimeBudget.getValue() >= 0:
+            self.setFrameTimeBudget(self.frameTimeBudget.getValue())
+
         self.stepping = False
         self.running = False
         self.destroyed = False
@@ -147,11 +177,27 @@ class TaskManager:
         self.notify.info("TaskManager.destroy()")
         self.destroyed = True
         self._frameProfileQueue.clear()
+        if self._timerWheel:
+            for task, wakeTime in self._timerWheel.clear():
+                self.__killTimer(task)
+            self._timerWheel = None
         self.mgr.cleanup()
 
     def setClock(self, clockObject):
+        oldNow = self.globalClock.getFrameTime()
         self.mgr.setClock(clockObject)
         self.globalClock = clockObject
+        if self._budgetScheduler:
+            self._budgetScheduler.clock = clockObject
+        if self._timerWheel:
+            # The wheel's ticks are measured on the old clock; start a
+            # new wheel on the new one, keeping each task's remaining
+            # delay.
+            now = clockObject.getFrameTime()
+            pending = self._timerWheel.clear()
+            self._timerWheel = TimerWheel(now, self.timerWheelResolution.getValue())
+            for task, wakeTime in pending:
+                self._timerWheel.insert(task, now + max(wakeTime - oldNow, 0))
 
     clock = property(lambda self: self.mgr.getClock(), setClock)
 
@@ -190,6 +236,66 @@ class TaskManager:
 
         return (self.mgr.findTaskChain(chainName) != None)
 
+    def setFrameTimeBudget(self, frameBudget):
+        """Sets the amount of time, in seconds, that each frame of
+        step() should take.  Tasks that were added with a budget are
+        deferred to a later frame when running them would take the
+        frame past this time, if their priority is below the one set
+        by setBudgetDeferPriority(); see FrameBudgetScheduler.  Set it
+        to -1 to mean no limit (the default); tasks with a budget are
+        then only time-sliced when they exceed their own budget.
+
+        This is distinct from the frameBudget of a task chain, which
+        limits the time spent on all of that chain's tasks, and is
+        enforced by setupTaskChain(). """
+        self.__getBudgetScheduler().frameBudget = frameBudget
+
+    def getFrameTimeBudget(self):
+        if not self._budgetScheduler:
+            return -1
+        return self._budgetScheduler.frameBudget
+
+    def setBudgetDeferPriority(self, priority):
+        """Sets the priority below which a task with a budget may be
+        deferred for the frame time budget.  The default is 0, so
+        only tasks given a negative priority are deferred; the others
+        always run, though they may still be time-sliced. """
+        self.__getBudgetScheduler().deferPriority = priority
+
+    def getBudgetDeferPriority(self):
+        if not self._budgetScheduler:
+            return self.budgetDeferPriority.getValue()
+        return self._budgetScheduler.deferPriority
+
+    def setTaskBudget(self, task, budget):
+        """Declares the per-frame time budget, in seconds, of an
+        existing task, as if it had been passed to add().  A budget of
+        None makes the task unbudgeted again. """
+        if budget is None:
+            if self._budgetScheduler:
+                self._budgetScheduler.removeTask(task)
+            return
+        if not isinstance(task, PythonTask):
+            self.notify.error('Task %s cannot have a budget.' % (repr(task)))
+        self.__getBudgetScheduler().addTask(task, budget)
+
+    def getTaskBudgetStats(self):
+        """Returns a list of dictionaries, one per live task that has
+        a budget, most expensive first.  Each dictionary reports the
+        task's name, budget, average, maximum, last and total cost, and
+        how many times it has run, been deferred for the frame budget,
+        and been skipped for exceeding its own budget. """
+        if not self._budgetScheduler:
+            return []
+        return self._budgetScheduler.getStats()
+
+    def __getBudgetScheduler(self):
+        if not self._budgetScheduler:
+            self._budgetScheduler = FrameBudgetScheduler(
+                self, maxDeferFrames = self.maxDeferFrames.getValue(),
+                deferPriority = self.budgetDeferPriority.getValue())
+        return self._budgetScheduler
+
     def setupTaskChain(self, chainName, numThreads = None, tickClock = None,
                        threadPriority = None, frameBudget = None,
                        frameSync = None, timeslicePriority = None):
@@ -260,42 +366,133 @@ class TaskManager:
         """Returns true if there is at least one task, active or
         sleeping, with the indicated name. """
 
+        if self._timerWheel and self._timerWheel.hasTaskNamed(taskName):
+            return True
         return bool(self.mgr.findTask(taskName))
 
     def getTasksNamed(self, taskName):
         """Returns a list of all tasks, active or sleeping, with the
         indicated name. """
-        return self.__makeTaskList(self.mgr.findTasks(taskName))
+        tasks = self.__makeTaskList(self.mgr.findTasks(taskName))
+        if self._timerWheel:
+            tasks.extend(self._timerWheel.getTasksNamed(taskName))
+        return tasks
 
     def getTasksMatching(self, taskPattern):
         """Returns a list of all tasks, active or sleeping, with a
         name that matches the pattern, which can include standard
         shell globbing characters like *, ?, and []. """
 
-        return self.__makeTaskList(self.mgr.findTasksMatching(GlobPattern(taskPattern)))
+        tasks = self.__makeTaskList(self.__findTasksMatching(taskPattern))
+        if self._timerWheel:
+            tasks.extend(self._timerWheel.getTasksMatching(
+                self.__getGlobPattern(taskPattern)))
+        return tasks
 
     def getAllTasks(self):
         """Returns list of all tasks, active and sleeping, in
         arbitrary order. """
-        return self.__makeTaskList(self.mgr.getTasks())
+        tasks = self.__makeTaskList(self.mgr.getTasks())
+        if self._timerWheel:
+            tasks.extend(self._timerWheel.getTasks())
+        return tasks
 
     def getTasks(self):
         """Returns list of all active tasks in arbitrary order. """
         return self.__makeTaskList(self.mgr.getActiveTasks())
 
     def getDoLaters(self):
-        """Returns list of all sleeping tasks in arbitrary order. """
-        return self.__makeTaskList(self.mgr.getSleepingTasks())
+        """Returns list of all sleeping tasks in arbitrary order,
+        including those waiting in the timer wheel. """
+        tasks = self.__makeTaskList(self.mgr.getSleepingTasks())
+        if self._timerWheel:
+            tasks.extend(self._timerWheel.getTasks())
+        return tasks
+
+    def getTimerWheelDoLaters(self):
+        """Returns list of the sleeping tasks that are waiting in the
+        timer wheel, in arbitrary order.  These are also included in
+        getDoLaters(). """
+        if not self._timerWheel:
+            return []
+        return self._timerWheel.getTasks()
+
+    def getTimerWheelStats(self):
+        """Returns a dictionary of counters describing the timer
+        wheel's activity: the number of pending, inserted, cancelled,
+        expired and cascaded timers.  Returns None if the timer wheel
+        is not enabled. """
+        if not self._timerWheel:
+            return None
+        return self._timerWheel.getStats()
+
+    def hasTimerWheel(self):
+        return self._timerWheel is not None
+
+    def hasTimerWheelDoLater(self, task):
+        """Returns true if the task is a doMethodLater() task that is
+        still waiting in the timer wheel, and therefore has not been
+        added to the task manager yet. """
+        return bool(self._timerWheel) and self._timerWheel.hasTask(task)
+
+    def setTimerWheelEnabled(self, enabled):
+        """Enables or disables the timer wheel.  While it is enabled,
+        doMethodLater() holds its tasks in a hierarchical timing wheel
+        on the Python side instead of adding them to the task manager's
+        sleeping queue right away, and moves them across in one batch
+        per frame as they come due.  This makes scheduling and
+        cancelling a timer O(1), which matters when there are a great
+        many of them and most are cancelled before they fire, as is
+        typical for timeouts.
+
+        Timers are accurate to within task-timer-wheel-resolution
+        seconds, and never fire early.  A task waiting in the wheel has
+        not been added to the task manager yet, so it must be cancelled
+        with taskMgr.remove() or removeTasksMatching(); task.remove()
+        has no effect on it.  For this reason, tasks with an owner or a
+        done event are never put in the wheel.
+
+        When the wheel is disabled, any tasks still waiting in it are
+        handed to the task manager with their remaining delay. """
+
+        if enabled:
+            if not self._timerWheel:
+                self._timerWheel = TimerWheel(self.globalClock.getFrameTime(),
+                                              self.timerWheelResolution.getValue())
+        elif self._timerWheel:
+            now = self.globalClock.getFrameTime()
+            for task, wakeTime in self._timerWheel.clear():
+                self.__addTimer(task, wakeTime - now)
+            self._timerWheel = None
+            if self._timerTicker:
+                self.mgr.remove(self._timerTicker)
 
     def __makeTaskList(self, taskCollection):
-        l = []
-        for i in range(taskCollection.getNumTasks()):
-            l.append(taskCollection.getTask(i))
-        return l
+        return list(taskCollection.getTasks())
+
+    def __getGlobPattern(self, taskPattern):
+        glob = self._globCache.get(taskPattern)
+        if glob is None:
+            if len(self._globCache) >= self.GlobCacheSize:
+                self._globCache.clear()
+            glob = GlobPattern(taskPattern)
+            self._globCache[taskPattern] = glob
+        return glob
+
+    def __findTasksMatching(self, taskPattern):
+        # The AsyncTaskManager keeps its tasks sorted by name, so both
+        # lookups below only visit the tasks that share the constant
+        # prefix of the pattern.  A pattern with no glob characters at
+        # all is just a name, and doesn't need to be matched per task.
+        glob = self.__getGlobPattern(taskPattern)
+        if not glob.hasGlobCharacters():
+            return self.mgr.findTasks(glob.getConstPrefix())
+        return self.mgr.findTasksMatching(glob)
 
     def doMethodLater(self, delayTime, funcOrTask, name, extraArgs = None,
                       sort = None, priority = None, taskChain = None,
-                      uponDeath = None, appendTask = False, owner = None):
+                      uponDeath = None, appendTask = False, owner = None,
+                      budget = None):
 
         """Adds a task to be performed at some time in the future.
         This is identical to add(), except that the specified
@@ -312,16 +509,70 @@ class TaskManager:
         if delayTime < 0:
             assert self.notify.warning('doMethodLater: added task: %s with negative delay: %s' % (name, delayTime))
 
-        task = self.__setupTask(funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath)
+        task = self.__setupTask(funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath, budget)
         task.setDelay(delayTime)
-        self.mgr.add(task)
+        if self._timerWheel and self.__canUseTimerWheel(task, delayTime):
+            self._timerWheel.insert(task, self.globalClock.getFrameTime() + delayTime)
+        else:
+            self.mgr.add(task)
         return task
 
     do_method_later = doMethodLater
 
+    def __canUseTimerWheel(self, task, delayTime):
+        # Very short delays won't gain anything from the wheel, and
+        # tasks that report their death elsewhere must really be in
+        # the task manager so task.remove() works on them.
+        if delayTime < self._timerWheel.resolution:
+            return False
+        if task.getDoneEvent():
+            return False
+        if isinstance(task, PythonTask) and task.getOwner() is not None:
+            return False
+        return True
+
+    def __addTimer(self, task, delayTime):
+        # Adds a task from the timer wheel to the task manager, to
+        # wake up after the indicated delay.  The task keeps its
+        # original delay, which is used again if it returns again.
+        origDelay = task.getDelay()
+        if delayTime > 0:
+            task.setDelay(delayTime)
+        else:
+            task.clearDelay()
+        self.mgr.add(task)
+        task.setDelay(origDelay)
+
+    def __killTimer(self, task):
+        # A task removed from the timer wheel never reached the task
+        # manager, so we call its uponDeath function ourselves.
+        if isinstance(task, PythonTask):
+            uponDeath = task.getUponDeath()
+            if uponDeath is not None:
+                uponDeath(task)
+
+    def __releaseTimers(self):
+        for task, wakeTime in self._timerWheel.advance(self.globalClock.getFrameTime()):
+            self.__addTimer(task, 0)
+
+        # The task manager doesn't tick the clock in a frame with no
+        # tasks to run, so the timers would never come due if they
+        # were all that was waiting.  Keep a task running while the
+        # wheel holds any.
+        if self._timerWheel.getNumTasks():
+            if self._timerTicker is None:
+                self._timerTicker = PythonTask(self.__timerTick, 'timerWheelTicker')
+            if not self._timerTicker.isAlive():
+                self.mgr.add(self._timerTicker)
+
+    def __timerTick(self, task):
+        if self._timerWheel and self._timerWheel.getNumTasks():
+            return cont
+        return done
+
     def add(self, funcOrTask, name = None, sort = None, extraArgs = None,
             priority = None, uponDeath = None, appendTask = False,
-            taskChain = None, owner = None):
+            taskChain = None, owner = None, budget = None):
 
         """
         Add a new task to the taskMgr.  The task will begin executing
@@ -371,16 +622,25 @@ class TaskManager:
         is called when the task terminates.  This is all the owner
         means.
 
+        budget - the amount of time, in seconds, that the task expects
+        to take each frame.  A task with a budget and a low priority
+        may be deferred to a later frame when the frame is over the
+        budget set by setFrameTimeBudget(); see
+        setBudgetDeferPriority().  It may also run only every few
+        frames when it
+        regularly takes longer than its own budget.  Its cost is
+        reported by getTaskBudgetStats().
+
         The return value of add() is the new Task object that has been
         added, or the original Task object that was passed in.
 
         """
 
-        task = self.__setupTask(funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath)
+        task = self.__setupTask(funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath, budget)
         self.mgr.add(task)
         return task
 
-    def __setupTask(self, funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath):
+    def __setupTask(self, funcOrTask, name, priority, sort, extraArgs, taskChain, appendTask, owner, uponDeath, budget = None):
         if isinstance(funcOrTask, AsyncTask):
             task = funcOrTask
         elif hasattr(funcOrTask, '__call__'):
@@ -422,6 +682,9 @@ class TaskManager:
         if uponDeath is not None:
             task.setUponDeath(uponDeath)
 
+        if budget is not None:
+            self.setTaskBudget(task, budget)
+
         return task
 
     def remove(self, taskOrName):
@@ -434,14 +697,26 @@ class TaskManager:
         number of tasks removed. """
 
         if isinstance(taskOrName, AsyncTask):
+            if self._timerWheel and self._timerWheel.cancel(taskOrName):
+                self.__killTimer(taskOrName)
+                return True
             return self.mgr.remove(taskOrName)
         elif isinstance(taskOrName, list):
             for task in taskOrName:
                 self.remove(task)
         else:
             tasks = self.mgr.findTasks(taskOrName)
+            if self._timerWheel:
+                return self.__cancelTimers(self._timerWheel.getTasksNamed(taskOrName)) + \
+                       self.mgr.remove(tasks)
             return self.mgr.remove(tasks)
 
+    def __cancelTimers(self, tasks):
+        self._timerWheel.cancelTasks(tasks)
+        for task in tasks:
+            self.__killTimer(task)
+        return len(tasks)
+
     def removeTasksMatching(self, taskPattern):
         """Removes all tasks whose names match the pattern, which can
         include standard shell globbing characters like *, ?, and [].
@@ -449,8 +724,14 @@ class TaskManager:
 
         Returns the number of tasks removed.
         """
-        tasks = self.mgr.findTasksMatching(GlobPattern(taskPattern))
-        return self.mgr.remove(tasks)
+        numRemoved = 0
+        if self._timerWheel:
+            numRemoved = self.__cancelTimers(self._timerWheel.getTasksMatching(
+                self.__getGlobPattern(taskPattern)))
+        tasks = self.__findTasksMatching(taskPattern)
+        if tasks.getNumTasks() == 0:
+            return numRemoved
+        return numRemoved + self.mgr.remove(tasks)
 
     def step(self):
         """Invokes the task manager for one frame, and then returns.
@@ -468,6 +749,12 @@ class TaskManager:
 
         startFrameTime = self.globalClock.getRealTime()
 
+        if self._timerWheel:
+            self.__releaseTimers()
+
+        if self._budgetScheduler:
+            self._budgetScheduler.beginFrame(startFrameTime)
+
         self.mgr.poll()
 
         # This is the spot for an internal yield function
@@ -569,7 +856,15 @@ class TaskManager:
         if not isinstance(task, PythonTask):
             return 0
 
-        method = task.getFunction()
+        # A task with a budget runs the budget scheduler's function,
+        # which calls the task's own.
+        taskBudget = None
+        if self._budgetScheduler:
+            taskBudget = self._budgetScheduler.getTaskBudget(task)
+        if taskBudget is not None:
+            method = taskBudget.func
+        else:
+            method = task.getFunction()
         if (type(method) == types.MethodType):
             function = method.__func__
         else:
@@ -578,7 +873,10 @@ class TaskManager:
             newMethod = types.MethodType(newFunction,
                                          method.__self__,
                                          method.__self__.__class__)
-            task.setFunction(newMethod)
+            if taskBudget is not None:
+                taskBudget.func = newMethod
+            else:
+                task.setFunction(newMethod)
             # Found a match
             return 1
         return 0
@@ -1138,6 +1436,71 @@ class TaskManager:
             # nameDict etc. isn't cleared out right away with task.remove()
             tm._checkMemLeaks()
 
+            # doLaters held in the timer wheel
+            l = []
+            def _testTimerWheel(arg, l=l):
+                l.append(arg)
+            tm.setTimerWheelEnabled(True)
+            tm.doMethodLater(1., _testTimerWheel, 'testTimerWheel1', extraArgs=[1])
+            tm.doMethodLater(1., _testTimerWheel, 'testTimerWheel2', extraArgs=[2])
+            tm.doMethodLater(.05, _testTimerWheel, 'testTimerWheel3', extraArgs=[3])
+            assert len(tm.getTimerWheelDoLaters()) == 3
+            assert len(tm.getDoLaters()) == 3
+            assert tm.hasTaskNamed('testTimerWheel1')
+            assert tm.remove('testTimerWheel1') == 1
+            assert not tm.hasTaskNamed('testTimerWheel1')
+            assert len(tm.getTasksMatching('testTimerWheel*')) == 2
+            # The wheel's timers must come due even when nothing else
+            # is in the task manager.
+            for i in range(10000):
+                if len(tm.getDoLaters()) <= 1:
+                    break
+                tm.step()
+            assert l == [3]
+            assert tm.removeTasksMatching('testTimerWheel?') == 1
+            assert len(tm.getDoLaters()) == 0
+            assert tm.getTimerWheelStats()['cancelled'] == 2
+            tm.setTimerWheelEnabled(False)
+            _testTimerWheel = None
+            tm._checkMemLeaks()
+
+            # task budget
+            l = []
+            def _testBudget(arg, task, l=l):
+                l.append(arg)
+                return task.cont
+            t = tm.add(_testBudget, 'testBudget', extraArgs=[6], appendTask=True, budget=1.)
+            tm.step()
+            tm.step()
+            assert l == [6, 6]
+            stats = tm.getTaskBudgetStats()
+            assert len(stats) == 1
+            assert stats[0]['name'] == 'testBudget'
+            assert stats[0]['numRuns'] == 2
+            tm.setTaskBudget(t, None)
+            tm.step()
+            assert l == [6, 6, 6]
+            tm.remove(t)
+            del t
+            # only low-priority tasks are deferred for the frame budget
+            del l[:]
+            tm.setFrameTimeBudget(0.)
+            t1 = tm.add(_testBudget, 'testBudget1', extraArgs=[1], appendTask=True, budget=1.)
+            t2 = tm.add(_testBudget, 'testBudget2', extraArgs=[2], appendTask=True, budget=1.,
+                        sort=0, priority=-1)
+            tm.step()
+            tm.step()
+            tm.step()
+            assert l.count(1) == 3
+            assert l.count(2) == 1
+            tm.setFrameTimeBudget(-1)
+            tm.remove(t1)
+            tm.remove(t2)
+            del t1
+            del t2
+            _testBudget = None
+            tm._checkMemLeaks()
+
             # getTasksNamed
             def _testGetTasksNamed(task):
                 return task.cont
@@ -1174,6 +1537,13 @@ class TaskManager:
             tm.removeTasksMatching('testRemoveTasksMatching?a')
             assert len(tm.getTasksNamed('testRemoveTasksMatching1a')) == 0
             assert len(tm.getTasksNamed('testRemoveTasksMatching2a')) == 0
+            tm.add(_testRemoveTasksMatching, 'testRemoveTasksMatching*')
+            tm.add(_testRemoveTasksMatching, 'testRemoveTasksMatching3')
+            assert len(tm.getTasksMatching('testRemoveTasksMatching\\*')) == 1
+            assert tm.removeTasksMatching('testRemoveTasksMatching\\*') == 1
+            assert tm.removeTasksMatching('testRemoveTasksMatching\\*') == 0
+            assert len(tm.getTasksNamed('testRemoveTasksMatching3')) == 1
+            tm.remove('testRemoveTasksMatching3')
             _testRemoveTasksMatching = None
             tm._checkMemLeaks()
 
@@ -0,0 +1,94 @@
+"""Contains simple timing benchmarks for the TaskManager.  Run this
+module directly to print the results, eg.:
+
+    python -m direct.task.TaskBenchmark
+"""
+
+__all__ = ['benchmarkTasksMatching', 'benchmarkDoLaters']
+
+from direct.task import Task
+from panda3d.core import ClockObject
+import time
+
+
+def _makeTaskManager():
+    tm = Task.TaskManager()
+    tm.setClock(ClockObject())
+    tm.setupTaskChain("default", tickClock = True)
+    return tm
+
+def _idleTask(task):
+    return task.cont
+
+def benchmarkTasksMatching(numTasks = 100000, numRemovals = 10000,
+                           numFrames = 5):
+    """Adds numTasks named tasks, in the style of
+    DistributedObject.taskName(), and then each frame removes
+    numRemovals of them with removeTasksMatching() before adding them
+    back again.  Returns the average number of seconds spent per
+    frame in the pattern removals. """
+
+    tm = _makeTaskManager()
+    names = ['%s-benchmarkTask' % (i) for i in range(numTasks)]
+    for name in names:
+        tm.add(_idleTask, name)
+
+    total = 0.0
+    for frame in range(numFrames):
+        start = frame * numRemovals
+        patterns = ['%s-*' % (i % numTasks) for i in range(start, start + numRemovals)]
+
+        t0 = time.time()
+        for pattern in patterns:
+            tm.removeTasksMatching(pattern)
+        total += time.time() - t0
+
+        for i in range(start, start + numRemovals):
+            tm.add(_idleTask, names[i % numTasks])
+        tm.step()
+
+    tm.removeTasksMatching('*-benchmarkTask')
+    tm.destroy()
+    return total / numFrames
+
+def _idleDoLater():
+    pass
+
+def benchmarkDoLaters(numTimers = 200000, numCancels = 180000,
+                      useTimerWheel = False):
+    """Schedules numTimers doMethodLater() timeouts spread over the
+    next minute, then cancels numCancels of them by task object, as
+    happens to most timeouts.  Returns the pair (scheduleTime,
+    cancelTime), in seconds. """
+
+    tm = _makeTaskManager()
+    tm.setTimerWheelEnabled(useTimerWheel)
+
+    t0 = time.time()
+    tasks = []
+    for i in range(numTimers):
+        tasks.append(tm.doMethodLater(1.0 + (i % 600) * 0.1, _idleDoLater,
+                                      'timeout-%s' % (i)))
+    scheduleTime = time.time() - t0
+
+    t0 = time.time()
+    for task in tasks[:numCancels]:
+        tm.remove(task)
+    cancelTime = time.time() - t0
+
+    tm.step()
+    tm.removeTasksMatching('timeout-*')
+    tm.destroy()
+    return scheduleTime, cancelTime
+
+if __name__ == '__main__':
+    numTasks = 100000
+    numRemovals = 10000
+    perFrame = benchmarkTasksMatching(numTasks, numRemovals)
+    print('removeTasksMatching: %.2f ms per frame for %s removals among %s tasks' % (
+        perFrame * 1000.0, numRemovals, numTasks))
+
+    for useTimerWheel in (False, True):
+        scheduleTime, cancelTime = benchmarkDoLaters(useTimerWheel = useTimerWheel)
+        print('doMethodLater (timer wheel %s): %.1f ms to schedule, %.1f ms to cancel' % (
+            useTimerWheel, scheduleTime * 1000.0, cancelTime * 1000.0))
@@ -0,0 +1,182 @@
+"""This module defines the FrameBudgetScheduler, which the TaskManager
+uses to track the cost of tasks that declare a per-frame time budget,
+and to defer or time-slice them when the frame runs long.  See
+TaskManager.setFrameTimeBudget(). """
+
+__all__ = ['TaskBudget', 'FrameBudgetScheduler']
+
+from direct.directnotify.DirectNotifyGlobal import directNotify
+import math
+
+
+class TaskBudget:
+    """ Holds the declared budget of one task, the function it really
+    runs, and the rolling statistics of its cost. """
+
+    # The weight given to the newest sample in the rolling average.
+    AverageWeight = 0.1
+
+    def __init__(self, name, budget, func, args, appendTask):
+        self.name = name
+        self.budget = budget
+        self.func = func
+        self.args = args
+        self.appendTask = appendTask
+
+        self.avgCost = 0.
+        self.maxCost = 0.
+        self.lastCost = 0.
+        self.totalCost = 0.
+        self.numRuns = 0
+        self.numDeferred = 0
+        self.numSliced = 0
+
+        # The number of frames in a row that the task has been skipped.
+        self.skippedFrames = 0
+
+    def addSample(self, cost):
+        if self.numRuns == 0:
+            self.avgCost = cost
+        else:
+            self.avgCost += (cost - self.avgCost) * self.AverageWeight
+        self.lastCost = cost
+        self.totalCost += cost
+        if cost > self.maxCost:
+            self.maxCost = cost
+        self.numRuns += 1
+
+    def getStats(self):
+        return {
+            'name': self.name,
+            'budget': self.budget,
+            'avgCost': self.avgCost,
+            'maxCost': self.maxCost,
+            'lastCost': self.lastCost,
+            'totalCost': self.totalCost,
+            'numRuns': self.numRuns,
+            'numDeferred': self.numDeferred,
+            'numSliced': self.numSliced,
+            }
+
+
+class FrameBudgetScheduler:
+    """ Runs the tasks that have declared a budget on their behalf.
+    Each time one of these tasks comes up, the scheduler decides
+    whether to run it this frame:
+
+    - If the task's rolling average cost exceeds its own budget, it is
+      time-sliced: it runs only once every avgCost / budget frames.
+
+    - If a frame budget is set, and running the task now would likely
+      take the frame past it, the task is deferred to the next frame,
+      but only if its priority is below deferPriority.  Tasks run in
+      sort order, so of those, tasks with a higher sort are the first
+      to be deferred.
+
+    No task is skipped more than maxDeferFrames frames in a row.
+    Tasks without a budget are never deferred, and run as usual. """
+
+    notify = directNotify.newCategory("FrameBudgetScheduler")
+
+    def __init__(self, taskMgr, frameBudget = -1, maxDeferFrames = 10,
+                 deferPriority = 0):
+        self.taskMgr = taskMgr
+        self.clock = taskMgr.globalClock
+        self.frameBudget = frameBudget
+        self.maxDeferFrames = maxDeferFrames
+        self.deferPriority = deferPriority
+        self.frameStartTime = self.clock.getRealTime()
+
+        # taskId -> (task, TaskBudget).  Entries for tasks that have
+        # died are purged as the table grows.
+        self.__budgets = {}
+        self.__purgeSize = 64
+
+    def beginFrame(self, frameStartTime):
+        self.frameStartTime = frameStartTime
+
+    def getFrameTime(self):
+        """Returns the time that has elapsed so far in this frame. """
+        return self.clock.getRealTime() - self.frameStartTime
+
+    def addTask(self, task, budget):
+        """Declares the per-frame budget, in seconds, of the indicated
+        PythonTask, which must already have its function and
+        arguments.  The task's function is replaced with the
+        scheduler's own, which calls the original. """
+        entry = self.__budgets.get(task.id)
+        if entry is not None:
+            entry[1].budget = budget
+            return entry[1]
+
+        func = task.getFunction()
+        args = list(task.getArgs())
+        appendTask = False
+        if args and args[-1] == task:
+            appendTask = True
+            args = args[:-1]
+
+        taskBudget = TaskBudget(task.getName(), budget, func, args, appendTask)
+        task.setFunction(self._runTask)
+        task.setArgs([taskBudget], True)
+
+        if len(self.__budgets) >= self.__purgeSize:
+            self.__purge()
+        self.__budgets[task.id] = (task, taskBudget)
+        return taskBudget
+
+    def removeTask(self, task):
+        """Restores the task's original function, so it is no longer
+        budgeted. """
+        entry = self.__budgets.pop(task.id, None)
+        if entry is None:
+            return
+        taskBudget = entry[1]
+        task.setFunction(taskBudget.func)
+        task.setArgs(taskBudget.args, taskBudget.appendTask)
+
+    def getTaskBudget(self, task):
+        entry = self.__budgets.get(task.id)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def getStats(self):
+        """Returns a list of stats dictionaries, one for each live
+        budgeted task, most expensive first. """
+        self.__purge()
+        stats = [taskBudget.getStats() for task, taskBudget in self.__budgets.values()]
+        stats.sort(key = lambda s: s['avgCost'], reverse = True)
+        return stats
+
+    def _runTask(self, taskBudget, task):
+        now = self.clock.getRealTime()
+        if taskBudget.skippedFrames < self.maxDeferFrames:
+            if taskBudget.budget > 0 and taskBudget.avgCost > taskBudget.budget:
+                # The task is over its own budget; run it only every
+                # few frames.
+                if taskBudget.skippedFrames + 1 < math.ceil(taskBudget.avgCost / taskBudget.budget):
+                    taskBudget.skippedFrames += 1
+                    taskBudget.numSliced += 1
+                    return task.cont
+
+            if self.frameBudget >= 0 and taskBudget.numRuns > 0 and \
+               task.getPriority() < self.deferPriority and \
+               (now - self.frameStartTime) + taskBudget.avgCost > self.frameBudget:
+                taskBudget.skippedFrames += 1
+                taskBudget.numDeferred += 1
+                return task.cont
+
+        taskBudget.skippedFrames = 0
+        if taskBudget.appendTask:
+            ret = taskBudget.func(*(taskBudget.args + [task]))
+        else:
+            ret = taskBudget.func(*taskBudget.args)
+        taskBudget.addSample(self.clock.getRealTime() - now)
+        return ret
+
+    def __purge(self):
+        for taskId, (task, taskBudget) in list(self.__budgets.items()):
+            if not task.isAlive() and not self.taskMgr.hasTimerWheelDoLater(task):
+                del self.__budgets[taskId]
+        self.__purgeSize = max(64, len(self.__budgets) * 2)
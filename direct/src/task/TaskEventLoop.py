@@ -0,0 +1,285 @@
+"""This module bridges the asyncio event loop and the TaskManager, so
+that coroutine-based services (admin servers, metrics exporters,
+database drivers) can run in the same thread as the frame tasks.
+
+The loop may be driven either way around.  By default, it is driven
+by a task on the TaskManager: each frame, it runs the asyncio
+callbacks that are ready and polls its sockets without blocking.  Call
+installEventLoop() once at startup, eg.:
+
+    from direct.task.TaskEventLoop import installEventLoop
+    loop = installEventLoop(taskMgr)
+    asyncio.ensure_future(myService())
+    base.run()
+
+    async def myService():
+        task = taskMgr.doMethodLater(2.0, func, 'myTimer')
+        await loop.waitForTask(task)
+        args = await loop.waitForEvent('window-event')
+
+Or the loop may drive the TaskManager instead, stepping it from a
+callback, for an application whose main loop is asyncio's:
+
+    loop = installEventLoop(taskMgr, attach = False)
+    asyncio.ensure_future(myService())
+    loop.runTaskManager()
+
+Either way, coroutines can wait on Panda tasks and messenger events.
+
+This module requires async and await, which were introduced in Python
+3.5. """
+
+__all__ = ['TaskManagerEventLoop', 'TaskManagerEventLoopPolicy',
+           'installEventLoop']
+
+from direct.directnotify.DirectNotifyGlobal import directNotify
+from direct.showbase.DirectObject import DirectObject
+from panda3d.core import PythonTask
+import asyncio
+
+
+class _EventWaiter(DirectObject):
+    # Accepts a single messenger event on behalf of a future.
+
+    def __init__(self, event, future):
+        self.event = event
+        self.future = future
+        self.acceptOnce(event, self.__handleEvent)
+        future.add_done_callback(self.__handleDone)
+
+    def __handleEvent(self, *args):
+        if not self.future.done():
+            self.future.set_result(list(args))
+
+    def __handleDone(self, future):
+        # If the future was cancelled, stop listening.
+        self.ignore(self.event)
+
+
+class TaskManagerEventLoop(asyncio.SelectorEventLoop):
+    """ An asyncio event loop that runs one iteration per frame, from
+    a task on the indicated TaskManager, rather than blocking in
+    run_forever().  It is still an ordinary selector event loop, so
+    run_until_complete() may also be used, eg. at shutdown. """
+
+    notify = directNotify.newCategory("TaskManagerEventLoop")
+
+    def __init__(self, taskMgr, selector = None):
+        asyncio.SelectorEventLoop.__init__(self, selector)
+        self.taskMgr = taskMgr
+        self.taskName = 'asyncioEventLoop-%s' % (id(self))
+        self.__task = None
+
+        # The callback handle of the next step of the TaskManager, and
+        # the exception that stopped it, when the loop is driving the
+        # TaskManager.  See runTaskManager().
+        self.__stepHandle = None
+        self.__stepError = None
+
+    def attach(self, sort = 0, taskChain = None):
+        """Starts running the loop from a task on the TaskManager,
+        once per frame. """
+        if self.__stepHandle is not None:
+            self.notify.error('attach: the loop is running the TaskManager')
+        if self.__task is None:
+            self.__task = self.taskMgr.add(self.__loopTask, self.taskName,
+                                           sort = sort, taskChain = taskChain)
+
+    def detach(self):
+        """Stops running the loop from the TaskManager.  Any pending
+        callbacks stay pending until the loop is run again. """
+        if self.__task is not None:
+            self.taskMgr.remove(self.__task)
+            self.__task = None
+
+    def isAttached(self):
+        return self.__task is not None
+
+    def runTaskManager(self, frameTime = 0.0):
+        """Runs this loop, and steps the TaskManager from it, rather
+        than the other way around.  Each frame is started at least
+        frameTime seconds after the last one was, and in between the
+        loop runs its callbacks and waits for I/O as usual.  Like
+        taskMgr.run(), this does not return until taskMgr.stop() is
+        called or an exception is raised.  The loop must not be
+        attached to the TaskManager. """
+        if self.__task is not None:
+            self.notify.error('runTaskManager: the loop is attached to the TaskManager')
+
+        self.taskMgr.running = True
+        self.__stepError = None
+        self.__stepHandle = self.call_soon(self.__stepTaskManager, frameTime)
+        try:
+            self.run_forever()
+        finally:
+            if self.__stepHandle is not None:
+                self.__stepHandle.cancel()
+                self.__stepHandle = None
+            self.taskMgr.running = False
+
+        error = self.__stepError
+        self.__stepError = None
+        if error is not None:
+            raise error
+
+    def runOnce(self):
+        """Runs the callbacks that are ready and polls for I/O, without
+        blocking, and then returns. """
+        # Scheduling stop() first means the loop runs exactly one
+        # iteration, with a zero select timeout since a callback is
+        # already ready.
+        self.call_soon(self.stop)
+        self.run_forever()
+
+    def close(self):
+        self.detach()
+        asyncio.SelectorEventLoop.close(self)
+
+    def __stepTaskManager(self, frameTime):
+        self.__stepHandle = None
+        startTime = self.time()
+        try:
+            self.taskMgr.step()
+        except Exception as e:
+            # Hand the exception to runTaskManager(), rather than to
+            # the loop's exception handler, which would only log it.
+            self.__stepError = e
+            self.stop()
+            return
+
+        if not self.taskMgr.running:
+            self.stop()
+            return
+
+        delay = max(frameTime - (self.time() - startTime), 0)
+        self.__stepHandle = self.call_later(delay, self.__stepTaskManager, frameTime)
+
+    def __loopTask(self, task):
+        if self.is_closed():
+            self.__task = None
+            return task.done
+        self.runOnce()
+        return task.cont
+
+    def waitForTask(self, task):
+        """Returns a future that is resolved, with the task as its
+        result, when the indicated task finishes or is removed.  The
+        task's uponDeath function, if any, is still called. """
+        if not isinstance(task, PythonTask):
+            self.notify.error('waitForTask: %s is not a PythonTask' % (task))
+
+        future = self.create_future()
+        if not task.isAlive() and not self.taskMgr.hasTimerWheelDoLater(task):
+            future.set_result(task)
+            return future
+
+        uponDeath = task.getUponDeath()
+        def _resolve(task, future = future):
+            if not future.done():
+                future.set_result(task)
+        def _uponDeath(task, uponDeath = uponDeath):
+            if uponDeath is not None:
+                uponDeath(task)
+            # The task may have been running on a threaded task chain.
+            self.call_soon_threadsafe(_resolve, task)
+        task.setUponDeath(_uponDeath)
+        return future
+
+    def waitForEvent(self, event):
+        """Returns a future that is resolved when the indicated
+        messenger event is next sent.  The result is the list of
+        arguments that was sent with the event.  Cancelling the future
+        stops listening for the event. """
+        future = self.create_future()
+        _EventWaiter(event, future)
+        return future
+
+
+class TaskManagerEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """ An event loop policy that makes TaskManagerEventLoops, so that
+    asyncio.get_event_loop() in the main thread returns a loop driven
+    by the indicated TaskManager. """
+
+    def __init__(self, taskMgr):
+        asyncio.DefaultEventLoopPolicy.__init__(self)
+        self.taskMgr = taskMgr
+
+    def new_event_loop(self):
+        return TaskManagerEventLoop(self.taskMgr)
+
+
+def installEventLoop(taskMgr, sort = 0, attach = True):
+    """Installs a TaskManagerEventLoopPolicy for the indicated
+    TaskManager, and makes a new event loop the current thread's.  If
+    attach is true, the loop is run by the TaskManager; otherwise, call
+    its runTaskManager() to run the TaskManager from it instead.
+    Returns the event loop. """
+    asyncio.set_event_loop_policy(TaskManagerEventLoopPolicy(taskMgr))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if attach:
+        loop.attach(sort = sort)
+    return loop
+
+
+def _runTests():
+    if __debug__:
+        from direct.task.Task import TaskManager
+        from direct.showbase.MessengerGlobal import messenger
+        tm = TaskManager()
+
+        # the TaskManager drives the loop; a coroutine waits for an
+        # event, and for a task
+        loop = TaskManagerEventLoop(tm)
+        loop.attach()
+        l = []
+        def _testTask(task):
+            return task.done
+        async def _testWaiter(l=l):
+            l.append(await loop.waitForEvent('testTaskEventLoop'))
+            task = tm.add(_testTask, 'testTaskEventLoop')
+            l.append((await loop.waitForTask(task)).getName())
+        future = loop.create_task(_testWaiter())
+        tm.step()
+        assert l == []
+        messenger.send('testTaskEventLoop', [1, 2])
+        tm.step()
+        assert l == [[1, 2]]
+        tm.step()
+        tm.step()
+        assert l == [[1, 2], 'testTaskEventLoop']
+        assert future.done()
+        loop.close()
+        assert not tm.hasTaskNamed(loop.taskName)
+
+        # the loop drives the TaskManager, and the same coroutine
+        # still works
+        loop = TaskManagerEventLoop(tm)
+        del l[:]
+        future = loop.create_task(_testWaiter())
+        frames = []
+        def _testSend(task, frames=frames):
+            frames.append(None)
+            if len(frames) == 2:
+                messenger.send('testTaskEventLoop', [3])
+            if future.done():
+                tm.stop()
+                return task.done
+            return task.cont
+        tm.add(_testSend, 'testTaskEventLoopSend')
+        loop.runTaskManager()
+        assert l == [[3], 'testTaskEventLoop']
+        assert not tm.hasTaskNamed('testTaskEventLoopSend')
+
+        # an exception in a task stops the loop and is raised
+        def _testRaise(task):
+            raise ValueError('testTaskEventLoop')
+        tm.add(_testRaise, 'testTaskEventLoopRaise')
+        try:
+            loop.runTaskManager()
+        except ValueError:
+            pass
+        else:
+            assert False
+        tm.remove('testTaskEventLoopRaise')
+        loop.close()
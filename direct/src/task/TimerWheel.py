@@ -0,0 +1,257 @@
+"""This module defines TimerWheel, a hierarchical timing wheel used by
+the TaskManager to hold doMethodLater() tasks on the Python side until
+they are due.  See TaskManager.setTimerWheelEnabled(). """
+
+__all__ = ['TimerWheel']
+
+import bisect
+import math
+
+
+class TimerWheel:
+    """ Holds tasks in a hierarchy of circular slot arrays, indexed by
+    the tick on which each one expires.  A tick is resolution seconds
+    long.  Level 0 has one slot per tick, level 1 one slot per
+    numSlots ticks, and so on; timers that expire beyond the coarsest
+    level wait in an overflow slot.  As the wheel turns, the timers in
+    a coarse slot are cascaded down to finer levels.
+
+    Inserting and cancelling a timer are O(1), and advance() costs time
+    proportional to the number of ticks elapsed plus the number of
+    timers that come due or are cascaded, no matter how many timers
+    are pending.  Since most timeouts are cancelled well before they
+    fire, most timers are never cascaded at all.  A glob lookup sorts
+    the distinct task names if they have changed since the last
+    one. """
+
+    # The indices into each entry list.
+    EId = 0
+    ETask = 1
+    ETick = 2
+    EWakeTime = 3
+    EName = 4
+    ESlot = 5
+
+    def __init__(self, now, resolution, numSlots = 256, numLevels = 4):
+        self.resolution = resolution
+        self.numSlots = numSlots
+        self.numLevels = numLevels
+
+        self.__levels = [[{} for i in range(numSlots)] for j in range(numLevels)]
+        self.__overflow = {}
+        self.__tick = int(now / resolution)
+
+        # Maps task id to its entry, a list indexed by the E* values
+        # above.  Each entry is also stored in its slot dictionary,
+        # keyed by the same task id.
+        self.__entries = {}
+
+        # Maps each task name to a dictionary of taskId -> task.  The
+        # distinct names are sorted for the glob lookups only when one
+        # is made, and sorted again only if the names have changed
+        # since; most timers come and go without any glob lookup.
+        self.__tasksByName = {}
+        self.__sortedNames = None
+
+        self.numInserted = 0
+        self.numCancelled = 0
+        self.numExpired = 0
+        self.numCascaded = 0
+
+    def getNumTasks(self):
+        return len(self.__entries)
+
+    def getStats(self):
+        """Returns a dictionary of counters describing the wheel's
+        activity since it was created. """
+        return {
+            'pending': len(self.__entries),
+            'inserted': self.numInserted,
+            'cancelled': self.numCancelled,
+            'expired': self.numExpired,
+            'cascaded': self.numCascaded,
+            }
+
+    def insert(self, task, wakeTime):
+        """Schedules the task to come due at the indicated time, on the
+        same clock that is passed to advance(). """
+        taskId = task.getTaskId()
+        if taskId in self.__entries:
+            self.__remove(taskId)
+
+        expireTick = int(math.ceil(wakeTime / self.resolution))
+        name = task.getName()
+        entry = [taskId, task, expireTick, wakeTime, name, None]
+        self.__entries[taskId] = entry
+        self.__place(entry, self.__tick + 1)
+
+        tasks = self.__tasksByName.get(name)
+        if tasks is None:
+            tasks = {}
+            self.__tasksByName[name] = tasks
+            self.__sortedNames = None
+        tasks[taskId] = task
+        self.numInserted += 1
+
+    def cancel(self, task):
+        """Removes the task from the wheel.  Returns true if it was
+        pending, false otherwise. """
+        if self.__remove(task.getTaskId()) is None:
+            return False
+        self.numCancelled += 1
+        return True
+
+    def cancelTasks(self, tasks):
+        """Removes each of the tasks in the list from the wheel, and
+        returns the number that were pending. """
+        count = 0
+        for task in tasks:
+            if self.__remove(task.getTaskId()) is not None:
+                count += 1
+        self.numCancelled += count
+        return count
+
+    def clear(self):
+        """Removes all the pending tasks from the wheel, and returns
+        them as a list of (task, wakeTime) pairs. """
+        pending = [(entry[self.ETask], entry[self.EWakeTime])
+                   for entry in self.__entries.values()]
+        for slots in self.__levels:
+            for slot in slots:
+                slot.clear()
+        self.__overflow.clear()
+        self.__entries.clear()
+        self.__tasksByName.clear()
+        self.__sortedNames = None
+        return pending
+
+    def advance(self, now):
+        """Turns the wheel up to the indicated time, and returns the
+        list of (task, wakeTime) pairs that have come due, in the order
+        they expired.  The returned tasks are no longer in the
+        wheel. """
+        target = int(now / self.resolution)
+        if not self.__entries:
+            # Nothing to cascade or expire; just catch up.
+            if target > self.__tick:
+                self.__tick = target
+            return []
+
+        due = []
+        numSlots = self.numSlots
+        levels = self.__levels
+        while self.__tick < target:
+            self.__tick += 1
+            tick = self.__tick
+
+            granularity = numSlots
+            for level in range(1, self.numLevels + 1):
+                if tick % granularity != 0:
+                    break
+                if level < self.numLevels:
+                    self.__cascade(levels[level][(tick // granularity) % numSlots])
+                else:
+                    self.__cascade(self.__overflow)
+                granularity *= numSlots
+
+            slot = levels[0][tick % numSlots]
+            if slot:
+                for entry in slot.values():
+                    self.__forget(entry)
+                    due.append((entry[self.ETask], entry[self.EWakeTime]))
+                slot.clear()
+
+            if not self.__entries:
+                self.__tick = target
+
+        self.numExpired += len(due)
+        return due
+
+    def getWakeTime(self, task):
+        """Returns the time at which the task will come due, or None
+        if it is not in the wheel. """
+        entry = self.__entries.get(task.getTaskId())
+        if entry is None:
+            return None
+        return entry[self.EWakeTime]
+
+    def hasTask(self, task):
+        return task.getTaskId() in self.__entries
+
+    def hasTaskNamed(self, name):
+        return name in self.__tasksByName
+
+    def getTasks(self):
+        return [entry[self.ETask] for entry in self.__entries.values()]
+
+    def getTasksNamed(self, name):
+        tasks = self.__tasksByName.get(name)
+        if tasks is None:
+            return []
+        return list(tasks.values())
+
+    def getTasksMatching(self, glob):
+        """Returns the pending tasks whose names match the indicated
+        GlobPattern. """
+        if not glob.hasGlobCharacters():
+            return self.getTasksNamed(glob.getConstPrefix())
+
+        prefix = glob.getConstPrefix()
+        sortedNames = self.__sortedNames
+        if sortedNames is None:
+            sortedNames = sorted(self.__tasksByName)
+            self.__sortedNames = sortedNames
+        result = []
+        i = bisect.bisect_left(sortedNames, prefix)
+        while i < len(sortedNames) and sortedNames[i].startswith(prefix):
+            name = sortedNames[i]
+            if glob.matches(name):
+                result.extend(self.__tasksByName[name].values())
+            i += 1
+        return result
+
+    def __place(self, entry, minTick):
+        # Puts the entry in the finest slot that can hold it, relative
+        # to the current tick.
+        tick = max(entry[self.ETick], minTick)
+        delta = tick - self.__tick
+        numSlots = self.numSlots
+        granularity = 1
+        for slots in self.__levels:
+            if delta < granularity * numSlots:
+                slot = slots[(tick // granularity) % numSlots]
+                break
+            granularity *= numSlots
+        else:
+            slot = self.__overflow
+
+        slot[entry[self.EId]] = entry
+        entry[self.ESlot] = slot
+
+    def __cascade(self, slot):
+        if not slot:
+            return
+        entries = list(slot.values())
+        slot.clear()
+        for entry in entries:
+            self.__place(entry, self.__tick)
+        self.numCascaded += len(entries)
+
+    def __remove(self, taskId):
+        entry = self.__entries.get(taskId)
+        if entry is None:
+            return None
+        del entry[self.ESlot][taskId]
+        self.__forget(entry)
+        return entry
+
+    def __forget(self, entry):
+        # Removes the entry from the lookup tables, but not from its slot.
+        taskId = entry[self.EId]
+        del self.__entries[taskId]
+        name = entry[self.EName]
+        tasks = self.__tasksByName[name]
+        del tasks[taskId]
+        if not tasks:
+            del self.__tasksByName[name]
+            self.__sortedNames = None
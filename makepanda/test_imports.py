@@ -1,7 +1,7 @@
 # This script imports Panda3D modules just to make sure that there are no
 # missing imports.  It is useful for a quick and dirty test to make sure
 # that there are no obvious build issues.
-import os, importlib
+import os, sys, importlib
 
 # This will print out imports on the command line.
 import direct.showbase.VerboseImport
@@ -65,6 +65,7 @@ import direct.distributed.ClientRepository
 import direct.distributed.ClientRepositoryBase
 import direct.distributed.ClockDelta
 import direct.distributed.ConnectionRepository
+import direct.distributed.DistributedBenchmark
 import direct.distributed.DistributedCamera
 import direct.distributed.DistributedCameraAI
 import direct.distributed.DistributedCameraOV
@@ -86,6 +87,7 @@ import direct.distributed.DistributedSmoothNodeBase
 import direct.distributed.DoCollectionManager
 import direct.distributed.DoHierarchy
 import direct.distributed.DoInterestManager
+import direct.distributed.DoSpatialIndex
 import direct.distributed.GridChild
 import direct.distributed.GridParent
 import direct.distributed.InterestWatcher
@@ -99,6 +101,8 @@ import direct.distributed.PyDatagramIterator
 import direct.distributed.RelatedObjectMgr
 import direct.distributed.SampleObject
 import direct.distributed.ServerRepository
+import direct.distributed.ServerShard
+import direct.distributed.ShardedServerRepository
 import direct.distributed.StagedObject
 import direct.distributed.TimeManager
 import direct.distributed.TimeManagerAI
@@ -242,10 +246,17 @@ import direct.stdpy.threading2
 import direct.task.FrameProfiler
 import direct.task.MiniTask
 import direct.task.Task
+import direct.task.TaskBudget
+
+if sys.version_info >= (3, 5):
+    # This one needs async and await.
+    import direct.task.TaskEventLoop
+
 import direct.task.TaskManagerGlobal
 import direct.task.TaskProfiler
 import direct.task.TaskTester
 import direct.task.Timer
+import direct.task.TimerWheel
 
 try:
     import Pmw